@@ -0,0 +1,101 @@
+"""
+How many chunks a second make it through `interpreter.chat(message, stream=True, display=False)` in headless mode,
+and whether anything gets printed or rendered on the way.
+
+    python benchmarks/bench_chat_throughput.py [message chunks] [output lines]
+
+A fake LLM (so nothing goes over the network) streams a long message, then a Python code block
+that prints a lot of lines. Reports the throughput of both, and exits with an error if anything
+was written to stdout or stderr, or if the terminal UI's libraries (rich, yaspin) were imported.
+"""
+
+import contextlib
+import io
+import os
+import sys
+import time
+
+MESSAGE_CHUNKS = 20000
+OUTPUT_LINES = 100000
+
+# Libraries that only the terminal UI needs
+TERMINAL_MODULES = ["rich", "yaspin", "interpreter.utils.display_markdown_message"]
+
+
+def fake_llm(message_chunks, output_lines):
+    """
+    A coding LLM that answers with a long message and some code, then (once it sees the output) a short message.
+    """
+    def llm(messages):
+        if "output" in messages[-1]:
+            yield {"message": "Done."}
+            return
+
+        for i in range(message_chunks):
+            yield {"message": f"token{i} "}
+        yield {"language": "python"}
+        yield {"code": f"for i in range({output_lines}):\n    print(i)"}
+
+    return llm
+
+
+def main():
+    message_chunks = int(sys.argv[1]) if len(sys.argv) > 1 else MESSAGE_CHUNKS
+    output_lines = int(sys.argv[2]) if len(sys.argv) > 2 else OUTPUT_LINES
+
+    os.environ["OPEN_INTERPRETER_HEADLESS"] = "1"
+    os.environ["OPEN_INTERPRETER_NO_UPDATE_CHECK"] = "1"
+    import interpreter
+
+    interpreter.conversation_history = False
+    # (Local mode skips the procedures search, which syncs with the network in the background)
+    interpreter.local = True
+    interpreter._llm = fake_llm(message_chunks, output_lines)
+
+    chunks = 0
+    message_time = output_time = 0
+    output_chunks = output_seen = 0
+    printed = io.StringIO()
+
+    with contextlib.redirect_stdout(printed), contextlib.redirect_stderr(printed):
+        start = time.perf_counter()
+        phase_start = start
+        for chunk in interpreter.chat("Count for me", stream=True, display=False):
+            chunks += 1
+            if "language" in chunk and not message_time:
+                message_time = time.perf_counter() - start
+            if "output" in chunk:
+                if not output_chunks:
+                    # (Don't count the time it takes Python to start)
+                    phase_start = time.perf_counter()
+                output_chunks += 1
+                output_seen += len(chunk["output"].splitlines())
+            if "end_of_execution" in chunk:
+                output_time = time.perf_counter() - phase_start
+        total_time = time.perf_counter() - start
+
+    for code_interpreter in interpreter._code_interpreters.values():
+        code_interpreter.terminate()
+
+    print(f"message: {message_chunks} chunks in {message_time:.2f}s ({message_chunks / message_time:,.0f} chunks/sec)")
+    print(f"output: {output_seen} lines in {output_chunks} chunks in {output_time:.2f}s ({output_seen / output_time:,.0f} lines/sec)")
+    print(f"total: {chunks} chunks in {total_time:.2f}s ({chunks / total_time:,.0f} chunks/sec)")
+
+    failed = False
+    if printed.getvalue():
+        print("Printed in headless mode:\n" + printed.getvalue()[:2000])
+        failed = True
+    loaded = [name for name in TERMINAL_MODULES if name in sys.modules]
+    if loaded:
+        print("Imported in headless mode:", ", ".join(loaded))
+        failed = True
+    if output_seen < output_lines:
+        print(f"Only {output_seen} of {output_lines} output lines came through")
+        failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+How long `import interpreter` takes, and whether it pulls in anything it shouldn't.
+
+    python benchmarks/bench_import_time.py [budget in ms]
+
+Runs `python -X importtime -c "import interpreter"` in a fresh process a few times and
+exits with an error if the fastest run is over budget, or if the import loaded any of the
+heavy modules that library users calling `interpreter.chat(..., display=False)` never need.
+"""
+
+import os
+import subprocess
+import sys
+
+BUDGET_MS = 250
+RUNS = 5
+
+# These should only load once something actually needs them (the CLI, the terminal UI, local models, the LLM)
+LAZY_MODULES = [
+    "litellm",
+    "rich",
+    "inquirer",
+    "yaspin",
+    "huggingface_hub",
+    "pkg_resources",
+    "requests",
+    "tokentrim",
+    "interpreter.cli.cli",
+    "interpreter.terminal_interface.terminal_interface",
+]
+
+
+def import_time():
+    """
+    Imports interpreter in a fresh process. Returns (milliseconds, names of the modules it imported).
+    """
+    env = dict(os.environ, OPEN_INTERPRETER_NO_UPDATE_CHECK="1")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import interpreter"],
+        capture_output=True, text=True, env=env, check=True
+    )
+
+    total_us = 0
+    modules = set()
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        modules.add(name)
+        if name == "interpreter":
+            total_us = int(cumulative)
+
+    return total_us / 1000, modules
+
+
+def main():
+    budget_ms = float(sys.argv[1]) if len(sys.argv) > 1 else BUDGET_MS
+
+    runs = [import_time() for _ in range(RUNS)]
+    best_ms = min(ms for ms, _ in runs)
+    loaded = sorted(m for m in LAZY_MODULES if m in runs[0][1])
+
+    print(f"import interpreter: {best_ms:.0f}ms (best of {RUNS}, budget {budget_ms:.0f}ms)")
+    if loaded:
+        print("Imported eagerly, but should be lazy:", ", ".join(loaded))
+
+    if best_ms > budget_ms or loaded:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
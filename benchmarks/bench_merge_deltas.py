@@ -0,0 +1,56 @@
+"""
+Per-token cost of accumulating a streamed message, as the message grows.
+
+    python benchmarks/bench_merge_deltas.py
+
+merge_deltas copies the whole string on every token, so its cost grows with the message.
+DeltaAccumulator should stay flat.
+"""
+
+import time
+from interpreter.utils.merge_deltas import merge_deltas, DeltaAccumulator
+
+TOKEN = {"code": "x = 1 # "}  # ~8 characters, like a streamed token
+CHECKPOINTS = [10_000, 50_000, 100_000, 200_000]
+SAMPLE = 2_000  # tokens timed at each checkpoint
+
+
+def bench(add):
+    """
+    Streams tokens into a message (kept in a list, like interpreter.messages)
+    and returns the microseconds per token at each checkpoint.
+    """
+    messages = [{"role": "assistant"}]
+    add_token = add(messages)
+    results = []
+    length = 0
+
+    for checkpoint in CHECKPOINTS:
+        while length < checkpoint:
+            add_token(TOKEN)
+            length += len(TOKEN["code"])
+
+        start = time.perf_counter()
+        for _ in range(SAMPLE):
+            add_token(TOKEN)
+        results.append((time.perf_counter() - start) / SAMPLE * 1e6)
+        length += SAMPLE * len(TOKEN["code"])
+
+    return results
+
+
+def with_merge_deltas(messages):
+    def add_token(chunk):
+        messages[-1] = merge_deltas(messages[-1], chunk)
+    return add_token
+
+
+def with_accumulator(messages):
+    accumulator = DeltaAccumulator(messages[-1])
+    return accumulator.add
+
+
+if __name__ == "__main__":
+    print(f"{'message size':>14} {'merge_deltas':>16} {'DeltaAccumulator':>18}")
+    for checkpoint, old, new in zip(CHECKPOINTS, bench(with_merge_deltas), bench(with_accumulator)):
+        print(f"{checkpoint:>14,} {old:>13.2f} us {new:>15.2f} us")
@@ -0,0 +1,71 @@
+"""
+Time to trim a growing conversation to fit the context window, per LLM call, up to 500 messages.
+
+    python benchmarks/bench_trim.py
+
+tokentrim.trim tokenized the whole conversation on every call (and counted the messages it kept again for each one
+it added). trim_messages only tokenizes messages it hasn't seen. Its time per call grows with how much it keeps,
+which is more than tokentrim did, since old code and outputs are compacted before anything's dropped.
+(Both include convert_to_openai_messages, which the LLMs run on the whole conversation first)
+"""
+
+import time
+import tokentrim
+from interpreter.utils.convert_to_openai_messages import convert_to_openai_messages
+from interpreter.utils.trim_messages import trim_messages
+
+MODEL = "gpt-4"
+CHECKPOINTS = [100, 200, 300, 400, 500]
+SAMPLE = 5  # calls timed at each checkpoint
+
+# The budgets tokentrim gave gpt-4 and gpt-4-32k. (Most of a 500 message session doesn't fit either way)
+BUDGETS = {"gpt-4": int(8192 * 0.75), "gpt-4-32k": int(32768 * 0.75)}
+
+SYSTEM_MESSAGE = "You are Open Interpreter, a world-class programmer that can complete any goal by executing code. " * 20
+CODE = "\n".join(f"df_{line} = df.groupby('month')['total'].sum().rolling({line}).mean()" for line in range(12))
+OUTPUT = "\n".join(f"2023-{month:02}    {month * 1234.5:>12.2f}    {month * 17:>6}" for month in range(1, 13)) * 4
+
+
+def make_message(number):
+    # Like a session: the user asks for something, and the assistant runs some code
+    if number % 2 == 0:
+        return {"role": "user", "message": f"Now load data_{number}.csv, clean up its columns and plot the monthly totals."}
+    return {"role": "assistant", "message": "Let's do that.", "language": "python", "code": CODE + f"\n# step {number}", "output": OUTPUT + f"\nstep {number} done"}
+
+
+def with_tokentrim(messages, max_tokens):
+    return tokentrim.trim(convert_to_openai_messages(messages), system_message=SYSTEM_MESSAGE, max_tokens=max_tokens, model=MODEL)
+
+
+def with_trim_messages(messages, max_tokens):
+    return trim_messages(convert_to_openai_messages(messages), SYSTEM_MESSAGE, max_tokens, MODEL)
+
+
+def bench(trim, max_tokens):
+    """
+    Grows a conversation a message at a time, trimming it before each "LLM call",
+    and returns the milliseconds per call at each checkpoint.
+    """
+    messages = []
+    results = []
+    for checkpoint in CHECKPOINTS:
+        while len(messages) < checkpoint - SAMPLE:
+            messages.append(make_message(len(messages)))
+            trim(messages, max_tokens)
+
+        start = time.perf_counter()
+        for _ in range(SAMPLE):
+            messages.append(make_message(len(messages)))
+            trim(messages, max_tokens)
+        results.append((time.perf_counter() - start) / SAMPLE * 1e3)
+    return results
+
+
+if __name__ == "__main__":
+    for name, max_tokens in BUDGETS.items():
+        print(f"\n{name} ({max_tokens:,} tokens)")
+        print(f"{'messages':>10} {'tokentrim':>13} {'trim_messages':>15}")
+        old = bench(with_tokentrim, max_tokens)
+        new = bench(with_trim_messages, max_tokens)
+        for checkpoint, old_ms, new_ms in zip(CHECKPOINTS, old, new):
+            print(f"{checkpoint:>10} {old_ms:>10.2f} ms {new_ms:>12.2f} ms")
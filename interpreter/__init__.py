@@ -1,6 +1,10 @@
 from .core.core import Interpreter
 import sys
 
+# Parts of the package are imported lazily, after this module is swapped out below.
+# Importing their (empty) subpackages now keeps those imports working
+from . import batch, cli, llm, server, terminal_interface, utils
+
 # This is done so when users `import interpreter`,
 # they get an instance of interpreter:
 
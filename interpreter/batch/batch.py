@@ -0,0 +1,194 @@
+"""
+`interpreter batch tasks.jsonl --workers N` runs many tasks in parallel, and writes what happened to a JSONL file.
+
+Each line of tasks.jsonl is a task:
+
+    {"id": "csv-1", "message": "Clean up data.csv", "system_message": "..."}
+
+Only "message" is required. Any other key that's an Interpreter setting (system_message, model, temperature...)
+overrides the batch's settings for that task.
+
+Every task runs in its own Interpreter (with its own code interpreters), in a pool of worker processes.
+Each line of the output file is a task's result: its transcript, timings, token usage (see Interpreter.usage) and error (if it had one).
+Results are written as tasks finish, so they're in no particular order.
+"""
+
+import json
+import multiprocessing
+import multiprocessing.util
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Never copied from the interpreter that started the batch
+TASK_STATE = ["messages", "conversation_filename"]
+
+# Set up in each worker process by `start_worker`
+worker = {}
+
+
+def run_batch(interpreter, tasks_path, output_path=None, workers=4, max_llm_calls=None):
+    """
+    Runs the tasks in `tasks_path` with `interpreter`'s settings, `workers` at a time,
+    with at most `max_llm_calls` LLM calls in flight at once (across all workers).
+    """
+    tasks = read_tasks(tasks_path)
+    if output_path is None:
+        output_path = os.path.splitext(tasks_path)[0] + "_results.jsonl"
+
+    settings = {
+        name: value for name, value in vars(interpreter).items()
+        if not name.startswith("_") and name not in TASK_STATE
+    }
+
+    # Shared by every worker, so the limit holds across the whole batch
+    llm_calls = multiprocessing.Semaphore(max_llm_calls or workers)
+
+    print(f"Running {len(tasks)} tasks with {workers} workers. Results go to {output_path}")
+    start = time.monotonic()
+    failed = 0
+
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=start_worker, initargs=(settings, llm_calls))
+    try:
+        with open(output_path, "w") as output:
+            futures = [executor.submit(run_task, task) for task in tasks]
+            for done, future in enumerate(as_completed(futures), start=1):
+                result = future.result()
+                output.write(json.dumps(result, default=str) + "\n")
+                output.flush()
+
+                if result["error"]:
+                    failed += 1
+                status = "failed" if result["error"] else "done"
+                print(f"[{done}/{len(tasks)}] {result['id']} {status} in {result['timings']['total']:.1f}s")
+    except KeyboardInterrupt:
+        print("Stopping. Finished tasks are saved in", output_path)
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+
+    print(f"Finished {len(tasks)} tasks ({failed} failed) in {time.monotonic() - start:.1f}s")
+
+
+def read_tasks(tasks_path):
+    tasks = []
+    with open(tasks_path, "r") as file:
+        for number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            task = json.loads(line)
+            if not isinstance(task, dict) or not isinstance(task.get("message"), str):
+                raise ValueError(f'Line {number} of {tasks_path} should be a JSON object with a "message".')
+            task.setdefault("id", str(number))
+            tasks.append(task)
+    return tasks
+
+
+def start_worker(settings, llm_calls):
+    """
+    Runs once in each worker process.
+    """
+    # Nobody's watching the workers' terminals, and the batch already checked for updates
+    os.environ["OPEN_INTERPRETER_HEADLESS"] = "1"
+    os.environ["OPEN_INTERPRETER_NO_UPDATE_CHECK"] = "1"
+
+    worker["settings"] = settings
+    worker["llm_calls"] = llm_calls
+
+    # Every task in this worker takes its warm code interpreters from the same pool
+    worker["kernel_pool"] = None
+    if settings.get("kernel_pool_size"):
+        from ..code_interpreters.kernel_pool import KernelPool
+        worker["kernel_pool"] = KernelPool(size=settings["kernel_pool_size"], languages=settings["kernel_pool_languages"])
+        worker["kernel_pool"].fill()
+        # (Tasks share the pool, so it's stopped when the worker exits, not when a task resets its interpreter)
+        multiprocessing.util.Finalize(None, worker["kernel_pool"].terminate, exitpriority=10)
+
+
+def run_task(task):
+    """
+    Runs a task in a new Interpreter, and returns its result.
+    """
+    from ..core.core import Interpreter
+    from ..llm.setup_llm import setup_llm
+
+    result = {
+        "id": task["id"],
+        "message": task["message"],
+        "messages": [],
+        "notices": [],
+        "timings": {"total": 0, "first_chunk": None, "llm": 0, "llm_wait": 0, "code": 0},
+        "usage": {},
+        "error": None,
+    }
+    start = time.monotonic()
+
+    interpreter = Interpreter()
+    try:
+        for name, value in worker["settings"].items():
+            setattr(interpreter, name, value)
+        for name, value in task.items():
+            if name not in ("id", "message"):
+                if name.startswith("_") or name in TASK_STATE or not hasattr(interpreter, name):
+                    raise ValueError(f"Tasks can't set `{name}`.")
+                setattr(interpreter, name, value)
+
+        interpreter.headless = True
+        interpreter.conversation_history = False
+        interpreter._kernel_pool = worker["kernel_pool"]
+        interpreter._llm = measure_llm(setup_llm(interpreter), worker["llm_calls"], result)
+
+        code_start = None
+        for chunk in interpreter.chat(task["message"], display=False, stream=True):
+            if result["timings"]["first_chunk"] is None:
+                result["timings"]["first_chunk"] = time.monotonic() - start
+            if "notice" in chunk:
+                result["notices"].append(chunk["notice"])
+            if "executing" in chunk:
+                code_start = time.monotonic()
+            if "end_of_execution" in chunk and code_start is not None:
+                result["timings"]["code"] += time.monotonic() - code_start
+                code_start = None
+
+    except Exception:
+        result["error"] = traceback.format_exc()
+    finally:
+        result["messages"] = interpreter.messages
+        result["usage"] = interpreter.usage()
+        result["timings"]["total"] = time.monotonic() - start
+        interpreter.reset()
+
+    return result
+
+
+def measure_llm(llm, llm_calls, result):
+    """
+    Wraps an LLM so it waits its turn for `llm_calls`, and adds its timings to `result`.
+
+    The response is collected while it's our turn, and only yielded once the turn's over,
+    so neither the limit nor the "llm" timing covers however long we take with each chunk.
+    (Nobody's watching a batch, so there's nothing to stream to)
+    """
+    def measured_llm(messages):
+        chunks = []
+        error = None
+
+        wait_start = time.monotonic()
+        with llm_calls:
+            call_start = time.monotonic()
+            result["timings"]["llm_wait"] += call_start - wait_start
+            try:
+                for chunk in llm(messages):
+                    chunks.append(chunk)
+            except Exception as e:
+                # (Raised after the chunks we did get, like it would've been while streaming)
+                error = e
+            finally:
+                result["timings"]["llm"] += time.monotonic() - call_start
+
+        yield from chunks
+        if error:
+            raise error
+
+    return measured_llm
@@ -6,6 +6,8 @@ import pkg_resources
 import appdirs
 from ..utils.display_markdown_message import display_markdown_message
 from ..terminal_interface.conversation_navigator import conversation_navigator
+from ..server.server import serve
+from ..batch.batch import run_batch
 
 arguments = [
     {
@@ -80,6 +82,18 @@ arguments = [
         "help_text": "optionally enable safety mechanisms like code scanning; valid options are off, ask, and auto",
         "type": str,
         "choices": ["off", "ask", "auto"]
+    },
+    {
+        "name": "kernel_pool_size",
+        "nickname": "kp",
+        "help_text": "optionally keep this many code interpreters per language started in the background, so code runs without waiting for them to boot",
+        "type": int
+    },
+    {
+        "name": "trace_path",
+        "nickname": "tp",
+        "help_text": "optionally append timing spans for each turn (LLM, trimming, code execution, rendering...) to this JSON lines file",
+        "type": str
     }
 ]
 
@@ -98,10 +112,20 @@ def cli(interpreter):
             parser.add_argument(f'-{arg["nickname"]}', f'--{arg["name"]}', dest=arg["name"], help=arg["help_text"], type=arg["type"], choices=choices, default=default)
 
     # Add special arguments
+    parser.add_argument('command', nargs='?', choices=['batch'], help='`interpreter batch tasks.jsonl` runs every task in tasks.jsonl, in parallel (code runs without approval)')
+    parser.add_argument('tasks', nargs='?', help='the tasks file for `interpreter batch`, one JSON object with a "message" per line')
     parser.add_argument('--config', dest='config', action='store_true', help='open config.yaml file in text editor')
     parser.add_argument('--conversations', dest='conversations', action='store_true', help='list conversations to resume')
     parser.add_argument('-f', '--fast', dest='fast', action='store_true', help='(depracated) runs `interpreter --model gpt-3.5-turbo`')
     parser.add_argument('--version', dest='version', action='store_true', help="get Open Interpreter's version number")
+    parser.add_argument('--serve', dest='serve', action='store_true', help='host many independent sessions over HTTP (code runs without approval)')
+    parser.add_argument('--host', dest='host', type=str, default="127.0.0.1", help='address for --serve to listen on')
+    parser.add_argument('--port', dest='port', type=int, default=8000, help='port for --serve to listen on')
+    parser.add_argument('--idle_timeout', dest='idle_timeout', type=int, default=1800, help='seconds before --serve closes an idle session')
+    parser.add_argument('--max_processes', dest='max_processes', type=int, default=64, help='max code interpreter processes --serve keeps alive across all sessions')
+    parser.add_argument('--workers', dest='workers', type=int, default=4, help='how many tasks `interpreter batch` runs at once (each in its own process)')
+    parser.add_argument('--max_llm_calls', dest='max_llm_calls', type=int, default=None, help='max LLM calls `interpreter batch` makes at once (defaults to --workers)')
+    parser.add_argument('--output', dest='output', type=str, default=None, help='where `interpreter batch` writes its results (defaults to tasks_results.jsonl)')
 
     # TODO: Implement model explorer
     # parser.add_argument('--models', dest='models', action='store_true', help='list avaliable models')
@@ -159,6 +183,16 @@ def cli(interpreter):
         print(f"Open Interpreter {version}")
         return
     
+    if args.serve:
+        serve(interpreter, host=args.host, port=args.port, idle_timeout=args.idle_timeout, max_processes=args.max_processes)
+        return
+
+    if args.command == "batch":
+        if not args.tasks:
+            parser.error("`interpreter batch` needs a tasks file, like `interpreter batch tasks.jsonl`")
+        run_batch(interpreter, args.tasks, output_path=args.output, workers=args.workers, max_llm_calls=args.max_llm_calls)
+        return
+
     # Depracated --fast
     if args.fast:
         # This will cause the terminal_interface to walk the user through setting up a local LLM
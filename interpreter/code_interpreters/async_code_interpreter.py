@@ -0,0 +1,184 @@
+import asyncio
+import time
+import traceback
+from .subprocess_code_interpreter import SubprocessCodeInterpreter, END_OF_EXECUTION, add_to_batch, batchable, stream_state
+from ..utils.iterate_in_thread import iterate_in_thread
+
+class AsyncCodeInterpreter:
+    """
+    Runs code without blocking the event loop. `.run` is an async generator that yields
+    the same dicts as the regular code interpreters (active_line, output).
+
+    Takes a regular code interpreter, which tells us how to start the language
+    and how to mark up its code and output. Subprocess languages get their own
+    asyncio subprocess (no reader threads). Anything else runs in a worker thread.
+    """
+
+    def __init__(self, code_interpreter):
+        self.code_interpreter = code_interpreter
+        self.process = None
+        self.output_queue = None
+        self.reader = None
+
+        # Same as SubprocessCodeInterpreter's
+        self.batch_interval = 0.016
+        self.batch_size = 64 * 1024
+
+    def terminate(self):
+        if self.process and self.process.returncode is None:
+            self.process.terminate()
+        if self.reader:
+            self.reader.cancel()
+
+    async def start_process(self):
+        if self.process:
+            self.terminate()
+
+        self.process = await asyncio.create_subprocess_exec(*self.code_interpreter.start_cmd.split(),
+                                                            stdin=asyncio.subprocess.PIPE,
+                                                            stdout=asyncio.subprocess.PIPE,
+                                                            stderr=asyncio.subprocess.PIPE)
+
+        # Each process gets its own queue, so a dying process can't end the next one's execution
+        self.output_queue = asyncio.Queue()
+        self.reader = asyncio.create_task(self.pump_output(self.process, self.output_queue))
+
+    async def run(self, code):
+        if not isinstance(self.code_interpreter, SubprocessCodeInterpreter):
+            # e.g. HTML, which just writes a file and opens it
+            async for output in iterate_in_thread(self.code_interpreter.run(code)):
+                yield output
+            return
+
+        retry_count = 0
+        max_retries = 3
+
+        # Setup
+        try:
+            code = self.code_interpreter.preprocess_code(code)
+            if not self.process:
+                await self.start_process()
+        except:
+            yield {"output": traceback.format_exc()}
+            return
+
+        while retry_count <= max_retries:
+            # Throw away anything left over from an execution we stopped listening to
+            while not self.output_queue.empty():
+                self.output_queue.get_nowait()
+
+            try:
+                self.process.stdin.write((code + "\n").encode())
+                await self.process.stdin.drain()
+                break
+            except:
+                if retry_count != 0:
+                    yield {"output": traceback.format_exc()}
+                    yield {"output": f"Retrying... ({retry_count}/{max_retries})"}
+                    yield {"output": "Restarting process."}
+
+                await self.start_process()
+
+                retry_count += 1
+                if retry_count > max_retries:
+                    yield {"output": "Maximum retries reached. Could not execute code."}
+                    return
+
+        next_output = None
+        while True:
+            output = next_output if next_output is not None else await self.output_queue.get()
+            next_output = None
+            if output is END_OF_EXECUTION:
+                break
+            if self.batch_interval and batchable(output):
+                output, next_output = await self.collect_output_batch(output)
+            yield output
+
+    async def collect_output_batch(self, output):
+        """
+        Joins the output (and partial line and active line changes) that follows `output` within `batch_interval` seconds into one chunk.
+        Returns the chunk, and the item that ended the batch (or None).
+        """
+        batch = dict(output)
+        deadline = time.monotonic() + self.batch_interval
+
+        while len(batch.get("output", "")) < self.batch_size:
+            try:
+                item = self.output_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                # (Lines that are already queued are taken above, so we only wait here once the queue's caught up)
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.output_queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+
+            if not batchable(item):
+                return batch, item
+            add_to_batch(batch, item)
+
+        return batch, None
+
+    async def pump_output(self, process, output_queue):
+        """
+        Reads stdout and stderr as data arrives, passing it through the code interpreter's
+        decoding, postprocessing and marker detection (see SubprocessCodeInterpreter.pump_output).
+        """
+        code_interpreter = self.code_interpreter
+        streams = {}
+        states = []
+
+        def read(stream, state):
+            streams[asyncio.ensure_future(stream.read(65536))] = (stream, state)
+
+        def handle(finished):
+            ended = False
+            for task in finished:
+                stream, state = streams.pop(task)
+                data = task.result()
+                if not data:
+                    # EOF
+                    events = state["decoder"].close()
+                else:
+                    events = state["decoder"].feed(data)
+                    read(stream, state)
+                if code_interpreter.handle_output_events(events, state, output_queue):
+                    ended = True
+            return ended
+
+        for stream, is_error_stream in [(process.stdout, False), (process.stderr, True)]:
+            state = stream_state(is_error_stream)
+            states.append(state)
+            read(stream, state)
+
+        try:
+            while streams:
+                # Only wake up on a timeout if there's an unfinished line to show
+                waiting = any(state["decoder"].waiting() for state in states)
+                timeout = code_interpreter.partial_line_timeout if waiting else None
+                finished, _ = await asyncio.wait(streams, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not finished:
+                    for state in states:
+                        code_interpreter.handle_output_events(state["decoder"].idle(), state, output_queue)
+                    continue
+
+                if handle(finished):
+                    # Anything written to stderr before the marker is already in the pipe.
+                    # Keep reading until the pipes go quiet, then signal the end
+                    while streams:
+                        finished, _ = await asyncio.wait(streams, timeout=0.005)
+                        if not finished:
+                            break
+                        handle(finished)
+                    for state in states:
+                        code_interpreter.handle_output_events(state["decoder"].finish_line(), state, output_queue)
+                    output_queue.put_nowait(END_OF_EXECUTION)
+        finally:
+            for task in streams:
+                task.cancel()
+
+        # The process exited. Make sure nobody waits on it forever
+        output_queue.put_nowait(END_OF_EXECUTION)
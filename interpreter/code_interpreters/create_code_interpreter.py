@@ -1,4 +1,5 @@
 from .language_map import language_map
+from .async_code_interpreter import AsyncCodeInterpreter
 
 def create_code_interpreter(language):
     # Case in-sensitive
@@ -9,3 +10,6 @@ def create_code_interpreter(language):
         return CodeInterpreter()
     except KeyError:
         raise ValueError(f"Unknown or unsupported language: {language}")
+
+def create_async_code_interpreter(language):
+    return AsyncCodeInterpreter(create_code_interpreter(language))
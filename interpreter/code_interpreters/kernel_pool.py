@@ -0,0 +1,172 @@
+import asyncio
+import threading
+from .create_code_interpreter import create_code_interpreter, create_async_code_interpreter
+from .subprocess_code_interpreter import SubprocessCodeInterpreter
+
+class KernelPool:
+    """
+    Keeps `size` started, ready-to-run code interpreters per language, so the first
+    block of code in a language doesn't wait for `python -i`, `node -i` or `R` to boot.
+
+    Taking a code interpreter out of the pool starts a replacement in the background.
+    Warm code interpreters are handed out once and never shared.
+    `.terminate()` stops the ones that are still waiting (and any that finish starting afterwards).
+    """
+
+    def __init__(self, size=1, languages=("python", "shell")):
+        self.size = size
+        self.languages = [language.lower() for language in languages]
+        self.lock = threading.Lock()
+        self.closed = False
+
+        # language -> warm code interpreters, and how many are on their way
+        self.ready = {language: [] for language in self.languages}
+        self.starting = {language: 0 for language in self.languages}
+        self.async_ready = {language: [] for language in self.languages}
+        self.async_starting = {language: 0 for language in self.languages}
+
+        # Keep references to background threads and tasks, so they aren't garbage collected (and can be waited for)
+        self.threads = set()
+        self.tasks = set()
+
+    def fill(self):
+        """
+        Starts warming up code interpreters for every pooled language, in background threads.
+        """
+        for language in self.languages:
+            self.refill(language)
+
+    def acquire(self, language):
+        """
+        Returns a started code interpreter for `language`, warm if we have one.
+        """
+        language = language.lower()
+        code_interpreter = None
+
+        with self.lock:
+            while self.ready.get(language):
+                candidate = self.ready[language].pop()
+                if candidate.process.poll() is None:
+                    code_interpreter = candidate
+                    break
+
+        self.refill(language)
+
+        if code_interpreter is None:
+            code_interpreter = create_code_interpreter(language)
+        return code_interpreter
+
+    def refill(self, language):
+        if language not in self.languages or self.closed:
+            return
+
+        with self.lock:
+            missing = self.size - len(self.ready[language]) - self.starting[language]
+            self.starting[language] += max(missing, 0)
+
+        for _ in range(missing):
+            thread = threading.Thread(target=self.start, args=(language,), daemon=True)
+            with self.lock:
+                self.threads.add(thread)
+            thread.start()
+
+    def start(self, language):
+        code_interpreter = None
+        try:
+            code_interpreter = create_code_interpreter(language)
+            if not isinstance(code_interpreter, SubprocessCodeInterpreter):
+                # Nothing to warm up (e.g. HTML)
+                code_interpreter = None
+            else:
+                # Running nothing returns once the process is up and answering
+                for _ in code_interpreter.run(""):
+                    pass
+        except:
+            code_interpreter = None
+        finally:
+            with self.lock:
+                self.threads.discard(threading.current_thread())
+                self.starting[language] -= 1
+                if code_interpreter and not self.closed:
+                    self.ready[language].append(code_interpreter)
+                    code_interpreter = None
+            # (The pool was terminated while this one was starting)
+            if code_interpreter:
+                code_interpreter.terminate()
+
+    def afill(self):
+        """
+        Like `fill`, but warms up async code interpreters. Call from inside the event loop.
+        """
+        for language in self.languages:
+            self.arefill(language)
+
+    async def aacquire(self, language):
+        """
+        Returns a started async code interpreter for `language`, warm if we have one.
+        """
+        language = language.lower()
+        code_interpreter = None
+
+        while self.async_ready.get(language):
+            candidate = self.async_ready[language].pop()
+            if candidate.process and candidate.process.returncode is None:
+                code_interpreter = candidate
+                break
+
+        self.arefill(language)
+
+        if code_interpreter is None:
+            code_interpreter = create_async_code_interpreter(language)
+        return code_interpreter
+
+    def arefill(self, language):
+        if language not in self.languages or self.closed:
+            return
+
+        missing = self.size - len(self.async_ready[language]) - self.async_starting[language]
+        for _ in range(missing):
+            self.async_starting[language] += 1
+            task = asyncio.create_task(self.astart(language))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def astart(self, language):
+        code_interpreter = None
+        try:
+            code_interpreter = create_async_code_interpreter(language)
+            if not isinstance(code_interpreter.code_interpreter, SubprocessCodeInterpreter):
+                code_interpreter = None
+            else:
+                async for _ in code_interpreter.run(""):
+                    pass
+        except:
+            # (Including being cancelled by `.terminate()`, maybe after its process started)
+            if code_interpreter:
+                code_interpreter.terminate()
+            code_interpreter = None
+        finally:
+            self.async_starting[language] -= 1
+            if code_interpreter and not self.closed:
+                self.async_ready[language].append(code_interpreter)
+            elif code_interpreter:
+                code_interpreter.terminate()
+
+    def terminate(self):
+        with self.lock:
+            self.closed = True
+            code_interpreters = [ci for ready in self.ready.values() for ci in ready]
+            code_interpreters += [ci for ready in self.async_ready.values() for ci in ready]
+            self.ready = {language: [] for language in self.languages}
+            self.async_ready = {language: [] for language in self.languages}
+            threads = list(self.threads)
+
+        for code_interpreter in code_interpreters:
+            code_interpreter.terminate()
+        for task in list(self.tasks):
+            task.cancel()
+
+        # Code interpreters still starting stop themselves once they're up. Wait for them,
+        # in case we're about to exit (and take their threads with us before they can)
+        for thread in threads:
+            thread.join(timeout=10)
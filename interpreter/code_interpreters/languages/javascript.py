@@ -17,10 +17,10 @@ class JavaScript(SubprocessCodeInterpreter):
         # So we clean it up:
         if "Welcome to Node.js" in line:
             return None
+        # Remove leading prompts (">" and "... ", which can end up in front of output that follows them)
+        line = re.sub(r'^\s*(>\s*|\.\.\.\s+)+', '', line)
         if line.strip() in ["undefined", 'Type ".help" for more information.']:
             return None
-        # Remove trailing ">"s
-        line = re.sub(r'^\s*(>\s*)+', '', line)
         return line
 
     def detect_active_line(self, line):
@@ -19,6 +19,10 @@ class Python(SubprocessCodeInterpreter):
             return None
         return line
 
+    def partial_line_postprocessor(self, line):
+        # Prompts go to stderr without a line break, so they end up in front of the unfinished line after them
+        return re.sub(r'^(\s*(>>>|\.\.\.)\s?)+', '', line)
+
     def detect_active_line(self, line):
         if "## active_line " in line:
             return int(line.split("## active_line ")[1].split(" ##")[0])
@@ -58,6 +58,12 @@ cat("## end_of_execution ##\\n");
 
         return line
 
+    def partial_line_postprocessor(self, line):
+        # Unfinished lines mustn't count against the echoed code we're skipping
+        if hasattr(self, "code_line_count") and self.code_line_count > 0:
+            return None
+        return self.line_postprocessor(line)
+
     def detect_active_line(self, line):
         if "## active_line " in line:
             return int(line.split("## active_line ")[1].split(" ##")[0])
@@ -0,0 +1,120 @@
+import codecs
+import re
+
+LINE_BREAKS = re.compile(r"(\r\n|\r|\n)")
+
+# Output that goes on this long without a line break is handed over as a line anyway, so it can't pile up
+MAX_LINE_CHARS = 64 * 1024
+
+class OutputDecoder:
+    """
+    Turns the raw bytes a process writes to a pipe into lines, roughly like a terminal would show them.
+
+    `.feed(data)` returns a list of events:
+        ("line", text)      a finished line (ending in "\\n")
+        ("partial", text)   what the unfinished line reads right now. Progress bars redraw their line
+                            after a "\\r", so each redraw is a new "partial" that replaces the one before it
+
+    Bytes are decoded as UTF-8 incrementally, so characters split across reads are fine,
+    and invalid bytes become "�" instead of an exception.
+
+    `.idle()` returns the unfinished line as a "partial", for when the pipe has gone quiet without finishing it.
+    `.finish_line()` hands over the unfinished line as a line, and `.close()` returns whatever is left at EOF.
+
+    If `marker` (a compiled regex) is given, a marker that shows up in the middle of a line becomes a line of its own,
+    and the text before it stays the unfinished line. (Markers printed after `print(..., end="")` land mid-line.)
+    A marker line after a "\\r" doesn't erase the redraw before it.
+    """
+
+    def __init__(self, marker=None):
+        self.marker = marker
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+        # The unfinished line since its last "\r", and its last complete redraw before that
+        self.segment = ""
+        self.frame = ""
+
+        # A "\r" at the end of a read might be the start of a "\r\n", so we wait for the next read to decide
+        self.held_carriage_return = False
+
+        # The last partial we returned, so we don't repeat ourselves
+        self.partial_sent = ""
+
+    def feed(self, data):
+        return self.process(self.decoder.decode(data))
+
+    def unfinished(self):
+        """
+        What the unfinished line reads right now.
+        """
+        return self.segment or self.frame
+
+    def waiting(self):
+        """
+        True if `.idle()` would have something to say.
+        """
+        return self.held_carriage_return or (self.segment or self.frame) != self.partial_sent
+
+    def idle(self):
+        events = self.process("", final=True)
+        current = self.segment or self.frame
+        if current and current != self.partial_sent:
+            events.append(self.partial(current))
+        return events
+
+    def finish_line(self):
+        events = self.process("", final=True)
+        current = self.segment or self.frame
+        if current:
+            events.append(("line", current))
+        self.segment = self.frame = self.partial_sent = ""
+        return events
+
+    def close(self):
+        # The process is gone, so hand over the unfinished line as it is
+        return self.process(self.decoder.decode(b"", final=True), final=True) + self.finish_line()
+
+    def process(self, text, final=False):
+        events = []
+
+        if self.held_carriage_return:
+            text = "\r" + text
+            self.held_carriage_return = False
+        if text.endswith("\r") and not final:
+            text = text[:-1]
+            self.held_carriage_return = True
+
+        for piece in LINE_BREAKS.split(text):
+            if piece == "\n" or piece == "\r\n":
+                line = self.segment or self.frame
+                match = self.marker.search(line, 1) if self.marker else None
+                if match:
+                    events.append(("line", line[match.start():] + "\n"))
+                    self.segment = line[:match.start()]
+                    self.frame = ""
+                elif self.frame and self.segment and self.marker and self.marker.match(self.segment):
+                    # A marker printed after a redraw (like the next step of a loop printing with end="\r")
+                    # isn't output, so the line still reads as its last redraw
+                    events.append(("line", self.segment + "\n"))
+                    self.segment = ""
+                else:
+                    events.append(("line", line + "\n"))
+                    self.segment = self.frame = self.partial_sent = ""
+            elif piece == "\r":
+                # The line is about to be redrawn. Show what it says now
+                if self.segment:
+                    self.frame = self.segment
+                    self.segment = ""
+                    if self.frame != self.partial_sent:
+                        events.append(self.partial(self.frame))
+            else:
+                self.segment += piece
+                if len(self.segment) >= MAX_LINE_CHARS:
+                    events.append(("line", self.segment))
+                    self.segment = self.frame = self.partial_sent = ""
+
+        return events
+
+    def partial(self, text):
+        self.partial_sent = text
+        return ("partial", text)
@@ -1,11 +1,20 @@
-
-
+import re
 import subprocess
 import threading
+import selectors
+import platform
 import queue
 import time
+import os
 import traceback
 from .base_code_interpreter import BaseCodeInterpreter
+from .output_decoder import OutputDecoder
+
+# Put on the output queue (after any trailing output) once a block of code has finished
+END_OF_EXECUTION = object()
+
+# The markers our languages' preprocess_code prints
+MARKER = re.compile(r"## (active_line \d+|end_of_execution) ##")
 
 class SubprocessCodeInterpreter(BaseCodeInterpreter):
     def __init__(self):
@@ -15,15 +24,23 @@ class SubprocessCodeInterpreter(BaseCodeInterpreter):
         self.output_queue = queue.Queue()
         self.done = threading.Event()
 
+        # Output lines arriving within `batch_interval` seconds of each other are yielded as one chunk
+        # (up to `batch_size` characters). Set `batch_interval` to 0 to yield every line on its own
+        self.batch_interval = 0.016
+        self.batch_size = 64 * 1024
+
+        # Unfinished lines (like progress bars) are shown once the output has been quiet this many seconds
+        self.partial_line_timeout = 0.05
+
     def detect_active_line(self, line):
         return None
-    
+
     def detect_end_of_execution(self, line):
         return None
-    
+
     def line_postprocessor(self, line):
         return line
-    
+
     def preprocess_code(self, code):
         """
         This needs to insert an end_of_execution marker of some kind,
@@ -32,7 +49,7 @@ class SubprocessCodeInterpreter(BaseCodeInterpreter):
         Optionally, add active line markers for detect_active_line.
         """
         return code
-    
+
     def terminate(self):
         self.process.terminate()
 
@@ -40,19 +57,27 @@ class SubprocessCodeInterpreter(BaseCodeInterpreter):
         if self.process:
             self.terminate()
 
+        # Pipes are binary. Output is read raw and decoded by an OutputDecoder per pipe
         self.process = subprocess.Popen(self.start_cmd.split(),
                                         stdin=subprocess.PIPE,
                                         stdout=subprocess.PIPE,
-                                        stderr=subprocess.PIPE,
-                                        text=True,
-                                        bufsize=0,
-                                        universal_newlines=True)
-        threading.Thread(target=self.handle_stream_output,
-                            args=(self.process.stdout, False),
-                            daemon=True).start()
-        threading.Thread(target=self.handle_stream_output,
-                            args=(self.process.stderr, True),
-                            daemon=True).start()
+                                        stderr=subprocess.PIPE)
+
+        # Each process gets its own queue, so a dying process can't end the next one's execution
+        self.output_queue = queue.Queue()
+
+        if platform.system() == 'Windows':
+            # select() only works on sockets on Windows, so we fall back to a blocking reader per pipe
+            threading.Thread(target=self.handle_stream_output,
+                                args=(self.process.stdout, False, self.output_queue),
+                                daemon=True).start()
+            threading.Thread(target=self.handle_stream_output,
+                                args=(self.process.stderr, True, self.output_queue),
+                                daemon=True).start()
+        else:
+            threading.Thread(target=self.pump_output,
+                                args=(self.process, self.output_queue),
+                                daemon=True).start()
 
     def run(self, code):
         retry_count = 0
@@ -66,7 +91,7 @@ class SubprocessCodeInterpreter(BaseCodeInterpreter):
         except:
             yield {"output": traceback.format_exc()}
             return
-            
+
 
         while retry_count <= max_retries:
             if self.debug_mode:
@@ -74,8 +99,12 @@ class SubprocessCodeInterpreter(BaseCodeInterpreter):
 
             self.done.clear()
 
+            # Throw away anything left over from an execution we stopped listening to
+            while not self.output_queue.empty():
+                self.output_queue.get_nowait()
+
             try:
-                self.process.stdin.write(code + "\n")
+                self.process.stdin.write((code + "\n").encode())
                 self.process.stdin.flush()
                 break
             except:
@@ -94,45 +123,241 @@ class SubprocessCodeInterpreter(BaseCodeInterpreter):
                     yield {"output": "Maximum retries reached. Could not execute code."}
                     return
 
+        # Block until the reader has something for us. No polling, no sleeping:
+        # the end of execution is itself an item on the queue, so it can't overtake trailing output
+        next_output = None
         while True:
-            if not self.output_queue.empty():
-                yield self.output_queue.get()
-            else:
-                time.sleep(0.1)
+            output = next_output if next_output is not None else self.output_queue.get()
+            next_output = None
+            if output is END_OF_EXECUTION:
+                break
+            if self.batch_interval and batchable(output):
+                output, next_output = self.collect_output_batch(output)
+            yield output
+
+    def collect_output_batch(self, output):
+        """
+        Joins the output (and partial line and active line changes) that follows `output` within `batch_interval` seconds into one chunk.
+        Returns the chunk, and the item that ended the batch (or None).
+        """
+        batch = dict(output)
+        deadline = time.monotonic() + self.batch_interval
+
+        while len(batch.get("output", "")) < self.batch_size:
             try:
-                output = self.output_queue.get(timeout=0.3)  # Waits for 0.3 seconds
-                yield output
+                item = self.output_queue.get_nowait()
             except queue.Empty:
-                if self.done.is_set():
-                    # Try to yank 3 more times from it... maybe there's something in there...
-                    # (I don't know if this actually helps. Maybe we just need to yank 1 more time)
-                    for _ in range(3):
-                        if not self.output_queue.empty():
-                            yield self.output_queue.get()
-                        time.sleep(0.2)
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self.output_queue.get(timeout=timeout)
+                except queue.Empty:
                     break
 
-    def handle_stream_output(self, stream, is_error_stream):
-        for line in iter(stream.readline, ''):
-            if self.debug_mode:
-                print(f"Received output line:\n{line}\n---")
+            if not batchable(item):
+                return batch, item
+            add_to_batch(batch, item)
 
-            line = self.line_postprocessor(line)
+        return batch, None
 
-            if line is None:
-                continue # `line = None` is the postprocessor's signal to discard completely
+    def pump_output(self, process, output_queue):
+        """
+        Reads stdout and stderr from a single thread, waking up whenever either pipe has data.
+        Unfinished lines are passed on once the pipes have been quiet for `partial_line_timeout` seconds.
 
-            if self.detect_active_line(line):
-                active_line = self.detect_active_line(line)
-                self.output_queue.put({"active_line": active_line})
-            elif self.detect_end_of_execution(line):
-                self.output_queue.put({"active_line": None})
-                time.sleep(0.1)
-                self.done.set()
-            elif is_error_stream and "KeyboardInterrupt" in line:
-                self.output_queue.put({"output": "KeyboardInterrupt"})
-                time.sleep(0.1)
-                self.done.set()
+        When the end_of_execution marker shows up on stdout, anything the code wrote to stderr
+        before it is already sitting in the stderr pipe, so we drain that before signaling the end.
+        """
+        selector = selectors.DefaultSelector()
+        streams = {}
+        for stream, is_error_stream in [(process.stdout, False), (process.stderr, True)]:
+            fd = stream.fileno()
+            selector.register(fd, selectors.EVENT_READ)
+            streams[fd] = stream_state(is_error_stream)
+
+        def read(fd):
+            """
+            Reads whatever is in the pipe and handles it. Returns True if execution ended.
+            """
+            state = streams[fd]
+            data = os.read(fd, 65536)
+
+            if not data:
+                # EOF
+                selector.unregister(fd)
+                events = state["decoder"].close()
             else:
-                self.output_queue.put({"output": line})
+                events = state["decoder"].feed(data)
+
+            return self.handle_output_events(events, state, output_queue)
+
+        while selector.get_map():
+            # Only wake up on a timeout if there's an unfinished line to show
+            waiting = any(state["decoder"].waiting() for state in streams.values())
+            ready = selector.select(timeout=self.partial_line_timeout if waiting else None)
+
+            if not ready:
+                for state in streams.values():
+                    self.handle_output_events(state["decoder"].idle(), state, output_queue)
+                continue
+
+            ended = False
+            for key, _ in ready:
+                if read(key.fd):
+                    ended = True
+
+            if ended:
+                # Drain everything that was written before the marker
+                while selector.get_map():
+                    ready = selector.select(timeout=0)
+                    if not ready:
+                        break
+                    for key, _ in ready:
+                        read(key.fd)
+                for state in streams.values():
+                    self.handle_output_events(state["decoder"].finish_line(), state, output_queue)
+                self.finish_execution(output_queue)
+
+        # The process exited. Make sure nobody waits on it forever
+        self.finish_execution(output_queue)
+        selector.close()
+
+    def handle_stream_output(self, stream, is_error_stream, output_queue):
+        """
+        Reads one pipe with blocking reads, for Windows (where select() doesn't work on pipes).
+        A read returns as soon as there's any data, so unfinished lines are passed on after every read.
+        """
+        state = stream_state(is_error_stream)
+        fd = stream.fileno()
+
+        while True:
+            try:
+                data = os.read(fd, 65536)
+            except OSError:
+                data = b""
+            if not data:
+                break
+
+            events = state["decoder"].feed(data) + state["decoder"].idle()
+            if self.handle_output_events(events, state, output_queue):
+                # The other pipe has its own reader, give it a moment to catch up
+                self.handle_output_events(state["decoder"].finish_line(), state, output_queue)
+                time.sleep(0.1)
+                self.finish_execution(output_queue)
+
+        self.handle_output_events(state["decoder"].close(), state, output_queue)
+        if not is_error_stream:
+            self.finish_execution(output_queue)
+
+    def handle_output_events(self, events, state, output_queue):
+        """
+        Handles the lines and partial lines from a pipe's OutputDecoder. Returns True if one marked the end of execution.
+        """
+        ended = False
+        for kind, text in events:
+            if kind == "partial":
+                if self.handle_partial_line(text, output_queue):
+                    state["partial_shown"] = True
+                continue
+
+            if self.handle_output_line(text, state, output_queue):
+                ended = True
+        return ended
+
+    def replace_partial_line(self, state, output_queue):
+        """
+        Clears the partial line the consumer is showing from this pipe, since a finished line of output takes its place.
+        (Unless the pipe still has an unfinished line. Then the finished line was from the middle of it)
+        """
+        if state["partial_shown"] and not state["decoder"].unfinished():
+            output_queue.put_nowait({"partial_output": ""})
+            state["partial_shown"] = False
+
+    def handle_partial_line(self, line, output_queue):
+        """
+        Puts what the unfinished line reads now onto the output queue. Returns True if it did.
+        """
+        line = self.partial_line_postprocessor(line)
+
+        # Prompts (like ">>> "), markers, and the start of lines that will turn out to be markers aren't output
+        if not line or not line.strip() or "##" in line:
+            return False
+
+        output_queue.put_nowait({"partial_output": line})
+        return True
+
+    def partial_line_postprocessor(self, line):
+        return self.line_postprocessor(line)
+
+    def handle_output_line(self, line, state, output_queue):
+        """
+        Puts a line of output onto the output queue. Returns True if it marked the end of execution.
+        Markers and lines the postprocessor discards leave any partial line where it is.
+        """
+        if self.debug_mode:
+            print(f"Received output line:\n{line}\n---")
+
+        line = self.line_postprocessor(line)
+
+        if not line:
+            return False # `line = None` is the postprocessor's signal to discard completely (and "" is nothing at all)
+
+        if self.detect_active_line(line):
+            active_line = self.detect_active_line(line)
+            output_queue.put_nowait({"active_line": active_line})
+        elif self.detect_end_of_execution(line):
+            output_queue.put_nowait({"active_line": None})
+            return True
+        elif state["is_error_stream"] and "KeyboardInterrupt" in line:
+            self.replace_partial_line(state, output_queue)
+            output_queue.put_nowait({"output": "KeyboardInterrupt"})
+            return True
+        else:
+            self.replace_partial_line(state, output_queue)
+            output_queue.put_nowait({"output": line})
+        return False
+
+    def finish_execution(self, output_queue):
+        output_queue.put_nowait(END_OF_EXECUTION)
+        self.done.set()
+
+
+def stream_state(is_error_stream):
+    """
+    What a reader keeps track of for one of the process' pipes.
+    """
+    return {
+        "is_error_stream": is_error_stream,
+        "decoder": OutputDecoder(marker=MARKER),
+        # Whether the consumer is showing a partial line from this pipe
+        "partial_shown": False,
+    }
+
+
+def batchable(item):
+    """
+    Output, partial lines and active line changes can be joined into batches. The end of execution can't.
+    """
+    return item is not END_OF_EXECUTION and set(item) <= {"output", "partial_output", "active_line"}
+
+
+def add_to_batch(batch, item):
+    if "output" in item:
+        batch["output"] = join_output(batch["output"], item["output"]) if "output" in batch else item["output"]
+        # A finished line takes the place of any partial line before it
+        batch.pop("partial_output", None)
+    if "partial_output" in item:
+        batch["partial_output"] = item["partial_output"]
+    if "active_line" in item:
+        # Only the latest active line matters
+        batch["active_line"] = item["active_line"]
+
 
+def join_output(text, line):
+    """
+    Joins two pieces of output, keeping them on separate lines.
+    """
+    if not text.endswith("\n"):
+        text += "\n"
+    return text + line
@@ -2,28 +2,40 @@
 This file defines the Interpreter class.
 It's the main file. `import interpreter` will import an instance of this class.
 """
-from interpreter.utils import display_markdown_message
-from ..cli.cli import cli
 from ..utils.get_config import get_config
-from .respond import respond
-from ..llm.setup_llm import setup_llm
-from ..terminal_interface.terminal_interface import terminal_interface
-from ..terminal_interface.validate_llm_settings import validate_llm_settings
+from .respond import respond, arespond
 import appdirs
+import asyncio
 import os
+import sqlite3
 from datetime import datetime
-import json
+from ..code_interpreters.kernel_pool import KernelPool
 from ..utils.check_for_update import check_for_update
-from ..utils.display_markdown_message import display_markdown_message
+from ..utils.output_spool import OutputSpool, read_output_page
+from ..utils.notify import notify
+from ..utils.tracer import Tracer
+from ..utils.usage_ledger import get_usage, save_usage
+from ..utils.conversation_log import ConversationLog
+from ..utils.conversation_catalog import ConversationCatalog
+
+# The CLI, the terminal interface and the LLM setup (litellm, rich, inquirer, huggingface_hub...)
+# are imported where they're used, so `import interpreter` stays fast for library users
 
 class Interpreter:
     def cli(self):
+        from ..cli.cli import cli
         cli(self)
 
     def __init__(self):
         # State
         self.messages = []
         self._code_interpreters = {}
+        self._async_code_interpreters = {}
+        self._events = []
+        self._usage = []
+        self._usage_saved = 0
+        # The output of the code that's running (see start_output)
+        self._output_buffer = None
 
         # Settings
         self.local = False
@@ -31,11 +43,57 @@ class Interpreter:
         self.debug_mode = False
         self.max_output = 2000
         self.safe_mode = "off"
+        self.check_for_updates = True
+
+        # Headless mode never prints or renders anything (for batch jobs, servers, etc. with no terminal).
+        # `chat()` always runs as if display=False, and notices like "a new version is available"
+        # are yielded from the chat stream as {"notice": {"type": ..., "message": ...}} chunks
+        self.headless = bool(os.environ.get("OPEN_INTERPRETER_HEADLESS"))
+
+        # Time the parts of each turn (procedures search, trimming, the LLM, kernel spawns, code execution, rendering).
+        # With `trace` on, every span is yielded from the chat stream as a {"span": ...} chunk.
+        # Spans can also be appended to a JSON lines file (trace_path), and/or sent to OpenTelemetry
+        # (trace_opentelemetry, which needs `pip install opentelemetry-api opentelemetry-sdk` and a configured exporter)
+        self.trace = False
+        self.trace_path = None
+        self.trace_opentelemetry = False
+        self._tracer = None
+
+        # Code output lines arriving within this many seconds of each other are yielded as one chunk (up to output_batch_size characters)
+        # Set to 0 to get every line as its own chunk
+        self.output_batch_interval = 0.016
+        self.output_batch_size = 64 * 1024
+
+        # Code interpreters to start ahead of time (per language), so code runs without waiting for them to boot
+        self.kernel_pool_size = 0
+        self.kernel_pool_languages = ["python", "shell"]
+        self._kernel_pool = None
+        # (A pool we started ourselves is stopped on `reset()`. One that's shared, like a server's, belongs to whoever made it)
+        self._owns_kernel_pool = False
+
+        # Outputs longer than max_output are saved in full here (a folder per session), and messages get a handle to them
+        self.spool_output = True
+        self.output_spool_path = os.path.join(appdirs.user_data_dir("Open Interpreter"), "outputs")
+        # Sessions' spooled outputs are deleted once they're this many days old, and then the oldest, until the rest fit in
+        # output_spool_max_bytes. (A session's own are deleted on `reset()`, unless its conversation is saved and might refer to them)
+        self.output_spool_max_age = 7
+        self.output_spool_max_bytes = 1024 * 1024 * 1024
+        self._output_spool = None
 
         # Conversation history
         self.conversation_history = True
         self.conversation_filename = None
         self.conversation_history_path = os.path.join(appdirs.user_data_dir("Open Interpreter"), "conversations")
+        # Saving appends new messages to a log, which is fsynced "always" (after every save), "periodic" (at most once a second) or "never" (up to the OS)
+        self.conversation_fsync = "always"
+        self._conversation_log = None
+        # An index of saved conversations, for --conversations and `search()` (see ConversationCatalog)
+        self._conversation_catalog = None
+        # Set this to a sentence-transformers model (like "all-MiniLM-L6-v2", needs `pip install sentence-transformers`)
+        # to search past conversations by meaning, not just by keywords. Only cells saved while it's set get vectors
+        self.search_embedding_model = None
+        # Add code that worked in past conversations, if it looks relevant, to the system message
+        self.reuse_past_code = False
 
         # LLM settings
         self.model = ""
@@ -45,18 +103,19 @@ class Interpreter:
         self.max_tokens = None
         self.api_base = None
         self.api_key = None
-        self.max_budget = None
+        self.max_budget = None # (in USD, for this session. See `usage()`)
         self._llm = None
+        self._async_llm = None
 
         # Load config defaults
         config = get_config()
         self.__dict__.update(config)
 
-        # Check for update
-        if not self.local:
-            # This should actually be pushed into the utility
+        # Check for update (from a cached result, refreshed in the background)
+        # Opt out with `check_for_updates: false` in config.yaml, or the OPEN_INTERPRETER_NO_UPDATE_CHECK environment variable
+        if not self.local and self.check_for_updates and not os.environ.get("OPEN_INTERPRETER_NO_UPDATE_CHECK"):
             if check_for_update():
-                display_markdown_message("> **A new version of Open Interpreter is available.**\n>Please run: `pip install --upgrade open-interpreter`\n\n---")
+                notify(self, "update_available", "> **A new version of Open Interpreter is available.**\n>Please run: `pip install --upgrade open-interpreter`\n\n---")
 
     def chat(self, message=None, display=True, stream=False):
         if stream:
@@ -70,20 +129,31 @@ class Interpreter:
     
     def _streaming_chat(self, message=None, display=True):
 
+        # Nothing gets displayed in headless mode
+        if self.headless:
+            display = False
+
         # If we have a display,
         # we can validate our LLM settings w/ the user first
         if display:
+            from ..terminal_interface.validate_llm_settings import validate_llm_settings
             validate_llm_settings(self)
 
         # Setup the LLM
         if not self._llm:
+            from ..llm.setup_llm import setup_llm
             self._llm = setup_llm(self)
 
+        # Warm up code interpreters while the LLM is thinking
+        if self.kernel_pool_size and not display:
+            self._setup_kernel_pool().fill()
+
         # Sometimes a little more code -> a much better experience!
         # Display mode actually runs interpreter.chat(display=False, stream=True) from within the terminal_interface.
         # wraps the vanilla .chat(display=False) generator in a display.
         # Quite different from the plain generator stuff. So redirect to that
         if display:
+            from ..terminal_interface.terminal_interface import terminal_interface
             yield from terminal_interface(self, message)
             return
         
@@ -96,33 +166,164 @@ class Interpreter:
 
             # Save conversation if we've turned conversation_history on
             if self.conversation_history:
+                self._save_conversation()
+                
+            return
+        raise Exception("`interpreter.chat()` requires a display. Set `display=True` or pass a message into `interpreter.chat(message)`.")
 
-                # If it's the first message, set the conversation name
-                if not self.conversation_filename:
+    async def achat(self, message):
+        """
+        Async version of `chat(message, display=False, stream=True)`.
+        Async-yields the same chunks, without blocking the event loop. (Saving runs in a thread)
+        """
 
-                    first_few_words = "_".join(self.messages[0]["message"][:25].split(" ")[:-1])
-                    for char in "<>:\"/\\|?*!": # Invalid characters for filenames
-                        first_few_words = first_few_words.replace(char, "")
+        # Setup the async LLM
+        if not self._async_llm:
+            from ..llm.setup_llm import setup_llm
+            self._async_llm = setup_llm(self, asynchronous=True)
 
-                    date = datetime.now().strftime("%B_%d_%Y_%H-%M-%S")
-                    self.conversation_filename = "__".join([first_few_words, date]) + ".json"
+        # Warm up code interpreters while the LLM is thinking
+        if self.kernel_pool_size:
+            self._setup_kernel_pool().afill()
 
-                # Check if the directory exists, if not, create it
-                if not os.path.exists(self.conversation_history_path):
-                    os.makedirs(self.conversation_history_path)
-                # Write or overwrite the file
-                with open(os.path.join(self.conversation_history_path, self.conversation_filename), 'w') as f:
-                    json.dump(self.messages, f)
-                
-            return
-        raise Exception("`interpreter.chat()` requires a display. Set `display=True` or pass a message into `interpreter.chat(message)`.")
+        if message == "":
+            message = "No entry from user - please suggest something to enter"
+        self.messages.append({"role": "user", "message": message})
+
+        async for chunk in arespond(self):
+            if self._events:
+                for event in self._pop_events():
+                    yield event
+            yield chunk
+        for event in self._pop_events():
+            yield event
+
+        # Save conversation if we've turned conversation_history on
+        if self.conversation_history:
+            await asyncio.to_thread(self._save_conversation)
+
+    def _setup_kernel_pool(self):
+        if not self._kernel_pool:
+            self._kernel_pool = KernelPool(size=self.kernel_pool_size, languages=self.kernel_pool_languages)
+            self._owns_kernel_pool = True
+        return self._kernel_pool
+
+    def _get_tracer(self):
+        """
+        Returns the Tracer, or None if tracing is off.
+        """
+        if not (self.trace or self.trace_path or self.trace_opentelemetry):
+            return None
+        if not self._tracer:
+            self._tracer = Tracer(events=self._events if self.trace else None, path=self.trace_path, opentelemetry=self.trace_opentelemetry)
+        return self._tracer
+
+    def _get_output_spool(self):
+        if not self._output_spool:
+            self._output_spool = OutputSpool(self.output_spool_path, max_age_days=self.output_spool_max_age, max_bytes=self.output_spool_max_bytes)
+        return self._output_spool
+
+    def read_output(self, output_id, page=1, page_lines=200):
+        """
+        Returns a page of a spooled output, by the `id` in a message's "output_file".
+        """
+        for message in self.messages:
+            if message.get("output_file", {}).get("id") == output_id:
+                return read_output_page(message["output_file"]["path"], page, page_lines)
+        raise ValueError(f"No spooled output with the id {output_id}.")
+
+    def usage(self):
+        """
+        Returns the tokens and cost of this session's LLM calls (totals, and a record per call).
+        """
+        return get_usage(self)
+
+    def _save_conversation(self):
+
+        # If it's the first message, set the conversation name
+        if not self.conversation_filename:
+
+            first_few_words = "_".join(self.messages[0]["message"][:25].split(" ")[:-1])
+            for char in "<>:\"/\\|?*!": # Invalid characters for filenames
+                first_few_words = first_few_words.replace(char, "")
+
+            date = datetime.now().strftime("%B_%d_%Y_%H-%M-%S")
+            self.conversation_filename = "__".join([first_few_words, date]) + ".json"
+
+        # Only what changed since the last save is written (see ConversationLog)
+        log = self._conversation_log
+        if not log or log.json_path != os.path.join(self.conversation_history_path, self.conversation_filename):
+            if log:
+                log.close()
+            self._conversation_log = log = ConversationLog(self.conversation_history_path, self.conversation_filename, fsync=self.conversation_fsync)
+        unchanged = log.save(self.messages)
+        # (The LLM calls' records go next to it, see usage_ledger)
+        save_usage(self, log.json_path)
+
+        try:
+            # (Only the messages that changed are indexed again)
+            self._get_conversation_catalog().update(self.conversation_filename, self.messages, size=log.json_size + log.log_size, changed_from=unchanged)
+        except sqlite3.Error:
+            # The conversation's saved. The catalog's just an index, and its `sync()` will catch up
+            pass
+
+    def _get_conversation_catalog(self):
+        catalog = self._conversation_catalog
+        if not catalog or catalog.directory != self.conversation_history_path or catalog.embedding_model != self.search_embedding_model:
+            if catalog:
+                catalog.close()
+            self._conversation_catalog = ConversationCatalog(self.conversation_history_path, embedding_model=self.search_embedding_model)
+        return self._conversation_catalog
+
+    def search(self, query, limit=10, kind=None):
+        """
+        Searches the messages, code and outputs of saved conversations. `kind` can be "message", "code" or "output".
+        Returns the best matches first, as dicts (filename, title, position, kind, role, language, failed, content).
+        """
+        if not os.path.exists(self.conversation_history_path):
+            return []
+        catalog = self._get_conversation_catalog()
+        catalog.sync()
+        return catalog.search_cells(query, kind=kind, limit=limit)
 
     def _respond(self):
-        yield from respond(self)
+        for chunk in respond(self):
+            if self._events:
+                yield from self._pop_events()
+            yield chunk
+        yield from self._pop_events()
+
+    def _pop_events(self):
+        """
+        Returns the chunks queued up outside the conversation (notices in headless mode, see `notify`,
+        and spans if `trace` is on), and forgets them.
+        """
+        events = list(self._events)
+        self._events.clear()
+        return events
             
     def reset(self):
         self.messages = []
         self.conversation_filename = None
+        if self._conversation_log:
+            self._conversation_log.compact()
+            self._conversation_log = None
+        if self._output_spool and not self.conversation_history:
+            self._output_spool.delete()
+        self._output_spool = None
+        self._events.clear()
+        self._usage = []
+        self._usage_saved = 0
+        if self._tracer:
+            self._tracer.close()
+            self._tracer = None
         for code_interpreter in self._code_interpreters.values():
             code_interpreter.terminate()
-        self._code_interpreters = {}
\ No newline at end of file
+        self._code_interpreters = {}
+        for code_interpreter in self._async_code_interpreters.values():
+            code_interpreter.terminate()
+        self._async_code_interpreters = {}
+        if self._owns_kernel_pool:
+            self._kernel_pool.terminate()
+            self._kernel_pool = None
+            self._owns_kernel_pool = False
\ No newline at end of file
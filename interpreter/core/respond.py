@@ -1,111 +1,94 @@
-from ..code_interpreters.create_code_interpreter import create_code_interpreter
-from ..utils.merge_deltas import merge_deltas
+from ..code_interpreters.create_code_interpreter import create_code_interpreter, create_async_code_interpreter
+from ..utils.merge_deltas import DeltaAccumulator
 from ..utils.get_user_info_string import get_user_info_string
-from ..utils.display_markdown_message import display_markdown_message
 from ..rag.get_relevant_procedures import get_relevant_procedures
-from ..utils.truncate_output import truncate_output
+from ..rag.get_relevant_past_code import get_relevant_past_code
+from ..utils.output_buffer import OutputBuffer
+from ..utils.output_spool import handle
+from ..utils.notify import notify
+from ..utils.tracer import span, time_llm, atime_llm, next_turn
+from ..utils.usage_ledger import start_call, finish_call, get_usage
+import asyncio
 import traceback
-import litellm
 
 def respond(interpreter):
     """
     Yields tokens, but also adds them to interpreter.messages. TBH probably would be good to seperate those two responsibilities someday soon
     Responds until it decides not to run any more code or say anything else.
     """
+    # Imported here so `import interpreter` doesn't pay for litellm
+    import litellm
 
     while True:
 
         ### PREPARE MESSAGES ###
 
+        next_turn(interpreter)
+
         system_message = interpreter.system_message
-        
+
         # Open Procedures is an open-source database of tiny, up-to-date coding tutorials.
-        # We can query it semantically and append relevant tutorials/procedures to our system message
-        get_relevant_procedures(interpreter.messages[-2:])
+        # We search a local copy of it and append relevant tutorials/procedures to our system message
         if not interpreter.local:
-            try:
-                system_message += "\n\n" + get_relevant_procedures(interpreter.messages[-2:])
-            except:
-                # This can fail for odd SLL reasons. It's not necessary, so we can continue
-                pass
-        
-        # Add user info to system_message, like OS, CWD, etc
-        system_message += "\n\n" + get_user_info_string()
+            with span(interpreter, "procedures"):
+                system_message = add_relevant_procedures(interpreter, system_message)
 
-        # Create message object
-        system_message = {"role": "system", "message": system_message}
+        # Code that worked in past conversations (see Interpreter.reuse_past_code)
+        if interpreter.reuse_past_code:
+            with span(interpreter, "past_code"):
+                system_message = add_relevant_past_code(interpreter, system_message)
 
-        # Create the version of messages that we'll send to the LLM
-        messages_for_llm = interpreter.messages.copy()
-        messages_for_llm = [system_message] + messages_for_llm
-
-        # It's best to explicitly tell these LLMs when they don't get an output
-        for message in messages_for_llm:
-            if "output" in message and message["output"] == "":
-                message["output"] = "No output"
+        with span(interpreter, "prepare_messages"):
+            messages_for_llm = prepare_messages_for_llm(interpreter, system_message)
 
 
         ### RUN THE LLM ###
 
+        if over_budget(interpreter):
+            display_budget_exceeded_message(interpreter)
+            break
+
         # Add a new message from the assistant to interpreter's "messages" attribute
         # (This doesn't go to the LLM. We fill this up w/ the LLM's response)
         interpreter.messages.append({"role": "assistant"})
 
         # Start putting chunks into the new message
         # + yielding chunks to the user
+        # (Chunks are collected as fragments, and only joined into the message once the LLM is done)
+        message = DeltaAccumulator(interpreter.messages[-1])
+        start_call(interpreter, messages_for_llm)
         try:
-            for chunk in interpreter._llm(messages_for_llm):
+            for chunk in time_llm(interpreter, interpreter._llm(messages_for_llm)):
 
                 # Add chunk to the last message
-                interpreter.messages[-1] = merge_deltas(interpreter.messages[-1], chunk)
+                message.add(chunk)
 
                 # This is a coding llm
                 # It will yield dict with either a message, language, or code (or language AND code)
                 yield chunk
         except litellm.exceptions.BudgetExceededError:
-            display_markdown_message(f"""> Max budget exceeded
-
-                **Session spend:** ${litellm._current_cost}
-                **Max budget:** ${interpreter.max_budget}
-
-                Press CTRL-C then run `interpreter --max_budget [higher USD amount]` to proceed.
-            """)
+            display_budget_exceeded_message(interpreter)
             break
-        # Provide extra information on how to change API keys, if we encounter that error
-        # (Many people writing GitHub issues were struggling with this)
         except Exception as e:
-            if 'auth' in str(e).lower() or 'api key' in str(e).lower():
-                output = traceback.format_exc()
-                raise Exception(f"{output}\n\nThere might be an issue with your API key(s).\n\nTo reset your API key (we'll use OPENAI_API_KEY for this example, but you may need to reset your ANTHROPIC_API_KEY, HUGGINGFACE_API_KEY, etc):\n        Mac/Linux: 'export OPENAI_API_KEY=your-key-here',\n        Windows: 'setx OPENAI_API_KEY your-key-here' then restart terminal.\n\n")
-            else:
-                raise
-        
-        
-        
+            handle_llm_error(e)
+        finally:
+            message.materialize()
+            finish_call(interpreter)
+
+
+
         ### RUN CODE (if it's there) ###
 
         if "code" in interpreter.messages[-1]:
-            
+
             if interpreter.debug_mode:
                 print("Running code:", interpreter.messages[-1])
 
             try:
-                # What code do you want to run?
-                code = interpreter.messages[-1]["code"]
-
-                # Fix a common error where the LLM thinks it's in a Jupyter notebook
-                if interpreter.messages[-1]["language"] == "python" and code.startswith("!"):
-                    code = code[1:]
-                    interpreter.messages[-1]["code"] = code
-                    interpreter.messages[-1]["language"] = "shell"
-
-                # Get a code interpreter to run it
-                language = interpreter.messages[-1]["language"]
-                if language not in interpreter._code_interpreters:
-                    interpreter._code_interpreters[language] = create_code_interpreter(language)
-                code_interpreter = interpreter._code_interpreters[language]
+                code, language = prepare_code(interpreter)
 
                 # Yield a message, such that the user can stop code execution if they want to
+                # (Before a code interpreter is started, so code the user declines never starts one)
                 try:
                     yield {"executing": {"code": code, "language": language}}
                 except GeneratorExit:
@@ -113,19 +96,148 @@ def respond(interpreter):
                     # We need to tell python what we (the generator) should do if they exit
                     break
 
-                # Yield each line, also append it to last messages' output
-                interpreter.messages[-1]["output"] = ""
-                for line in code_interpreter.run(code):
-                    yield line
-                    if "output" in line:
-                        output = interpreter.messages[-1]["output"]
-                        output += "\n" + line["output"]
+                # Get a code interpreter to run it
+                if language not in interpreter._code_interpreters:
+                    with span(interpreter, "kernel_spawn", language=language) as attributes:
+                        if interpreter._kernel_pool:
+                            code_interpreter = interpreter._kernel_pool.acquire(language)
+                        else:
+                            code_interpreter = create_code_interpreter(language)
+                        # (Started here rather than on its first run, so the spawn is timed on its own)
+                        attributes["warm"] = getattr(code_interpreter, "process", None) is not None
+                        if not attributes["warm"] and hasattr(code_interpreter, "start_process"):
+                            code_interpreter.start_process()
+                    interpreter._code_interpreters[language] = code_interpreter
+                code_interpreter = interpreter._code_interpreters[language]
+                set_output_batching(interpreter, code_interpreter)
+
+                # Yield each line, also collect it for the last message's output
+                # (Only the start and end of long outputs are kept. See max_output)
+                output = start_output(interpreter)
+                try:
+                    with span(interpreter, "execution", language=language) as attributes:
+                        for line in code_interpreter.run(code):
+                            # (Collected before it's yielded, so the terminal's code block, which shows `output`, is up to date)
+                            if "output" in line:
+                                output.add(line["output"])
+                            if "partial_output" in line:
+                                output.set_partial(line["partial_output"])
+                            yield line
+                        attributes["output_chars"] = output.total_chars
+                finally:
+                    finish_output(interpreter, output)
+
+            except:
+                output = traceback.format_exc()
+                yield {"output": output.strip()}
+                interpreter.messages[-1]["output"] = output.strip()
+
+            yield {"end_of_execution": True}
+
+        else:
+            # Doesn't want to run code. We're done
+            break
+
+    return
+
+
+async def arespond(interpreter):
+    """
+    The async version of `respond`. Async-yields the same chunks, and also adds them to interpreter.messages.
+    The LLM streams through `interpreter._async_llm` and code runs in async code interpreters,
+    so nothing here blocks the event loop. (Searches that read from disk run in a thread)
+    """
+    import litellm
+
+    while True:
+
+        ### PREPARE MESSAGES ###
+
+        next_turn(interpreter)
+
+        system_message = interpreter.system_message
+
+        # Open Procedures is an open-source database of tiny, up-to-date coding tutorials.
+        # We search a local copy of it and append relevant tutorials/procedures to our system message
+        if not interpreter.local:
+            with span(interpreter, "procedures"):
+                system_message = await asyncio.to_thread(add_relevant_procedures, interpreter, system_message)
+
+        # Code that worked in past conversations (see Interpreter.reuse_past_code)
+        if interpreter.reuse_past_code:
+            with span(interpreter, "past_code"):
+                system_message = await asyncio.to_thread(add_relevant_past_code, interpreter, system_message)
+
+        with span(interpreter, "prepare_messages"):
+            messages_for_llm = prepare_messages_for_llm(interpreter, system_message)
+
+
+        ### RUN THE LLM ###
+
+        if over_budget(interpreter):
+            display_budget_exceeded_message(interpreter)
+            break
+
+        interpreter.messages.append({"role": "assistant"})
+
+        message = DeltaAccumulator(interpreter.messages[-1])
+        start_call(interpreter, messages_for_llm)
+        try:
+            async for chunk in atime_llm(interpreter, interpreter._async_llm(messages_for_llm)):
+                message.add(chunk)
+                yield chunk
+        except litellm.exceptions.BudgetExceededError:
+            display_budget_exceeded_message(interpreter)
+            break
+        except Exception as e:
+            handle_llm_error(e)
+        finally:
+            message.materialize()
+            finish_call(interpreter)
+
+
+        ### RUN CODE (if it's there) ###
+
+        if "code" in interpreter.messages[-1]:
+
+            if interpreter.debug_mode:
+                print("Running code:", interpreter.messages[-1])
 
-                        # Truncate output
-                        output = truncate_output(output, interpreter.max_output)
+            try:
+                code, language = prepare_code(interpreter)
+
+                # (Before a new code interpreter starts, so a server can make room for it. See SessionManager.make_room)
+                yield {"executing": {"code": code, "language": language}}
 
-                        interpreter.messages[-1]["output"] = output.strip()
+                if language not in interpreter._async_code_interpreters:
+                    with span(interpreter, "kernel_spawn", language=language) as attributes:
+                        if interpreter._kernel_pool:
+                            code_interpreter = await interpreter._kernel_pool.aacquire(language)
+                        else:
+                            code_interpreter = create_async_code_interpreter(language)
+                        attributes["warm"] = getattr(code_interpreter, "process", None) is not None
+                        if not attributes["warm"] and hasattr(code_interpreter, "start_process"):
+                            await code_interpreter.start_process()
+                    interpreter._async_code_interpreters[language] = code_interpreter
+                code_interpreter = interpreter._async_code_interpreters[language]
+                set_output_batching(interpreter, code_interpreter)
+
+                output = start_output(interpreter)
+                try:
+                    with span(interpreter, "execution", language=language) as attributes:
+                        async for line in code_interpreter.run(code):
+                            if "output" in line:
+                                output.add(line["output"])
+                            if "partial_output" in line:
+                                output.set_partial(line["partial_output"])
+                            yield line
+                        attributes["output_chars"] = output.total_chars
+                finally:
+                    finish_output(interpreter, output)
 
+            except GeneratorExit:
+                # The consumer stopped listening (like a client that went away). Nothing more can be yielded
+                raise
             except:
                 output = traceback.format_exc()
                 yield {"output": output.strip()}
@@ -137,4 +249,127 @@ def respond(interpreter):
             # Doesn't want to run code. We're done
             break
 
-    return
\ No newline at end of file
+
+def add_relevant_procedures(interpreter, system_message):
+    """
+    Appends the procedures relevant to the last two messages to the system message.
+    """
+    try:
+        procedures = get_relevant_procedures(interpreter.messages[-2:])
+    except:
+        # It's not necessary, so we can continue
+        procedures = ""
+
+    if procedures:
+        system_message += "\n\n" + procedures
+    return system_message
+
+
+def add_relevant_past_code(interpreter, system_message):
+    """
+    Appends past code relevant to the last two messages to the system message.
+    """
+    try:
+        past_code = get_relevant_past_code(interpreter, interpreter.messages[-2:])
+    except:
+        # It's not necessary either
+        past_code = ""
+
+    if past_code:
+        system_message += "\n\n" + past_code
+    return system_message
+
+
+def prepare_messages_for_llm(interpreter, system_message):
+    """
+    Adds the user info and system message to interpreter.messages,
+    returning the version of messages that we'll send to the LLM.
+    """
+
+    # Add user info to system_message, like OS, CWD, etc
+    system_message += "\n\n" + get_user_info_string()
+
+    # Create message object
+    system_message = {"role": "system", "message": system_message}
+
+    # Create the version of messages that we'll send to the LLM
+    messages_for_llm = interpreter.messages.copy()
+    messages_for_llm = [system_message] + messages_for_llm
+
+    # It's best to explicitly tell these LLMs when they don't get an output
+    for message in messages_for_llm:
+        if "output" in message and message["output"] == "":
+            message["output"] = "No output"
+
+    return messages_for_llm
+
+
+def prepare_code(interpreter):
+    """
+    Returns the (code, language) the last message wants to run.
+    """
+
+    # What code do you want to run?
+    code = interpreter.messages[-1]["code"]
+
+    # Fix a common error where the LLM thinks it's in a Jupyter notebook
+    if interpreter.messages[-1]["language"] == "python" and code.startswith("!"):
+        code = code[1:]
+        interpreter.messages[-1]["code"] = code
+        interpreter.messages[-1]["language"] = "shell"
+
+    return code, interpreter.messages[-1]["language"]
+
+
+def set_output_batching(interpreter, code_interpreter):
+    """
+    Output lines that arrive close together are yielded as one chunk. See output_batch_interval.
+    """
+    code_interpreter.batch_interval = interpreter.output_batch_interval
+    code_interpreter.batch_size = interpreter.output_batch_size
+
+
+def start_output(interpreter):
+    """
+    Returns an OutputBuffer for the code that's about to run (also kept as `interpreter._output_buffer` while it runs,
+    so the terminal can show it). If output spooling is on, outputs longer than max_output are saved in full to the session's spool.
+    """
+    interpreter.messages[-1]["output"] = ""
+    spool = interpreter._get_output_spool().open if interpreter.spool_output else None
+    interpreter._output_buffer = OutputBuffer(interpreter.max_output, spool=spool)
+    return interpreter._output_buffer
+
+
+def finish_output(interpreter, output):
+    """
+    Writes the collected output (and a handle to its spooled file, if it has one) into the last message.
+    """
+    output.close()
+    interpreter._output_buffer = None
+    interpreter.messages[-1]["output"] = output.text()
+    if output.spool_file:
+        interpreter.messages[-1]["output_file"] = handle(output.spool_file)
+
+
+def over_budget(interpreter):
+    return bool(interpreter.max_budget) and get_usage(interpreter)["cost"] >= interpreter.max_budget
+
+
+def display_budget_exceeded_message(interpreter):
+    notify(interpreter, "budget_exceeded", f"""> Max budget exceeded
+
+        **Session spend:** ${get_usage(interpreter)["cost"]:.4f}
+        **Max budget:** ${interpreter.max_budget}
+
+        Press CTRL-C then run `interpreter --max_budget [higher USD amount]` to proceed.
+    """)
+
+
+def handle_llm_error(e):
+    # Provide extra information on how to change API keys, if we encounter that error
+    # (Many people writing GitHub issues were struggling with this)
+    if 'auth' in str(e).lower() or 'api key' in str(e).lower():
+        output = traceback.format_exc()
+        raise Exception(f"{output}\n\nThere might be an issue with your API key(s).\n\nTo reset your API key (we'll use OPENAI_API_KEY for this example, but you may need to reset your ANTHROPIC_API_KEY, HUGGINGFACE_API_KEY, etc):\n        Mac/Linux: 'export OPENAI_API_KEY=your-key-here',\n        Windows: 'setx OPENAI_API_KEY your-key-here' then restart terminal.\n\n")
+    else:
+        raise
@@ -1,68 +1,87 @@
-
-
 from ..utils.convert_to_openai_messages import convert_to_openai_messages
-from .setup_text_llm import setup_text_llm
+from ..utils.code_fence_parser import CodeFenceParser
 
-def convert_to_coding_llm(text_llm, debug_mode=False):
+def convert_to_coding_llm(text_llm, debug_mode=False, asynchronous=False):
     """
     Takes a text_llm
     returns an OI Coding LLM (a generator that takes OI messages and streams deltas with `message`, 'language', and `code`).
+
+    If `asynchronous` is True, `text_llm` should be an async generator, and so is the returned Coding LLM.
     """
 
     def coding_llm(messages):
         messages = convert_to_openai_messages(messages)
+        process_chunk = create_chunk_processor(debug_mode)
 
-        inside_code_block = False
-        accumulated_block = ""
-        language = None
-        
         for chunk in text_llm(messages):
+            deltas, finished = process_chunk(chunk)
+            yield from deltas
+            if finished:
+                return
+
+        deltas, _ = process_chunk(None)
+        yield from deltas
 
-            if debug_mode:
-                print("Chunk in coding_llm", chunk)
-
-            if ('choices' not in chunk or len(chunk['choices']) == 0):
-                # This happens sometimes
-                continue
-            
-            content = chunk['choices'][0]['delta'].get('content', "")
-            
-            accumulated_block += content
-            
-            # Did we just enter a code block?
-            if "```" in accumulated_block and not inside_code_block:
-                inside_code_block = True
-                accumulated_block = accumulated_block.split("```")[1]
-
-            # Did we just exit a code block?
-            if inside_code_block and "```" in accumulated_block:
+    async def async_coding_llm(messages):
+        messages = convert_to_openai_messages(messages)
+        process_chunk = create_chunk_processor(debug_mode)
+
+        async for chunk in text_llm(messages):
+            deltas, finished = process_chunk(chunk)
+            for delta in deltas:
+                yield delta
+            if finished:
                 return
 
-            # If we're in a code block,
-            if inside_code_block:
-                
-                # If we don't have a `language`, find it
-                if language is None and "\n" in accumulated_block:
-                    language = accumulated_block.split("\n")[0]
-
-                    # Default to python if not specified
-                    if language == "":
-                        language = "python"
-
-                    output = {"language": language}
-
-                    # If we recieved more than just the language in this chunk, send that
-                    if content.split("\n")[1]:
-                        output["code"] = content.split("\n")[1]
-                    
-                    yield output
-                
-                # If we do have a `language`, send the output as code
-                elif language:
-                    yield {"code": content}
-            
-            # If we're not in a code block, send the output as a message
-            if not inside_code_block:
-                yield {"message": content}
-
-    return coding_llm
\ No newline at end of file
+        deltas, _ = process_chunk(None)
+        for delta in deltas:
+            yield delta
+
+    if asynchronous:
+        return async_coding_llm
+    return coding_llm
+
+
+def create_chunk_processor(debug_mode=False):
+    """
+    Returns a function that takes a streamed text chunk (or None once the stream is over) and returns
+    the OI deltas it produced, plus whether the response is finished.
+
+    Text before and after the first code block streams as `message`, the block itself as `language` and `code`.
+    An OI message only holds one block of code, so the response is finished when a second code block opens.
+    The LLM will see the first block's output and can write the next one then.
+    """
+
+    parser = CodeFenceParser()
+    code_blocks = 0
+
+    def process_chunk(chunk):
+        nonlocal code_blocks
+        deltas = []
+
+        if debug_mode:
+            print("Chunk in coding_llm", chunk)
+
+        if chunk is None:
+            # The stream is over, so let go of anything the parser was holding back
+            events = parser.flush()
+        elif ('choices' not in chunk or len(chunk['choices']) == 0):
+            # This happens sometimes
+            return deltas, False
+        else:
+            content = chunk['choices'][0]['delta'].get('content') or ""
+            events = parser.feed(content)
+
+        for kind, value in events:
+            if kind == "language":
+                if code_blocks > 0:
+                    return deltas, True
+                deltas.append({"language": value})
+            elif kind == "end_code":
+                code_blocks += 1
+            else:
+                deltas.append({kind: value})
+
+        return deltas, False
+
+    return process_chunk
@@ -6,18 +6,20 @@ from .setup_openai_coding_llm import setup_openai_coding_llm
 import os
 import litellm
 
-def setup_llm(interpreter):
+def setup_llm(interpreter, asynchronous=False):
     """
     Takes an Interpreter (which includes a ton of LLM settings),
     returns a Coding LLM (a generator that streams deltas with `message` and `code`).
+
+    If `asynchronous` is True, the Coding LLM is an async generator instead.
     """
 
     if (not interpreter.local
         and (interpreter.model in litellm.open_ai_chat_completion_models or interpreter.model.startswith("azure/"))):
         # Function calling LLM
-        coding_llm = setup_openai_coding_llm(interpreter)
+        coding_llm = setup_openai_coding_llm(interpreter, asynchronous=asynchronous)
     else:
-        text_llm = setup_text_llm(interpreter)
-        coding_llm = convert_to_coding_llm(text_llm, debug_mode=interpreter.debug_mode)
+        text_llm = setup_text_llm(interpreter, asynchronous=asynchronous)
+        coding_llm = convert_to_coding_llm(text_llm, debug_mode=interpreter.debug_mode, asynchronous=asynchronous)
 
     return coding_llm
\ No newline at end of file
@@ -14,7 +14,7 @@ from rich import print as rprint
 from rich.markdown import Markdown
 import os
 import shutil
-import tokentrim as tt
+from ..utils.trim_messages import trim_messages
 from huggingface_hub import list_files_info, hf_hub_download
 
 
@@ -265,11 +265,7 @@ def setup_local_text_llm(interpreter):
         else:
             max_tokens = DEFAULT_MAX_TOKENS
         
-        messages = tt.trim(
-            messages,
-            max_tokens=(context_window-max_tokens-25),
-            system_message=system_message
-        )
+        messages = trim_messages(messages, system_message, context_window - max_tokens - 25)
 
         prompt = messages_to_prompt(messages, interpreter.model)
         # Lmao i can't believe this works (it does need this btw)
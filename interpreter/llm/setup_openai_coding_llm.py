@@ -1,9 +1,11 @@
+import asyncio
 import litellm
-from ..utils.merge_deltas import merge_deltas
-from ..utils.parse_partial_json import parse_partial_json
+from ..utils.streaming_json_parser import StreamingJsonParser
 from ..utils.convert_to_openai_messages import convert_to_openai_messages
-from ..utils.display_markdown_message import display_markdown_message
-import tokentrim as tt
+from ..utils.notify import notify
+from ..utils.tracer import span
+from ..utils.usage_ledger import record_prompt
+from ..utils.trim_messages import trim_messages, get_max_prompt_tokens
 
 
 function_schema = {
@@ -28,13 +30,15 @@ function_schema = {
   },
 }
 
-def setup_openai_coding_llm(interpreter):
+def setup_openai_coding_llm(interpreter, asynchronous=False):
     """
     Takes an Interpreter (which includes a ton of LLM settings),
     returns a OI Coding LLM (a generator that takes OI messages and streams deltas with `message`, `language`, and `code`).
+
+    If `asynchronous` is True, the returned Coding LLM is an async generator built on LiteLLM's async streaming.
     """
 
-    def coding_llm(messages):
+    def get_params(messages):
         
         # Convert messages
         messages = convert_to_openai_messages(messages)
@@ -48,17 +52,22 @@ def setup_openai_coding_llm(interpreter):
         messages = messages[1:]
 
         # Trim messages, preserving the system_message
-        try:
-            messages = tt.trim(messages=messages, system_message=system_message, model=interpreter.model)
-        except:
-            if interpreter.context_window:
-                messages = tt.trim(messages=messages, system_message=system_message, max_tokens=interpreter.context_window)
-            else:
-                display_markdown_message("""
-                **We were unable to determine the context window of this model.** Defaulting to 3000.
-                If your model can handle more, run `interpreter --context_window {token limit}` or `interpreter.context_window = {token limit}`.
-                """)
-                messages = tt.trim(messages=messages, system_message=system_message, max_tokens=3000)
+        with span(interpreter, "trim", messages=len(messages)) as attributes:
+            try:
+                max_tokens = get_max_prompt_tokens(interpreter.model)
+            except ValueError:
+                if interpreter.context_window:
+                    max_tokens = interpreter.context_window
+                else:
+                    notify(interpreter, "unknown_context_window", """
+                    **We were unable to determine the context window of this model.** Defaulting to 3000.
+                    If your model can handle more, run `interpreter --context_window {token limit}` or `interpreter.context_window = {token limit}`.
+                    """)
+                    max_tokens = 3000
+            messages = trim_messages(messages, system_message, max_tokens, interpreter.model)
+            # (trim puts the system message back at the start)
+            attributes["kept"] = len(messages) - 1
+        record_prompt(interpreter, messages)
 
         if interpreter.debug_mode:
             print("Sending this to the OpenAI LLM:", messages)
@@ -82,8 +91,7 @@ def setup_openai_coding_llm(interpreter):
             params["temperature"] = interpreter.temperature
         
         # These are set directly on LiteLLM
-        if interpreter.max_budget:
-            litellm.max_budget = interpreter.max_budget
+        # (max_budget isn't. It's per session, so respond() checks it against the session's usage)
         if interpreter.debug_mode:
             litellm.set_verbose = True
 
@@ -91,48 +99,81 @@ def setup_openai_coding_llm(interpreter):
         if interpreter.debug_mode:
             print("Sending this to LiteLLM:", params)
 
-        response = litellm.completion(**params)
+        return params
 
-        accumulated_deltas = {}
-        language = None
-        code = ""
+    def coding_llm(messages):
+        response = litellm.completion(**get_params(messages))
+        process_chunk = create_chunk_processor()
 
         for chunk in response:
+            yield from process_chunk(chunk)
+
+    async def async_coding_llm(messages):
+        # (Trimming counts tokens, which can take a while on a long conversation. It runs in a thread)
+        params = await asyncio.to_thread(get_params, messages)
+        response = await litellm.acompletion(**params)
+        process_chunk = create_chunk_processor()
+
+        async for chunk in response:
+            for delta in process_chunk(chunk):
+                yield delta
+
+    if asynchronous:
+        return async_coding_llm
+    return coding_llm
+
+
+def create_chunk_processor():
+    """
+    Returns a function that takes a streamed OpenAI chunk
+    and returns a list of OI deltas (`message`, `language`, `code`) it produced.
+
+    Function call arguments are parsed incrementally, so each chunk costs only as much as its own text.
+    """
+
+    arguments_parser = StreamingJsonParser()
+    language_fragments = []
+    language = None
+    # Code that streamed in before the language did
+    early_code_fragments = []
+
+    def process_chunk(chunk):
+        nonlocal language
+        deltas = []
+
+        if ('choices' not in chunk or len(chunk['choices']) == 0):
+            # This happens sometimes
+            return deltas
+
+        delta = chunk["choices"][0]["delta"]
+
+        if "content" in delta and delta["content"]:
+            deltas.append({"message": delta["content"]})
+
+        function_call = delta.get("function_call") or {}
+        arguments = function_call.get("arguments")
+        if not arguments:
+            return deltas
+
+        for key, fragment, complete in arguments_parser.feed(arguments):
+
+            if key == "language" and language is None:
+                language_fragments.append(fragment)
+
+                # Only send the language once it's *finished*, as opposed to partially typed
+                if complete and "".join(language_fragments):
+                    language = "".join(language_fragments)
+                    deltas.append({"language": language})
+
+                    if "".join(early_code_fragments):
+                        deltas.append({"code": "".join(early_code_fragments)})
+
+            elif key == "code":
+                if language is None:
+                    early_code_fragments.append(fragment)
+                elif fragment:
+                    deltas.append({"code": fragment})
+
+        return deltas
 
-            if ('choices' not in chunk or len(chunk['choices']) == 0):
-                # This happens sometimes
-                continue
-
-            delta = chunk["choices"][0]["delta"]
-
-            # Accumulate deltas
-            accumulated_deltas = merge_deltas(accumulated_deltas, delta)
-
-            if "content" in delta and delta["content"]:
-                yield {"message": delta["content"]}
-
-            if ("function_call" in accumulated_deltas 
-                and "arguments" in accumulated_deltas["function_call"]):
-
-                arguments = accumulated_deltas["function_call"]["arguments"]
-                arguments = parse_partial_json(arguments)
-
-                if arguments:
-
-                    if (language is None
-                        and "language" in arguments
-                        and "code" in arguments # <- This ensures we're *finished* typing language, as opposed to partially done
-                        and arguments["language"]):
-                        language = arguments["language"]
-                        yield {"language": language}
-                    
-                    if language is not None and "code" in arguments:
-                        # Calculate the delta (new characters only)
-                        code_delta = arguments["code"][len(code):]
-                        # Update the code
-                        code = arguments["code"]
-                        # Yield the delta
-                        if code_delta:
-                          yield {"code": code_delta}
-            
-    return coding_llm
\ No newline at end of file
+    return process_chunk
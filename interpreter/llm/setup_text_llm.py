@@ -2,20 +2,28 @@
 
 import litellm
 
-from ..utils.display_markdown_message import display_markdown_message
-from .setup_local_text_llm import setup_local_text_llm
+from ..utils.notify import notify
+from ..utils.tracer import span
+from ..utils.usage_ledger import record_prompt
+from ..utils.iterate_in_thread import iterate_in_thread
+import asyncio
 import os
-import tokentrim as tt
+from ..utils.trim_messages import trim_messages, get_max_prompt_tokens
 import traceback
 
-def setup_text_llm(interpreter):
+def setup_text_llm(interpreter, asynchronous=False):
     """
     Takes an Interpreter (which includes a ton of LLM settings),
     returns a text LLM (an OpenAI-compatible chat LLM with baked-in settings. Only takes `messages`).
+
+    If `asynchronous` is True, the returned text LLM is an async generator.
     """
 
     if interpreter.local:
 
+        # Imported here, so only local mode pays for huggingface_hub
+        from .setup_local_text_llm import setup_local_text_llm
+
         # Soon, we should have more options for local setup. For now we only have HuggingFace.
         # So we just do that.
 
@@ -42,13 +50,15 @@ def setup_text_llm(interpreter):
 
         try:
             # Download and use HF model
-            return setup_local_text_llm(interpreter)
+            local_text_llm = setup_local_text_llm(interpreter)
         except:
-            traceback.print_exc()
             # If it didn't work, apologize and switch to GPT-4
+            # (The traceback goes in the notice, so headless mode doesn't print it)
+            error = traceback.format_exc()
 
-            display_markdown_message(f"""
+            notify(interpreter, "local_model_failed", f"""
             > Failed to install `{interpreter.model}`.
+            \n\n```\n{error}```
             \n\n**Common Fixes:** You can follow our simple setup docs at the link below to resolve common errors.\n\n> `https://github.com/KillianLucas/open-interpreter/tree/main/docs`
             \n\n**If you've tried that and you're still getting an error, we have likely not built the proper `{interpreter.model}` support for your system.**
             \n\n*( Running language models locally is a difficult task!* If you have insight into the best way to implement this across platforms/architectures, please join the Open Interpreter community Discord and consider contributing the project's development.
@@ -56,35 +66,45 @@ def setup_text_llm(interpreter):
             
             raise Exception("Architecture not yet supported for local LLM inference. Please run `interpreter` to connect to a cloud model, then try `--local` again in a few days.")
 
+        if not asynchronous or local_text_llm is None:
+            return local_text_llm
+
+        # Local models block while they generate, so stream their tokens from a worker thread
+        async def async_local_text_llm(messages):
+            async for chunk in iterate_in_thread(local_text_llm(messages)):
+                yield chunk
+
+        return async_local_text_llm
+
     else:
         # For non-local use, pass in the model directly
         model = interpreter.model
 
     # Pass remaining parameters to LiteLLM
-    def base_llm(messages):
-        """
-        Returns a generator
-        """
+    def get_params(messages):
 
         system_message = messages[0]["content"]
 
         system_message += "\n\nTo execute code on the user's machine, write a markdown code block *with a language*, i.e ```python, ```shell, ```r, ```html, or ```javascript. You will recieve the code output."
 
-        # TODO swap tt.trim for litellm util
         messages = messages[1:]
-        if interpreter.context_window and interpreter.max_tokens:
-            trim_to_be_this_many_tokens = interpreter.context_window - interpreter.max_tokens - 25 # arbitrary buffer
-            messages = tt.trim(messages, system_message=system_message, max_tokens=trim_to_be_this_many_tokens)
-        else:
-            try:
-                messages = tt.trim(messages, system_message=system_message, model=interpreter.model)
-            except:
-                display_markdown_message("""
-                **We were unable to determine the context window of this model.** Defaulting to 3000.
-                If your model can handle more, run `interpreter --context_window {token limit}` or `interpreter.context_window = {token limit}`.
-                Also, please set max_tokens: `interpreter --max_tokens {max tokens per response}` or `interpreter.max_tokens = {max tokens per response}`
-                """)
-                messages = tt.trim(messages, system_message=system_message, max_tokens=3000)
+        with span(interpreter, "trim", messages=len(messages)) as attributes:
+            if interpreter.context_window and interpreter.max_tokens:
+                max_tokens = interpreter.context_window - interpreter.max_tokens - 25 # arbitrary buffer
+            else:
+                try:
+                    max_tokens = get_max_prompt_tokens(interpreter.model)
+                except ValueError:
+                    notify(interpreter, "unknown_context_window", """
+                    **We were unable to determine the context window of this model.** Defaulting to 3000.
+                    If your model can handle more, run `interpreter --context_window {token limit}` or `interpreter.context_window = {token limit}`.
+                    Also, please set max_tokens: `interpreter --max_tokens {max tokens per response}` or `interpreter.max_tokens = {max tokens per response}`
+                    """)
+                    max_tokens = 3000
+            messages = trim_messages(messages, system_message, max_tokens, interpreter.model)
+            # (trim puts the system message back at the start)
+            attributes["kept"] = len(messages) - 1
+        record_prompt(interpreter, messages)
 
         if interpreter.debug_mode:
             print("Passing messages into LLM:", messages)
@@ -107,8 +127,7 @@ def setup_text_llm(interpreter):
             params["temperature"] = interpreter.temperature
 
         # These are set directly on LiteLLM
-        if interpreter.max_budget:
-            litellm.max_budget = interpreter.max_budget
+        # (max_budget isn't. It's per session, so respond() checks it against the session's usage)
         if interpreter.debug_mode:
             litellm.set_verbose = True
 
@@ -116,6 +135,23 @@ def setup_text_llm(interpreter):
         if interpreter.debug_mode:
             print("Sending this to LiteLLM:", params)
 
-        return litellm.completion(**params)
+        return params
+
+    def base_llm(messages):
+        """
+        Returns a generator
+        """
+        return litellm.completion(**get_params(messages))
+
+    async def async_base_llm(messages):
+        """
+        Async generator
+        """
+        # (Trimming runs in a thread, see async_coding_llm)
+        params = await asyncio.to_thread(get_params, messages)
+        async for chunk in await litellm.acompletion(**params):
+            yield chunk
 
+    if asynchronous:
+        return async_base_llm
     return base_llm
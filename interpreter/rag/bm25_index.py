@@ -0,0 +1,54 @@
+import math
+import re
+from collections import Counter, defaultdict
+
+# Words too common to say what a query is about
+STOPWORDS = set("a an and are as at be by can do for from how i in is it me my of on or please that the this to what with you".split())
+
+def tokenize(text):
+    return re.findall(r"[a-z0-9_]+", text.lower())
+
+
+class BM25Index:
+    """
+    A small in-memory BM25 index over a list of strings.
+    Plenty fast for a few thousand documents, and needs nothing outside the standard library.
+    """
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.documents = documents
+        self.k1 = k1
+        self.b = b
+
+        # term -> [(document index, term frequency), ...]
+        self.postings = defaultdict(list)
+        self.lengths = []
+        for i, document in enumerate(documents):
+            term_frequencies = Counter(tokenize(document))
+            for term, frequency in term_frequencies.items():
+                self.postings[term].append((i, frequency))
+            self.lengths.append(sum(term_frequencies.values()))
+
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 1
+        self.idf = {
+            term: math.log(1 + (len(documents) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+    def search(self, query, k=3, min_score=0):
+        """
+        Returns up to `k` documents that best match `query`, best first.
+        Documents that score less than `min_score` (like ones that only share a word or two with the query) are left out.
+        """
+        scores = defaultdict(float)
+
+        for term in set(tokenize(query)) - STOPWORDS:
+            if term not in self.postings:
+                continue
+            idf = self.idf[term]
+            for i, frequency in self.postings[term]:
+                length_norm = 1 - self.b + self.b * self.lengths[i] / self.average_length
+                scores[i] += idf * frequency * (self.k1 + 1) / (frequency + self.k1 * length_norm)
+
+        best = sorted((i for i in scores if scores[i] >= min_score), key=scores.get, reverse=True)[:k]
+        return [self.documents[i] for i in best]
@@ -0,0 +1,19 @@
+from functools import lru_cache
+
+@lru_cache(maxsize=None)
+def get_embedder(model_name):
+    """
+    Returns a function that turns a list of texts into normalized float32 vectors, with a local
+    sentence-transformers model (downloaded the first time it's used).
+    """
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        raise ImportError("Searching past conversations by meaning needs sentence-transformers. Run `pip install sentence-transformers`, or set `search_embedding_model` to None to search by keywords only.")
+
+    model = SentenceTransformer(model_name)
+
+    def embed(texts):
+        return model.encode(texts, normalize_embeddings=True, convert_to_numpy=True).astype("float32")
+
+    return embed
@@ -0,0 +1,33 @@
+import os
+from .local_procedures import messages_to_query
+
+# How much past code goes into the system message
+MAX_SNIPPETS = 3
+MAX_SNIPPET_CHARACTERS = 1500
+
+def get_relevant_past_code(interpreter, messages):
+    """
+    Returns code that ran without errors in past conversations and is relevant to `messages`,
+    formatted for the system message, or an empty string if there isn't any.
+    """
+    if not os.path.exists(interpreter.conversation_history_path):
+        return ""
+
+    query = messages_to_query(messages)
+    if not query.strip():
+        return ""
+
+    # (Not from this conversation. That code's already in the messages)
+    cells = interpreter._get_conversation_catalog().search_cells(
+        query, kind="code", working_only=True, any_word=True, exclude=interpreter.conversation_filename, limit=MAX_SNIPPETS)
+    if not cells:
+        return ""
+
+    snippets = []
+    for cell in cells:
+        code = cell["content"]
+        if len(code) > MAX_SNIPPET_CHARACTERS:
+            code = code[:MAX_SNIPPET_CHARACTERS] + "\n..."
+        snippets.append(f'From "{cell["title"]}":\n```{cell["language"] or ""}\n{code}\n```')
+
+    return "[Code That Worked Before]\nThis code ran without errors in past conversations with the user. If it's relevant to the task, build on it instead of starting from scratch.\n\n" + "\n\n".join(snippets)
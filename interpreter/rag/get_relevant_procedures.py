@@ -1,15 +1,19 @@
-import requests
-from ..utils.convert_to_openai_messages import convert_to_openai_messages
+from .local_procedures import LocalProcedures
+
+# Open Procedures is an open-source database of tiny, up-to-date coding tutorials.
+# We search a local snapshot of it, which keeps itself up to date in the background
+local_procedures = LocalProcedures()
 
 def get_relevant_procedures(messages):
-    # Open Procedures is an open-source database of tiny, up-to-date coding tutorials.
-    # We can query it semantically and append relevant tutorials/procedures to our system message:
+    """
+    Returns the procedures relevant to `messages`, formatted for the system message,
+    or an empty string if there aren't any.
+    """
 
-    # Convert to required OpenAI-compatible `messages` list
-    query = {"query": convert_to_openai_messages(messages)}
-    url = "https://open-procedures.replit.app/search/"
+    relevant_procedures = local_procedures.search(messages)
+    if not relevant_procedures:
+        return ""
 
-    relevant_procedures = requests.post(url, json=query).json()["procedures"]
     relevant_procedures = "[Recommended Procedures]\n" + "\n---\n".join(relevant_procedures) + "\nIn your plan, include steps and, if present, **EXACT CODE SNIPPETS** (especially for deprecation notices, **WRITE THEM INTO YOUR PLAN -- underneath each numbered step** as they will VANISH once you execute your first line of code, so WRITE THEM DOWN NOW if you need them) from the above procedures if they are relevant to the task. Again, include **VERBATIM CODE SNIPPETS** from the procedures above if they are relevent to the task **directly in your plan.**"
 
-    return relevant_procedures
\ No newline at end of file
+    return relevant_procedures
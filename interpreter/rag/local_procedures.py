@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+import appdirs
+from ..utils.convert_to_openai_messages import convert_to_openai_messages
+from .bm25_index import BM25Index
+
+procedures_dir = os.path.join(appdirs.user_data_dir("Open Interpreter"), "procedures")
+remote_url = "https://open-procedures.replit.app/search/"
+
+# Procedures that come with Open Interpreter, so the first search finds something
+bundled_dir = os.path.join(os.path.dirname(__file__), "procedures")
+
+# How well a procedure has to match the messages (its BM25 score) to be used. Sharing a word or two isn't enough
+MIN_SCORE = 3.5
+
+# We ask the remote search at most this often (in seconds)
+SYNC_INTERVAL = 60
+
+
+class LocalProcedures:
+    """
+    Searches a snapshot of Open Procedures kept on disk, so finding relevant procedures
+    doesn't wait on the network and works offline.
+
+    The procedures that come with Open Interpreter (in `bundled_dir`) are searched first. The snapshot
+    (`procedures.json` in `directory`) grows in the background: when a search finds nothing, we ask the
+    remote Open Procedures search for the same messages (at most every `sync_interval` seconds) and add
+    whatever it returns. Any `.md` files you put in `directory` are searched too.
+
+    Only procedures that score at least `min_score` are returned. Results are cached by a hash of the
+    messages they were searched for.
+    """
+
+    def __init__(self, directory=procedures_dir, remote_url=remote_url, cache_size=128,
+                 bundled_directory=bundled_dir, min_score=MIN_SCORE, sync_interval=SYNC_INTERVAL):
+        self.directory = directory
+        self.snapshot_path = os.path.join(directory, "procedures.json")
+        self.remote_url = remote_url
+        self.cache_size = cache_size
+        self.bundled_directory = bundled_directory
+        self.min_score = min_score
+        self.sync_interval = sync_interval
+
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()
+        self.syncing = False
+        self.last_sync = None
+
+        self.procedures = None
+        self.index = None
+
+    def search(self, messages, k=3, sync=True):
+        """
+        Returns up to `k` procedures relevant to `messages` (a list of OI messages), best first.
+        If `sync` is True and nothing matched, also fetches procedures for these messages from the remote search in the background.
+        """
+        key = hashlib.sha256(json.dumps(messages, sort_keys=True, default=str).encode()).hexdigest()
+
+        with self.lock:
+            if self.index is None:
+                self.load()
+
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+
+            results = self.index.search(messages_to_query(messages), k, self.min_score)
+
+            self.cache[key] = results
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+            # (Only for topics the snapshot doesn't cover yet, and not on every turn)
+            start_sync = (sync and not results and not self.syncing
+                          and (self.last_sync is None or time.monotonic() - self.last_sync >= self.sync_interval))
+            if start_sync:
+                self.syncing = True
+                self.last_sync = time.monotonic()
+
+        if start_sync:
+            threading.Thread(target=self.sync, args=(messages,), daemon=True).start()
+
+        return results
+
+    def load(self):
+        procedures = read_markdown_files(self.bundled_directory)
+
+        try:
+            with open(self.snapshot_path, "r") as file:
+                procedures += json.load(file)["procedures"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+        procedures += read_markdown_files(self.directory)
+
+        self.procedures = list(dict.fromkeys(procedures))
+        self.index = BM25Index(self.procedures)
+
+    def sync(self, messages):
+        """
+        Adds the remote search's procedures for `messages` to the snapshot.
+        """
+        try:
+            import requests
+            query = {"query": convert_to_openai_messages(messages)}
+            new_procedures = requests.post(self.remote_url, json=query, timeout=10).json()["procedures"]
+            self.add(new_procedures)
+        except:
+            # Offline, or the remote search is down. We'll try again next time
+            pass
+        finally:
+            with self.lock:
+                self.syncing = False
+
+    def add(self, new_procedures):
+        with self.lock:
+            if self.index is None:
+                self.load()
+
+            new_procedures = [p for p in dict.fromkeys(new_procedures) if p not in self.procedures]
+            if not new_procedures:
+                return
+
+            try:
+                with open(self.snapshot_path, "r") as file:
+                    snapshot = json.load(file)["procedures"]
+            except (OSError, ValueError, KeyError):
+                snapshot = []
+            snapshot += new_procedures
+
+            # Write to a temporary file first, so a crash can't leave half a snapshot behind
+            os.makedirs(self.directory, exist_ok=True)
+            temporary_path = self.snapshot_path + ".tmp"
+            with open(temporary_path, "w") as file:
+                json.dump({"procedures": snapshot}, file)
+            os.replace(temporary_path, self.snapshot_path)
+
+            self.procedures = self.procedures + new_procedures
+            self.index = BM25Index(self.procedures)
+            self.cache.clear()
+
+
+def read_markdown_files(directory):
+    documents = []
+    if os.path.isdir(directory):
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith(".md"):
+                with open(os.path.join(directory, filename), "r", encoding="utf-8") as file:
+                    documents.append(file.read())
+    return documents
+
+
+def messages_to_query(messages):
+    parts = []
+    for message in messages:
+        for key in ["message", "code", "output"]:
+            if message.get(key):
+                parts.append(message[key])
+    return "\n".join(parts)
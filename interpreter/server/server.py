@@ -0,0 +1,229 @@
+"""
+`interpreter --serve` hosts many independent sessions over HTTP.
+
+    POST   /sessions                 -> {"session_id": ...}
+    GET    /sessions/{id}            -> {"session_id": ..., "messages": [...], "usage": {...}} (see Interpreter.usage)
+    POST   /sessions/{id}/chat       -> streams chunks as server-sent events. Body: {"message": ...}
+    DELETE /sessions/{id}            -> closes the session and its code interpreters (409 while it's responding)
+
+Each session gets its own Interpreter, so messages and code interpreters are never shared.
+Sessions run headless, so notices (like "max budget exceeded") are streamed as {"notice": ...} chunks.
+Request bodies over MAX_BODY_SIZE bytes are refused.
+"""
+
+import asyncio
+import json
+import os
+import traceback
+from .session_manager import SessionManager
+from ..code_interpreters.kernel_pool import KernelPool
+from ..utils.display_markdown_message import display_markdown_message
+
+STATUS_TEXT = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large"}
+
+# (A chat message is text. Anything bigger than this isn't one)
+MAX_BODY_SIZE = 1024 * 1024
+
+# Never copied from the interpreter that started the server
+SESSION_STATE = ["messages", "conversation_filename"]
+
+
+class RequestTooLarge(Exception):
+    pass
+
+
+def serve(interpreter, host="127.0.0.1", port=8000, idle_timeout=1800, max_processes=64):
+    """
+    Serves sessions whose settings (model, system_message, etc.) are copied from `interpreter`.
+    """
+
+    # Nobody's watching the server's terminal (notices go to the client, in the chat stream),
+    # and `interpreter` already checked for updates. Set before any session's Interpreter is made, so they start that way
+    os.environ["OPEN_INTERPRETER_HEADLESS"] = "1"
+    os.environ["OPEN_INTERPRETER_NO_UPDATE_CHECK"] = "1"
+
+    # Every session takes its warm code interpreters from the same pool
+    kernel_pool = None
+    if interpreter.kernel_pool_size:
+        kernel_pool = KernelPool(size=interpreter.kernel_pool_size, languages=interpreter.kernel_pool_languages)
+
+    def create_interpreter():
+        session_interpreter = type(interpreter)()
+        for name, value in vars(interpreter).items():
+            if not name.startswith("_") and name not in SESSION_STATE:
+                setattr(session_interpreter, name, value)
+        session_interpreter._kernel_pool = kernel_pool
+        session_interpreter.headless = True
+        return session_interpreter
+
+    sessions = SessionManager(create_interpreter, idle_timeout=idle_timeout, max_processes=max_processes)
+
+    display_markdown_message(f"""> Serving Open Interpreter at `http://{host}:{port}`
+
+    **Code runs without approval in every session.** Only expose this server to people you'd trust with your machine.
+
+    Press `CTRL-C` to stop.
+    """)
+
+    try:
+        asyncio.run(run_server(sessions, host, port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sessions.close_all()
+        if kernel_pool:
+            kernel_pool.terminate()
+
+
+async def run_server(sessions, host, port):
+    server = await asyncio.start_server(lambda reader, writer: handle_connection(sessions, reader, writer), host, port)
+    eviction = asyncio.create_task(sessions.evict_periodically())
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        eviction.cancel()
+
+
+async def handle_connection(sessions, reader, writer):
+    try:
+        try:
+            method, path, body = await read_request(reader)
+        except (ValueError, UnicodeDecodeError, asyncio.IncompleteReadError):
+            await send_json(writer, 400, {"error": "Malformed request."})
+            return
+        except RequestTooLarge:
+            await send_json(writer, 413, {"error": f"Request bodies can be at most {MAX_BODY_SIZE} bytes."})
+            return
+
+        await route(sessions, method, path, body, writer)
+    except ConnectionError:
+        # The client went away
+        pass
+    finally:
+        writer.close()
+
+
+async def read_request(reader):
+    request_line = (await reader.readline()).decode()
+    method, path, _ = request_line.split(" ", 2)
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in [b"\r\n", b"\n", b""]:
+            break
+        key, _, value = line.decode().partition(":")
+        headers[key.strip().lower()] = value.strip()
+
+    content_length = int(headers.get("content-length", 0))
+    if content_length < 0:
+        raise ValueError("Negative Content-Length.")
+    if content_length > MAX_BODY_SIZE:
+        raise RequestTooLarge()
+    body = await reader.readexactly(content_length)
+    return method.upper(), path.split("?")[0].rstrip("/"), body
+
+
+async def route(sessions, method, path, body, writer):
+    parts = path.strip("/").split("/")
+
+    if parts[0] != "sessions" or len(parts) > 3:
+        await send_json(writer, 404, {"error": "Not found."})
+        return
+
+    # /sessions
+    if len(parts) == 1:
+        if method != "POST":
+            await send_json(writer, 405, {"error": "Use POST to create a session."})
+            return
+        session = sessions.create()
+        await send_json(writer, 201, {"session_id": session.id})
+        return
+
+    session = sessions.get(parts[1])
+    if session is None:
+        await send_json(writer, 404, {"error": "Unknown session."})
+        return
+
+    # /sessions/{id}
+    if len(parts) == 2:
+        if method == "GET":
+            session.touch()
+            await send_json(writer, 200, {"session_id": session.id, "messages": session.interpreter.messages, "usage": session.interpreter.usage()})
+        elif method == "DELETE":
+            # (Closing it would stop the code and clear the messages of the chat that's streaming)
+            if session.lock.locked():
+                await send_json(writer, 409, {"error": "This session is responding. Close it once it's done."})
+                return
+            sessions.close(session.id)
+            await send_json(writer, 200, {})
+        else:
+            await send_json(writer, 405, {"error": "Use GET or DELETE."})
+        return
+
+    # /sessions/{id}/chat
+    if parts[2] != "chat":
+        await send_json(writer, 404, {"error": "Not found."})
+    elif method != "POST":
+        await send_json(writer, 405, {"error": "Use POST to chat."})
+    else:
+        try:
+            message = json.loads(body or b"{}").get("message", "")
+        except (ValueError, AttributeError):
+            await send_json(writer, 400, {"error": "Body must be JSON, like {\"message\": \"...\"}."})
+            return
+        await stream_chat(sessions, session, message, writer)
+
+
+async def stream_chat(sessions, session, message, writer):
+    if session.lock.locked():
+        await send_json(writer, 409, {"error": "This session is already responding."})
+        return
+
+    try:
+        async with session.lock:
+            session.touch()
+            writer.write(b"HTTP/1.1 200 OK\r\n"
+                         b"Content-Type: text/event-stream\r\n"
+                         b"Cache-Control: no-cache\r\n"
+                         b"Connection: close\r\n\r\n")
+
+            chunks = session.interpreter.achat(message)
+            try:
+                async for chunk in chunks:
+                    session.touch()
+
+                    # The code interpreter is started after this chunk. If it's a new one, make room for it first
+                    if "executing" in chunk and chunk["executing"]["language"] not in session.interpreter._async_code_interpreters:
+                        if not await sessions.make_room(session):
+                            error = f"All {sessions.max_processes} code interpreter processes are busy. Try again later."
+                            writer.write(f"event: error\ndata: {json.dumps({'error': error})}\n\n".encode())
+                            break
+
+                    writer.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    await writer.drain()
+                else:
+                    writer.write(b"event: end\ndata: {}\n\n")
+            except ConnectionError:
+                raise
+            except Exception:
+                writer.write(f"event: error\ndata: {json.dumps({'error': traceback.format_exc()})}\n\n".encode())
+            finally:
+                # If the client went away (or there was no room), this stops the LLM and any running code
+                await chunks.aclose()
+                session.touch()
+    finally:
+        # Sessions waiting for room to start a code interpreter might have it now
+        await sessions.release()
+
+    await writer.drain()
+
+
+async def send_json(writer, status, data):
+    body = json.dumps(data).encode()
+    writer.write(f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+                 f"Content-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n"
+                 f"Connection: close\r\n\r\n".encode() + body)
+    await writer.drain()
@@ -0,0 +1,125 @@
+import asyncio
+import time
+import uuid
+
+class Session:
+    """
+    One user's conversation: its own Interpreter, with its own messages and code interpreters.
+    """
+    def __init__(self, interpreter):
+        self.id = uuid.uuid4().hex
+        self.interpreter = interpreter
+        self.last_active = time.monotonic()
+
+        # One chat at a time per session
+        self.lock = asyncio.Lock()
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+    def count_processes(self):
+        return len(self.interpreter._async_code_interpreters)
+
+    def stop_processes(self):
+        # Keeps the messages, so the conversation can continue (with fresh code interpreters)
+        for code_interpreter in self.interpreter._async_code_interpreters.values():
+            code_interpreter.terminate()
+        self.interpreter._async_code_interpreters = {}
+
+
+class SessionManager:
+    """
+    Hosts many independent sessions.
+
+    Sessions that sit idle for `idle_timeout` seconds are closed. At most `max_processes` code interpreter
+    processes are alive across all sessions: before a session starts one, the least recently used idle sessions
+    lose theirs, and if every process belongs to a busy session, it waits (up to `process_wait_timeout` seconds)
+    for one of them to finish.
+    """
+    def __init__(self, create_interpreter, idle_timeout=1800, max_processes=64, process_wait_timeout=60):
+        self.create_interpreter = create_interpreter
+        self.idle_timeout = idle_timeout
+        self.max_processes = max_processes
+        self.process_wait_timeout = process_wait_timeout
+        self.sessions = {}
+
+        # Notified whenever a session finishes responding, or is closed (so its processes might be free to stop)
+        self.released = asyncio.Condition()
+
+    def create(self):
+        session = Session(self.create_interpreter())
+        self.sessions[session.id] = session
+        return session
+
+    def get(self, session_id):
+        return self.sessions.get(session_id)
+
+    def close(self, session_id):
+        session = self.sessions.pop(session_id, None)
+        if session:
+            session.interpreter.reset()
+        return session
+
+    def count_processes(self):
+        return sum(session.count_processes() for session in self.sessions.values())
+
+    def evict_idle(self):
+        now = time.monotonic()
+        for session in list(self.sessions.values()):
+            if not session.lock.locked() and now - session.last_active > self.idle_timeout:
+                self.close(session.id)
+
+    def enforce_process_limit(self, keep=None, reserve=0):
+        """
+        Stops the code interpreters of the least recently used idle sessions
+        until there's room for `reserve` more under `max_processes` (never touching `keep`).
+        """
+        excess = self.count_processes() + reserve - self.max_processes
+        if excess <= 0:
+            return
+
+        idle_sessions = [session for session in self.sessions.values()
+                         if session is not keep and not session.lock.locked() and session.count_processes()]
+        for session in sorted(idle_sessions, key=lambda session: session.last_active):
+            excess -= session.count_processes()
+            session.stop_processes()
+            if excess <= 0:
+                break
+
+    async def make_room(self, session):
+        """
+        Waits until `session` can start another code interpreter without going over `max_processes`.
+        Returns False if there still isn't room after `process_wait_timeout` seconds.
+        """
+        deadline = time.monotonic() + self.process_wait_timeout
+        async with self.released:
+            while True:
+                self.enforce_process_limit(keep=session, reserve=1)
+                if self.count_processes() < self.max_processes:
+                    return True
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                try:
+                    await asyncio.wait_for(self.released.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def release(self):
+        """
+        Wakes up sessions waiting in `make_room`.
+        """
+        async with self.released:
+            self.released.notify_all()
+
+    async def evict_periodically(self, interval=60):
+        while True:
+            await asyncio.sleep(interval)
+            self.evict_idle()
+            self.enforce_process_limit()
+            await self.release()
+
+    def close_all(self):
+        for session_id in list(self.sessions):
+            self.close(session_id)
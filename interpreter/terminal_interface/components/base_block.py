@@ -1,20 +1,79 @@
+import threading
+import time
 from rich.live import Live
 from rich.console import Console
 
 class BaseBlock:
     """
     a visual "block" on the terminal.
+
+    Chunks can arrive much faster than anyone can read, so blocks are redrawn at most `frame_rate` times a second.
+    A refresh that comes too soon is drawn at the next frame (showing whatever the block holds by then).
     """
+
+    frame_rate = 30
+
     def __init__(self):
         self.live = Live(auto_refresh=False, console=Console(), vertical_overflow="visible")
         self.live.start()
 
+        # What the next frame will show, and the timer that will draw it
+        self.lock = threading.RLock()
+        self.next_frame = None
+        self.timer = None
+        self.last_draw = 0
+
+        # Time spent drawing, and how many frames were drawn (for the "render" span, see `interpreter.trace`)
+        self.render_time = 0
+        self.frames = 0
+
     def update_from_message(self, message):
         raise NotImplementedError("Subclasses must implement this method")
 
     def end(self):
-        self.refresh(cursor=False)
+        self.refresh(cursor=False, force=True)
         self.live.stop()
 
-    def refresh(self, cursor=True):
-        raise NotImplementedError("Subclasses must implement this method")
\ No newline at end of file
+    def refresh(self, cursor=True, force=False):
+        with self.lock:
+            # Take the block's contents now. The frame might be drawn on the timer's thread
+            self.next_frame = self.snapshot(cursor)
+
+            wait = self.last_draw + 1 / self.frame_rate - time.monotonic()
+            if force or wait <= 0:
+                self.draw()
+            elif self.timer is None:
+                self.timer = threading.Timer(wait, self.draw)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def draw(self):
+        with self.lock:
+            if self.timer:
+                self.timer.cancel()
+                self.timer = None
+
+            frame = self.next_frame
+            self.next_frame = None
+            if frame is None:
+                # (It was drawn already)
+                return
+
+            self.last_draw = time.monotonic()
+            renderable = self.render(frame)
+            if renderable is not None:
+                self.live.update(renderable, refresh=True)
+            self.render_time += time.monotonic() - self.last_draw
+            self.frames += 1
+
+    def snapshot(self, cursor):
+        """
+        Returns what the block would show right now, as a dict for `render`.
+        """
+        raise NotImplementedError("Subclasses must implement this method")
+
+    def render(self, frame):
+        """
+        Returns a renderable for a `snapshot` (or None, to leave the block as it is).
+        """
+        raise NotImplementedError("Subclasses must implement this method")
@@ -0,0 +1,36 @@
+from rich.segment import Segment
+
+class CachedRender:
+  """
+  A renderable made of pieces stacked on top of each other, like the lines of a code block.
+
+  `pieces` is a list of (key, make_renderable), where `key` is whatever decides how the piece looks.
+  A piece that looks like it did in the last frame isn't rendered again, its segments are reused from `cache`
+  (a dict the block keeps between frames). So a growing block only renders what changed, usually its end.
+
+  With `gap=True` the pieces are joined like markdown joins its blocks, with a line break between them.
+  """
+
+  def __init__(self, cache, pieces, gap=False):
+    self.cache = cache
+    self.pieces = pieces
+    self.gap = gap
+
+  def __rich_console__(self, console, options):
+    rendered = {}
+
+    for i, (key, make_renderable) in enumerate(self.pieces):
+      key = (key, options.max_width)
+      segments = rendered.get(key) or self.cache.get(key)
+      if segments is None:
+        segments = list(console.render(make_renderable(), options))
+      rendered[key] = segments
+
+      # (Blocks like quotes already start with a line break when rendered on their own)
+      if self.gap and i > 0 and not (segments and segments[0].text == "\n"):
+        yield Segment.line()
+      yield from segments
+
+    # Only keep what's on screen now, so the cache doesn't collect every version of the last line
+    self.cache.clear()
+    self.cache.update(rendered)
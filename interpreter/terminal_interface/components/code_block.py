@@ -1,9 +1,18 @@
+from functools import lru_cache, partial
+from pygments.lexers import get_lexer_by_name
+from pygments.token import Comment, Error, String
+from pygments.util import ClassNotFound
 from rich.panel import Panel
 from rich.box import MINIMAL
 from rich.syntax import Syntax
-from rich.table import Table
+from rich.padding import Padding
+from rich.text import Text
 from rich.console import Group
 from .base_block import BaseBlock
+from .cached_render import CachedRender
+
+MONOKAI = Syntax.get_theme("monokai")
+BW = Syntax.get_theme("bw")
 
 class CodeBlock(BaseBlock):
   """
@@ -22,56 +31,151 @@ class CodeBlock(BaseBlock):
     self.active_line = None
     self.margin_top = True
 
-  def refresh(self, cursor=True):
+    # Rendered lines of code, reused until they change
+    self.line_cache = {}
+
+    # The last code we highlighted (and its language), and its highlighted lines
+    self.highlighted_code = None
+    self.highlighted_language = None
+    self.highlighted_lines = []
+    self.highlighted_fully = False
+
+  def snapshot(self, cursor):
+    return {
+      "code": self.code,
+      "language": self.language,
+      "active_line": self.active_line,
+      # (`output` can be a string or an OutputBuffer, which keeps changing, so we take its text now)
+      "output": str(self.output),
+      "margin_top": self.margin_top,
+      "cursor": cursor,
+    }
+
+  def render(self, frame):
     # Get code, return if there is none
-    code = self.code
+    code = frame["code"]
     if not code:
-      return
-    
-    # Create a table for the code
-    code_table = Table(show_header=False,
-                       show_footer=False,
-                       box=None,
-                       padding=0,
-                       expand=True)
-    code_table.add_column()
-
-    # Add cursor    
-    if cursor:
+      return None
+
+    # Add cursor
+    if frame["cursor"]:
       code += "█"
 
-    # Add each line of code to the table
-    code_lines = code.strip().split('\n')
-    for i, line in enumerate(code_lines, start=1):
-      if i == self.active_line:
+    # Highlight the code, then make each line a piece. Only lines that changed since the last frame
+    # get rendered again, so moving the active line only restyles two rows
+    lines = []
+    highlighted = self.highlight(code.strip(), frame["language"], streaming=frame["cursor"])
+    for i, tokens in enumerate(highlighted, start=1):
+      if i == frame["active_line"]:
         # This is the active line, print it with a white background
-        syntax = Syntax(line, self.language, theme="bw", line_numbers=False, word_wrap=True)
-        code_table.add_row(syntax, style="black on white")
+        lines.append(((frame["language"], tokens, True), partial(line_of_code, tokens, BW, "black on white")))
       else:
         # This is not the active line, print it normally
-        syntax = Syntax(line, self.language, theme="monokai", line_numbers=False, word_wrap=True)
-        code_table.add_row(syntax)
+        lines.append(((frame["language"], tokens, False), partial(line_of_code, tokens, MONOKAI, MONOKAI.get_background_style())))
 
     # Create a panel for the code
-    code_panel = Panel(code_table, box=MINIMAL, style="on #272722")
+    code_panel = Panel(CachedRender(self.line_cache, lines), box=MINIMAL, style="on #272722")
 
     # Create a panel for the output (if there is any)
-    if self.output == "" or self.output == "None":
+    output = frame["output"]
+    if output == "" or output == "None":
       output_panel = ""
     else:
-      output_panel = Panel(self.output,
+      output_panel = Panel(output,
                            box=MINIMAL,
                            style="#FFFFFF on #3b3b37")
 
-    # Create a group with the code table and output panel
+    # Create a group with the code panel and output panel
     group_items = [code_panel, output_panel]
-    if self.margin_top:
+    if frame["margin_top"]:
         # This adds some space at the top. Just looks good!
         group_items = [""] + group_items
     group = Group(*group_items)
 
-    # Update the live display
-    self.live.update(group)
-    self.live.refresh()
+    return group
+
+  def highlight(self, code, language, streaming):
+    """
+    Returns the lines of `code` as tuples of (token type, text).
+
+    The code is lexed in one pass, so strings and comments that span lines look right.
+    While it's streaming in, only the part that changed since the last frame is lexed again,
+    starting from the last line before the change that begins at the top level (not inside a string, say).
+    That's a guess, so once the code stops changing it gets lexed again from the start.
+    """
+    code = code.replace("\r\n", "\n").replace("\r", "\n")
+    if code == self.highlighted_code and language == self.highlighted_language:
+      if streaming or self.highlighted_fully:
+        return self.highlighted_lines
 
+    start = 0
+    if streaming and language == self.highlighted_language and self.highlighted_code is not None:
+      old_lines = self.highlighted_code.split("\n")
+      new_lines = code.split("\n")
 
+      # Find the first line that changed (usually the last one, as the code grows)
+      last = min(len(old_lines), len(new_lines), len(self.highlighted_lines)) - 1
+      while start < last and old_lines[start] == new_lines[start]:
+        start += 1
+      while start > 0 and not starts_at_top_level(self.highlighted_lines[start]):
+        start -= 1
+
+    if start > 0:
+      highlighted = self.highlighted_lines[:start] + highlight_lines("\n".join(new_lines[start:]), language)
+    else:
+      highlighted = highlight_lines(code, language)
+
+    self.highlighted_code = code
+    self.highlighted_language = language
+    self.highlighted_lines = highlighted
+    self.highlighted_fully = start == 0
+    return highlighted
+
+
+@lru_cache(maxsize=None)
+def get_lexer(language):
+  """
+  Finds the Pygments lexer for a language once (it's a slow lookup), falling back to plain text.
+  """
+  try:
+    return get_lexer_by_name(language, stripnl=False, ensurenl=True, tabsize=4)
+  except ClassNotFound:
+    return get_lexer_by_name("text", stripnl=False, ensurenl=True, tabsize=4)
+
+
+def highlight_lines(code, language):
+  """
+  Lexes code in one pass, and returns its lines as tuples of (token type, text).
+  """
+  lines = [[]]
+  for token_type, value in get_lexer(language).get_tokens(code):
+    parts = value.split("\n")
+    for i, part in enumerate(parts):
+      if i > 0:
+        lines.append([])
+      if part:
+        lines[-1].append((token_type, part))
+
+  # (The lexer ends the code with a line break, which leaves an empty line at the end)
+  if not lines[-1]:
+    lines.pop()
+  return [tuple(line) for line in lines]
+
+
+def starts_at_top_level(tokens):
+  """
+  Guesses if a highlighted line starts outside of any string, comment, block, etc.
+  """
+  if not tokens:
+    return False
+  token_type, value = tokens[0]
+  return not value[0].isspace() and token_type not in String and token_type not in Comment and token_type not in Error
+
+
+def line_of_code(tokens, theme, style):
+  """
+  Styles a highlighted line of code with a theme, like Rich's `Syntax` would, on a full-width background of `style`.
+  """
+  text = Text(style=theme.get_background_style(), justify="left", tab_size=4)
+  text.append_tokens((value, theme.get_style_for_token(token_type)) for token_type, value in tokens)
+  return Padding(text, 0, style=style)
@@ -1,8 +1,10 @@
+from functools import partial
 from rich.panel import Panel
 from rich.markdown import Markdown
 from rich.box import MINIMAL
 import re
 from .base_block import BaseBlock
+from .cached_render import CachedRender
 
 class MessageBlock(BaseBlock):
 
@@ -13,18 +15,25 @@ class MessageBlock(BaseBlock):
     self.message = ""
     self.has_run = False
 
-  def refresh(self, cursor=True):
+    # Rendered markdown blocks, reused until they change
+    self.block_cache = {}
+
+  def snapshot(self, cursor):
+    return {"message": self.message, "cursor": cursor}
+
+  def render(self, frame):
     # De-stylize any code blocks in markdown,
     # to differentiate from our Code Blocks
-    content = textify_markdown_code_blocks(self.message)
-    
-    if cursor:
+    content = textify_markdown_code_blocks(frame["message"])
+
+    if frame["cursor"]:
       content += "█"
-      
-    markdown = Markdown(content.strip())
-    panel = Panel(markdown, box=MINIMAL)
-    self.live.update(panel)
-    self.live.refresh()
+
+    # Render the markdown a block (paragraph, list, code...) at a time.
+    # As the message grows, only its last block changes, so that's usually all we render
+    blocks = [(block, partial(Markdown, block)) for block in split_markdown_blocks(content.strip())]
+    panel = Panel(CachedRender(self.block_cache, blocks, gap=True), box=MINIMAL)
+    return panel
 
 
 def textify_markdown_code_blocks(text):
@@ -46,3 +55,40 @@ def textify_markdown_code_blocks(text):
         lines[i] = replacement
 
   return '\n'.join(lines)
+
+
+def split_markdown_blocks(text):
+  """
+  Splits markdown at the blank lines between its top level blocks, so each one renders the same on its own.
+  Blank lines inside code blocks, before indented lines and between list items don't count.
+  """
+  blocks = []
+  block = []
+  inside_code_block = False
+  after_blank_line = False
+  last_line = ""
+
+  for line in text.split('\n'):
+    stripped = line.strip()
+
+    if not inside_code_block and not stripped:
+      after_blank_line = True
+      block.append(line)
+      continue
+
+    if (after_blank_line
+        and not line[0].isspace()
+        and not re.match(r'^([-*+]|\d+[.)])(\s|$)', line)
+        # (A horizontal rule isn't followed by a blank line when rendered, so keep it with the next block)
+        and not re.match(r'^([-*_])(\s*\1){2,}\s*$', last_line)):
+      blocks.append('\n'.join(block).strip())
+      block = []
+    after_blank_line = False
+
+    if stripped.startswith("```") or stripped.startswith("~~~"):
+      inside_code_block = not inside_code_block
+    block.append(line)
+    last_line = stripped
+
+  blocks.append('\n'.join(block).strip())
+  return [block for block in blocks if block]
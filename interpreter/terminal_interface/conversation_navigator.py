@@ -2,22 +2,22 @@
 This file handles conversations.
 """
 
-import appdirs
 import inquirer
 import subprocess
 import platform
 import os
-import json
+from datetime import datetime
 from .render_past_conversation import render_past_conversation
 from ..utils.display_markdown_message import display_markdown_message
+from ..utils.conversation_log import load_conversation
+from ..utils.conversation_catalog import ConversationCatalog, PAGE_SIZE, SORTS
 
 def conversation_navigator(interpreter):
 
-    data_dir = appdirs.user_data_dir("Open Interpreter")
-    conversations_dir = os.path.join(data_dir, "conversations")
+    conversations_dir = interpreter.conversation_history_path
 
     display_markdown_message(f"""> Conversations are stored in "`{conversations_dir}`".
-    
+
     Select a conversation to resume.
     """)
 
@@ -26,48 +26,89 @@ def conversation_navigator(interpreter):
         print(f"No conversations found in {conversations_dir}")
         return None
 
-    # Get list of all JSON files in the directory
-    json_files = [f for f in os.listdir(conversations_dir) if f.endswith('.json')]
-
-    # Make a dict that maps reformatted "First few words... (September 23rd)" -> "First_few_words__September_23rd.json" (original file name)
-    readable_names_and_filenames = {}
-    for filename in json_files:
-        name = filename.replace(".json", "").replace(".JSON", "").replace("__", "... (").replace("_", " ") + ")"
-        readable_names_and_filenames[name] = filename
-
-    # Add the option to open the folder. This doesn't map to a filename, we'll catch it
-    readable_names_and_filenames["> Open folder"] = None
-
-    # Use inquirer to let the user select a file
-    questions = [
-        inquirer.List('name',
-                      message="",
-                      choices=readable_names_and_filenames.keys(),
-                      ),
-    ]
-    answers = inquirer.prompt(questions)
-
-    # If the user selected to open the folder, do so and return
-    if answers['name'] == "> Open folder":
-        open_folder(conversations_dir)
-        return
-
-    selected_filename = readable_names_and_filenames[answers['name']]
-
-    # Open the selected file and load the JSON data
-    with open(os.path.join(conversations_dir, selected_filename), 'r') as f:
-        messages = json.load(f)
+    # The catalog knows every conversation's title, size, etc., so we only open the one that's picked
+    catalog = ConversationCatalog(conversations_dir)
+    catalog.sync()
+
+    page = 0
+    sort = "updated"
+    query = None
+
+    while True:
+        if query:
+            conversations = catalog.search(query, offset=page * PAGE_SIZE, limit=PAGE_SIZE + 1)
+        else:
+            conversations = catalog.list(sort=sort, offset=page * PAGE_SIZE, limit=PAGE_SIZE + 1)
+
+        # Choices are (label, value). Anything that isn't a filename is an action, which we'll catch
+        choices = [(describe_conversation(conversation), conversation["filename"]) for conversation in conversations[:PAGE_SIZE]]
+        if len(conversations) > PAGE_SIZE:
+            choices.append(("> Next page", "next"))
+        if page > 0:
+            choices.append(("> Previous page", "previous"))
+        choices.append(("> Search", "search"))
+        if query:
+            choices.append(("> Show all", "all"))
+        else:
+            choices.append(("> Sort by...", "sort"))
+        choices.append(("> Open folder", "folder"))
+
+        heading = f'Matching "{query}"' if query else f"{catalog.count()} conversations, by {sort}"
+        answers = inquirer.prompt([inquirer.List('filename', message=heading, choices=choices)])
+        if not answers:
+            # (CTRL-C)
+            return
+
+        selected = answers['filename']
+
+        if selected == "next":
+            page += 1
+        elif selected == "previous":
+            page -= 1
+        elif selected == "search":
+            query = input("  Search for: ").strip() or None
+            page = 0
+        elif selected == "all":
+            query = None
+            page = 0
+        elif selected == "sort":
+            answers = inquirer.prompt([inquirer.List('sort', message="Sort by", choices=list(SORTS), default=sort)])
+            if answers:
+                sort = answers['sort']
+            page = 0
+        elif selected == "folder":
+            open_folder(conversations_dir)
+            return
+        else:
+            break
+
+    # Load the conversation (its JSON file, plus anything in its log that wasn't compacted into it yet)
+    messages = load_conversation(os.path.join(conversations_dir, selected))
 
     # Pass the data into render_past_conversation
     render_past_conversation(messages)
 
     # Set the interpreter's settings to the loaded messages
     interpreter.messages = messages
-    interpreter.conversation_filename = selected_filename
+    interpreter.conversation_filename = selected
 
     # Start the chat
     interpreter.chat()
 
+def describe_conversation(conversation):
+    # Like "Plot AAPL's stock price (Sep 23, 12 messages, 14,210 tokens, $0.43)"
+    date = datetime.fromtimestamp(conversation["updated"]).strftime("%b %d")
+    details = [date, f"{conversation['messages']} messages"]
+
+    # (Conversations saved before usage was recorded don't have any)
+    tokens = (conversation["prompt_tokens"] or 0) + (conversation["completion_tokens"] or 0)
+    if tokens:
+        details.append(f"{tokens:,} tokens")
+    if conversation["cost"]:
+        details.append(f"${conversation['cost']:.2f}")
+
+    return f"{conversation['title']} ({', '.join(details)})"
+
 def open_folder(path):
     if platform.system() == "Windows":
         os.startfile(path)
@@ -75,4 +116,4 @@ def open_folder(path):
         subprocess.run(["open", path])
     else:
         # Assuming it's Linux
-        subprocess.run(["xdg-open", path])
\ No newline at end of file
+        subprocess.run(["xdg-open", path])
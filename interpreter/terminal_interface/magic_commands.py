@@ -38,6 +38,8 @@ def handle_help(self, arguments):
       "%debug [true/false]": "Toggle debug mode. Without arguments or with 'true', it enters debug mode. With 'false', it exits debug mode.",
       "%reset": "Resets the current session.",
       "%undo": "Remove previous messages and its response from the message history.",
+      "%usage": "Shows the tokens and cost of this session's LLM calls.",
+      "%search [query]": "Searches the messages, code and outputs of past conversations.",
       "%save_message [path]": "Saves messages to a specified JSON path. If no path is provided, it defaults to 'messages.json'.",
       "%load_message [path]": "Loads messages from a specified JSON path. If no path is provided, it defaults to 'messages.json'.",
       "%help": "Show this help message.",
@@ -100,6 +102,48 @@ def handle_load_message(self, json_path):
 
     display_markdown_message(f"> messages json loaded from {os.path.abspath(json_path)}")
 
+def handle_usage(self, arguments):
+    usage = self.usage()
+    if not usage["calls"]:
+      display_markdown_message("> No LLM calls yet")
+      return
+
+    def cost(value):
+      return "?" if value is None else f"${value:.4f}"
+
+    rows = [
+      "| # | Model | Context tokens | Sent | Completion | Cost |",
+      "|---|---|---|---|---|---|",
+    ]
+    for number, call in enumerate(usage["calls"], start=1):
+      rows.append(f"| {number} | {call['model']} | {call['context_tokens']} | {call['prompt_tokens']} | {call['completion_tokens']} | {cost(call['cost'])} |")
+    rows.append(f"| **Total** | | {usage['context_tokens']} | {usage['prompt_tokens']} | {usage['completion_tokens']} | {cost(usage['cost'])} |")
+
+    display_markdown_message("\n".join(rows))
+    display_markdown_message("> Token counts are estimates. Context tokens are the whole conversation, before it was trimmed to fit the model's context window")
+
+def handle_search(self, query):
+    if not query:
+      display_markdown_message("> Usage: `%search [query]`")
+      return
+
+    results = self.search(query)
+    if not results:
+      display_markdown_message(f"> Nothing found for `{query}`")
+      return
+
+    for result in results:
+      content = result["content"]
+      if len(content) > 500:
+        content = content[:500] + "\n..."
+      heading = f"**{result['title']}** (message {result['position'] + 1}, {result['kind']})"
+      if result["kind"] == "message":
+        display_markdown_message(f"{heading}\n\n{content}")
+      else:
+        # (Code and outputs keep their formatting)
+        language = result["language"] if result["kind"] == "code" else ""
+        display_markdown_message(f"{heading}\n\n```{language or ''}\n{content}\n```")
+
 def handle_magic_command(self, user_input):
     # split the command into the command and the arguments, by the first whitespace
     switch = {
@@ -109,6 +153,8 @@ def handle_magic_command(self, user_input):
       "save_message": handle_save_message,
       "load_message": handle_load_message,
       "undo": handle_undo,
+      "usage": handle_usage,
+      "search": handle_search,
     }
 
     user_input = user_input[1:].strip()  # Capture the part after the `%`
@@ -7,8 +7,8 @@ from .components.code_block import CodeBlock
 from .components.message_block import MessageBlock
 from .magic_commands import handle_magic_command
 from ..utils.display_markdown_message import display_markdown_message
-from ..utils.truncate_output import truncate_output
 from ..utils.scan_code import scan_code
+import time
 
 
 def terminal_interface(interpreter, message):
@@ -57,6 +57,9 @@ def terminal_interface(interpreter, message):
         # In the event we get code -> output -> code again
         ran_code_block = False
         render_cursor = False
+
+        # The blocks drawn this turn, for the "render" span
+        turn_blocks = []
             
         try:
             for chunk in interpreter.chat(message, display=False, stream=True):
@@ -67,20 +70,24 @@ def terminal_interface(interpreter, message):
                 if "message" in chunk:
                     if active_block is None:
                         active_block = MessageBlock()
+                        turn_blocks.append(active_block)
                     if active_block.type != "message":
                         active_block.end()
                         active_block = MessageBlock()
+                        turn_blocks.append(active_block)
                     active_block.message += chunk["message"]
 
                 # Code
                 if "code" in chunk or "language" in chunk:
                     if active_block is None:
                         active_block = CodeBlock()
+                        turn_blocks.append(active_block)
                     if active_block.type != "code" or ran_code_block:
                         # If the last block wasn't a code block,
                         # or it was, but we already ran it:
                         active_block.end()
                         active_block = CodeBlock()
+                        turn_blocks.append(active_block)
                     ran_code_block = False
                     render_cursor = True
                 
@@ -126,6 +133,7 @@ def terminal_interface(interpreter, message):
                             # Create a new, identical block where the code will actually be run
                             # Conveniently, the chunk includes everything we need to do this:
                             active_block = CodeBlock()
+                            turn_blocks.append(active_block)
                             active_block.margin_top = False # <- Aesthetic choice
                             active_block.language = chunk["executing"]["language"]
                             active_block.code = chunk["executing"]["code"]
@@ -138,24 +146,30 @@ def terminal_interface(interpreter, message):
                             break
 
                 # Output
-                if "output" in chunk:
+                if "output" in chunk or "partial_output" in chunk:
                     ran_code_block = True
                     render_cursor = False
-                    active_block.output += "\n" + chunk["output"]
-                    active_block.output = active_block.output.strip() # <- Aesthetic choice
-                    
-                    # Truncate output
-                    active_block.output = truncate_output(active_block.output, interpreter.max_output)
+
+                    # respond() collects the output (keeping the start and end of long outputs) into the message as it runs.
+                    # The block shows that same buffer. (Output from outside of it, like a traceback from starting the code, is all in one chunk)
+                    if interpreter._output_buffer is not None:
+                        active_block.output = interpreter._output_buffer
+                    elif "output" in chunk:
+                        active_block.output = chunk["output"]
 
                 if active_block:
                     active_block.refresh(cursor=render_cursor)
 
                 yield chunk
 
+                if "end_of_execution" in chunk:
+                    yield from record_render_span(interpreter, turn_blocks)
+
             # (Sometimes -- like if they CTRL-C quickly -- active_block is still None here)
             if active_block:
                 active_block.end()
                 active_block = None
+            yield from record_render_span(interpreter, turn_blocks)
 
             if not interactive:
                 # Don't loop
@@ -166,4 +180,17 @@ def terminal_interface(interpreter, message):
             if active_block:
                 active_block.end()
                 active_block = None
-            continue
\ No newline at end of file
+            continue
+
+def record_render_span(interpreter, blocks):
+    """
+    If the interpreter is tracing, records how long this turn's `blocks` spent drawing
+    (and yields the span, like the chat stream's other spans). Then forgets the blocks.
+    """
+    tracer = interpreter._get_tracer()
+    if tracer and blocks:
+        render_time = sum(block.render_time for block in blocks)
+        tracer.record("render", time.time() - render_time, render_time,
+                      blocks=len(blocks), frames=sum(block.frames for block in blocks))
+        yield from interpreter._pop_events()
+    blocks.clear()
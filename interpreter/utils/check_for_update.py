@@ -1,13 +1,57 @@
-import requests
-import pkg_resources
+import json
+import os
+import threading
+import time
+from importlib import metadata
+import appdirs
 from packaging import version
 
+update_check_path = os.path.join(appdirs.user_data_dir("Open Interpreter"), "update_check.json")
+
+# How long a check stays fresh before we ask PyPI again
+update_check_ttl = 24 * 60 * 60
+
 def check_for_update():
-    # Fetch the latest version from the PyPI API
-    response = requests.get(f'https://pypi.org/pypi/open-interpreter/json')
-    latest_version = response.json()['info']['version']
+    """
+    Returns True if a newer version is on PyPI. Never touches the network itself:
+    it answers from the last check's cached result, and refreshes that cache in a
+    background thread once it's older than `update_check_ttl`.
+    """
+    cached = read_cached_update_check()
+
+    if cached is None or time.time() - cached["checked_at"] > update_check_ttl:
+        threading.Thread(target=refresh_update_check, daemon=True).start()
+
+    if cached is None:
+        return False
+
+    # Compare against the version we're running now, in case we were upgraded since the check
+    current_version = metadata.version("open-interpreter")
+    return version.parse(cached["latest_version"]) > version.parse(current_version)
+
+
+def read_cached_update_check():
+    try:
+        with open(update_check_path, "r") as file:
+            cached = json.load(file)
+        return {"checked_at": float(cached["checked_at"]), "latest_version": str(cached["latest_version"])}
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def refresh_update_check():
+    try:
+        import requests
 
-    # Get the current version using pkg_resources
-    current_version = pkg_resources.get_distribution("open-interpreter").version
+        # Fetch the latest version from the PyPI API
+        response = requests.get('https://pypi.org/pypi/open-interpreter/json', timeout=10)
+        latest_version = response.json()['info']['version']
 
-    return version.parse(latest_version) > version.parse(current_version)
\ No newline at end of file
+        os.makedirs(os.path.dirname(update_check_path), exist_ok=True)
+        temporary_path = update_check_path + ".tmp"
+        with open(temporary_path, "w") as file:
+            json.dump({"checked_at": time.time(), "latest_version": latest_version}, file)
+        os.replace(temporary_path, update_check_path)
+    except:
+        # Offline, or PyPI is down. We'll try again next launch
+        pass
@@ -0,0 +1,193 @@
+import re
+
+# Leading whitespace, a run of fence characters, and whatever follows on the line
+FENCE_LINE = re.compile(r"([ \t]*)(`+|~+)?(.*)")
+
+
+class CodeFenceParser:
+    """
+    Finds markdown code blocks in text as it streams in, one token at a time.
+
+    `.feed(text)` returns a list of events:
+        ("message", text)     text outside of code blocks
+        ("language", name)    a code block opened (defaults to "python" if no language was given)
+        ("code", text)        code inside the block
+        ("end_code", None)    the code block closed
+
+    Fences are ``` or ~~~ (or longer) at the start of a line, and a block only closes on a fence
+    of the same character that's at least as long. Fences split across tokens are fine: at the start
+    of a line we hold back only as much as could still turn out to be a fence, so each token costs
+    about its own length. Call `.flush()` when the stream ends.
+    """
+
+    def __init__(self):
+        self.inside_code_block = False
+        self.fence = None
+
+        self.at_line_start = True
+        # The start of the current line, held back while it could still be a fence
+        self.held = ""
+        # The info string (language) after an opening fence, while we wait for its newline
+        self.info = None
+        # Inside code, the newline ending the previous line. Held back in case the next line is the closing fence
+        self.pending_newline = False
+
+    def feed(self, text):
+        events = []
+        i = 0
+
+        while i < len(text):
+            if self.info is not None:
+                end = text.find("\n", i)
+                if end == -1:
+                    self.info += text[i:]
+                    break
+                self.info += text[i:end]
+                i = end + 1
+                self.open_code_block(events)
+
+            elif self.at_line_start:
+                i = self.read_line_start(text, i, events)
+
+            else:
+                # Middle of a line. Nothing here can be a fence, so pass it straight through
+                end = text.find("\n", i)
+                if end == -1:
+                    self.write(events, text[i:])
+                    break
+                self.write(events, text[i:end])
+                self.end_line(events)
+                i = end + 1
+
+        return merge_events(events)
+
+    def flush(self):
+        """
+        Returns the events for anything still held back once the stream is over.
+        """
+        events = []
+        if self.info is not None:
+            self.open_code_block(events)
+        elif self.inside_code_block and self.classify(self.held, complete=True) == "fence":
+            # LLMs often end on the closing fence, without a newline after it
+            self.close_code_block(events)
+        elif self.held:
+            self.write(events, self.held)
+        self.held = ""
+        return merge_events(events)
+
+    def read_line_start(self, text, i, events):
+        while i < len(text):
+            char = text[i]
+            i += 1
+
+            if char == "\n":
+                if self.classify(self.held, complete=True) == "fence":
+                    if self.inside_code_block:
+                        self.close_code_block(events)
+                    else:
+                        self.info = self.held
+                        self.held = ""
+                        self.open_code_block(events)
+                else:
+                    self.write(events, self.held)
+                    self.end_line(events)
+                self.held = ""
+                return i
+
+            self.held += char
+            kind = self.classify(self.held, complete=False)
+
+            if kind == "maybe":
+                continue
+
+            if kind == "fence":
+                # An opening fence. The rest of the line is the info string
+                self.info = self.held
+                self.held = ""
+            else:
+                self.write(events, self.held)
+                self.held = ""
+            self.at_line_start = False
+            return i
+
+        return i
+
+    def classify(self, line, complete):
+        """
+        Is `line` a fence ("fence"), not a fence ("text"), or can't we tell yet ("maybe")?
+        """
+        _, run, rest = FENCE_LINE.match(line).groups()
+        run = run or ""
+
+        if self.inside_code_block:
+            # Closing fences: the same character, at least as long, then only whitespace
+            if (run and run[0] != self.fence[0]) or rest.strip(" \t"):
+                return "text"
+            if rest and len(run) < len(self.fence):
+                return "text"
+            if not complete:
+                return "maybe"
+            return "fence" if len(run) >= len(self.fence) else "text"
+
+        # Opening fences: 3 or more characters, then an info string (which can't contain backticks for ```)
+        if not rest:
+            if not complete:
+                return "maybe"
+            return "fence" if len(run) >= 3 else "text"
+        if len(run) < 3 or (run[0] == "`" and "`" in rest):
+            return "text"
+        return "fence"
+
+    def open_code_block(self, events):
+        _, run, info = FENCE_LINE.match(self.info).groups()
+        self.info = None
+
+        language = info.strip().split(" ")[0]
+        events.append(("language", language or "python"))
+
+        self.inside_code_block = True
+        self.fence = run
+        self.pending_newline = False
+        self.at_line_start = True
+
+    def close_code_block(self, events):
+        events.append(("end_code", None))
+        self.inside_code_block = False
+        self.fence = None
+        self.pending_newline = False
+        self.at_line_start = True
+
+    def write(self, events, content):
+        if not self.inside_code_block:
+            if content:
+                events.append(("message", content))
+            return
+
+        if content and self.pending_newline:
+            content = "\n" + content
+            self.pending_newline = False
+        if content:
+            events.append(("code", content))
+
+    def end_line(self, events):
+        if self.inside_code_block:
+            if self.pending_newline:
+                events.append(("code", "\n"))
+            self.pending_newline = True
+        else:
+            events.append(("message", "\n"))
+        self.at_line_start = True
+
+
+def merge_events(events):
+    """
+    Joins consecutive message or code events, so one token makes as few chunks as possible.
+    """
+    merged = []
+    for kind, value in events:
+        if merged and kind in ["message", "code"] and merged[-1][0] == kind:
+            merged[-1] = (kind, merged[-1][1] + value)
+        else:
+            merged.append((kind, value))
+    return merged
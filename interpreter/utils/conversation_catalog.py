@@ -0,0 +1,394 @@
+"""
+An index of saved conversations (catalog.sqlite3, in the conversations folder), so `--conversations` can list,
+sort and search them without opening every file.
+
+Each conversation gets a row (title, when it was started and last saved, how many messages it has, the models
+it used, its token usage and its size on disk), updated every time the conversation is saved.
+Titles and user messages are full-text searchable.
+
+Every message, code cell and output is also indexed as a "cell", so past work can be searched (see `search_cells`,
+`interpreter.search()` and %search): by keywords (BM25, with FTS5), and, with an embedding model, by meaning too.
+Saves only index the messages that changed.
+
+Conversations saved before the catalog existed (or changed without it) are picked up by `sync()`.
+"""
+
+import os
+import sqlite3
+import time
+from collections import defaultdict
+from .conversation_log import get_log_path, load_conversation
+from .usage_ledger import load_usage
+from .error_pattern import ERROR_PATTERN
+from ..rag.bm25_index import tokenize, STOPWORDS
+
+PAGE_SIZE = 20
+
+SORTS = {
+    "updated": "updated DESC",
+    "created": "created DESC",
+    "messages": "messages DESC",
+    "tokens": "prompt_tokens + completion_tokens DESC",
+    "size": "size DESC",
+    "title": "title COLLATE NOCASE",
+}
+
+COLUMNS = ["filename", "title", "created", "updated", "messages", "models", "prompt_tokens", "completion_tokens", "cost", "size"]
+
+CELL_COLUMNS = ["filename", "title", "position", "kind", "role", "language", "failed", "content"]
+
+# Only the start of long cells is embedded
+EMBED_CHARACTERS = 2000
+
+
+class ConversationCatalog:
+    def __init__(self, directory, embedding_model=None):
+        self.directory = directory
+        self.embedding_model = embedding_model
+        os.makedirs(directory, exist_ok=True)
+
+        # Cell vectors, loaded the first time we search by meaning: (cell ids, matrix)
+        self.vectors = None
+
+        # (Many sessions can share a catalog. WAL lets them read while one writes, and makes saves cheap)
+        self.connection = sqlite3.connect(os.path.join(directory, "catalog.sqlite3"), timeout=10, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS conversations (
+                    id INTEGER PRIMARY KEY,
+                    filename TEXT UNIQUE,
+                    title TEXT,
+                    created REAL,
+                    updated REAL,
+                    messages INTEGER,
+                    models TEXT,
+                    prompt_tokens INTEGER,
+                    completion_tokens INTEGER,
+                    cost REAL,
+                    size INTEGER
+                )""")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS conversations_updated ON conversations (updated)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS conversations_created ON conversations (created)")
+
+            # Full-text search, if this SQLite has FTS5 (most do). Otherwise we fall back to LIKE
+            # (A conversation's text has the same rowid as its row in `conversations`)
+            try:
+                self.connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS conversation_text USING fts5(title, text)")
+                self.full_text = True
+            except sqlite3.OperationalError:
+                self.connection.execute("CREATE TABLE IF NOT EXISTS conversation_text (rowid INTEGER PRIMARY KEY, title TEXT, text TEXT)")
+                self.full_text = False
+
+            # Cells: the messages, code and outputs of each conversation, at their message's position
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS cells (
+                    id INTEGER PRIMARY KEY,
+                    conversation_id INTEGER,
+                    position INTEGER,
+                    kind TEXT,
+                    role TEXT,
+                    language TEXT,
+                    failed INTEGER,
+                    content TEXT,
+                    vector BLOB
+                )""")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS cells_conversation ON cells (conversation_id, position)")
+            if self.full_text:
+                # (The index reads the text from `cells`, and triggers keep it up to date, so the text isn't stored twice)
+                self.connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS cell_text USING fts5(content, language, content='cells', content_rowid='id')")
+                self.connection.execute("""
+                    CREATE TRIGGER IF NOT EXISTS cells_insert AFTER INSERT ON cells BEGIN
+                        INSERT INTO cell_text (rowid, content, language) VALUES (new.id, new.content, new.language);
+                    END""")
+                self.connection.execute("""
+                    CREATE TRIGGER IF NOT EXISTS cells_delete AFTER DELETE ON cells BEGIN
+                        INSERT INTO cell_text (cell_text, rowid, content, language) VALUES ('delete', old.id, old.content, old.language);
+                    END""")
+
+    def update(self, filename, messages, size=None, created=None, updated=None, changed_from=0):
+        """
+        Adds or updates a conversation's row, and indexes its cells from message `changed_from` on
+        (the ones before it haven't changed since the last update).
+        """
+        with self.connection:
+            self.write(filename, messages, size, created, updated, changed_from)
+
+    def write(self, filename, messages, size=None, created=None, updated=None, changed_from=0):
+        # (Doesn't commit)
+        info = describe(messages, load_usage(os.path.join(self.directory, filename)))
+        updated = updated or time.time()
+        if changed_from and not self.connection.execute("SELECT 1 FROM conversations WHERE filename = ?", (filename,)).fetchone():
+            # (New to the catalog, so none of its cells are indexed yet)
+            changed_from = 0
+        if size is None:
+            size = conversation_size(os.path.join(self.directory, filename))
+
+        self.connection.execute("""
+            INSERT INTO conversations (filename, title, created, updated, messages, models, prompt_tokens, completion_tokens, cost, size)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (filename) DO UPDATE SET
+                title = excluded.title, updated = excluded.updated, messages = excluded.messages, models = excluded.models,
+                prompt_tokens = excluded.prompt_tokens, completion_tokens = excluded.completion_tokens, cost = excluded.cost, size = excluded.size
+            """, (filename, info["title"], created or updated, updated, len(messages), info["models"],
+                  info["prompt_tokens"], info["completion_tokens"], info["cost"], size))
+        row_id = self.connection.execute("SELECT id FROM conversations WHERE filename = ?", (filename,)).fetchone()[0]
+        self.connection.execute("DELETE FROM conversation_text WHERE rowid = ?", (row_id,))
+        self.connection.execute("INSERT INTO conversation_text (rowid, title, text) VALUES (?, ?, ?)", (row_id, info["title"], info["text"]))
+        self.write_cells(row_id, messages, changed_from)
+
+    def write_cells(self, conversation_id, messages, changed_from):
+        removed = self.connection.execute("DELETE FROM cells WHERE conversation_id = ? AND position >= ?", (conversation_id, changed_from)).rowcount
+        if removed:
+            # (Cheaper to reload the vectors than to find these in them)
+            self.vectors = None
+
+        cells = list(get_cells(messages, changed_from))
+        if not cells:
+            return
+        if self.embedding_model:
+            vectors = [vector.tobytes() for vector in self.embed([cell[-1][:EMBED_CHARACTERS] for cell in cells])]
+        else:
+            vectors = [None] * len(cells)
+
+        ids = []
+        for cell, vector in zip(cells, vectors):
+            cursor = self.connection.execute(
+                "INSERT INTO cells (conversation_id, position, kind, role, language, failed, content, vector) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (conversation_id, *cell, vector))
+            ids.append(cursor.lastrowid)
+
+        # Add the new vectors to the loaded ones, so a save doesn't mean reloading all of them
+        if self.vectors is not None and self.embedding_model:
+            import numpy
+            loaded_ids, matrix = self.vectors
+            new = numpy.frombuffer(b"".join(vectors), dtype=numpy.float32).reshape(len(ids), -1)
+            self.vectors = (loaded_ids + ids, new if matrix is None else numpy.vstack([matrix, new]))
+
+    def embed(self, texts):
+        from ..rag.embeddings import get_embedder
+        return get_embedder(self.embedding_model)(texts)
+
+    def sync(self):
+        """
+        Adds conversations the catalog doesn't know about yet, updates ones that changed size without it
+        (or whose update failed), and forgets deleted ones. Only those files are opened, so this is quick.
+        """
+        # Sizes count the log too. (A log without its JSON file isn't a conversation)
+        filenames = set()
+        sizes = {}
+        for entry in os.scandir(self.directory):
+            name, extension = os.path.splitext(entry.name)
+            if name.endswith(".usage"):
+                # (A conversation's LLM calls. See usage_ledger)
+                continue
+            if extension in (".json", ".jsonl") and entry.is_file():
+                sizes[name + ".json"] = sizes.get(name + ".json", 0) + entry.stat().st_size
+                if extension == ".json":
+                    filenames.add(entry.name)
+        known = dict(self.connection.execute("SELECT filename, size FROM conversations"))
+
+        # (One transaction, so the first sync of a big folder doesn't commit thousands of times)
+        with self.connection:
+            for filename in filenames:
+                if known.get(filename) == sizes[filename]:
+                    continue
+                path = os.path.join(self.directory, filename)
+                try:
+                    messages = load_conversation(path)
+                except (ValueError, OSError):
+                    # (Not a conversation, or not readable)
+                    continue
+                modified = os.path.getmtime(path)
+                self.write(filename, messages, size=sizes[filename], created=modified, updated=modified)
+
+            for filename in set(known) - filenames:
+                self.connection.execute("DELETE FROM cells WHERE conversation_id = (SELECT id FROM conversations WHERE filename = ?)", (filename,))
+                self.connection.execute("DELETE FROM conversation_text WHERE rowid = (SELECT id FROM conversations WHERE filename = ?)", (filename,))
+                self.connection.execute("DELETE FROM conversations WHERE filename = ?", (filename,))
+
+    def list(self, sort="updated", offset=0, limit=PAGE_SIZE):
+        """
+        Returns a page of conversations, as dicts. `sort` is one of SORTS.
+        """
+        rows = self.connection.execute(f"SELECT {', '.join(COLUMNS)} FROM conversations ORDER BY {SORTS[sort]} LIMIT ? OFFSET ?", (limit, offset))
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def search(self, query, offset=0, limit=PAGE_SIZE):
+        """
+        Returns a page of the conversations whose title or user messages match `query`, best matches first.
+        """
+        columns = ", ".join("c." + column for column in COLUMNS)
+        if self.full_text:
+            # (Every word has to match. Quoted, so punctuation in the query isn't read as FTS syntax)
+            match = " ".join('"' + word.replace('"', '""') + '"' for word in query.split())
+            if not match:
+                return []
+            rows = self.connection.execute(f"""
+                SELECT {columns} FROM conversation_text t JOIN conversations c ON c.id = t.rowid
+                WHERE conversation_text MATCH ? ORDER BY bm25(conversation_text) LIMIT ? OFFSET ?
+                """, (match, limit, offset))
+        else:
+            rows = self.connection.execute(f"""
+                SELECT {columns} FROM conversation_text t JOIN conversations c ON c.id = t.rowid
+                WHERE t.title LIKE ? OR t.text LIKE ? ORDER BY c.updated DESC LIMIT ? OFFSET ?
+                """, (f"%{query}%", f"%{query}%", limit, offset))
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def search_cells(self, query, kind=None, working_only=False, any_word=False, exclude=None, limit=10):
+        """
+        Returns the cells of past conversations that best match `query`, best first, as dicts
+        (see CELL_COLUMNS. `position` is the message's index in its conversation).
+
+        `kind` is "message", "code" or "output" (or None for all of them). `working_only` leaves out code whose output
+        was an error, `exclude` is a conversation filename to leave out, and with `any_word`, cells only need to match
+        one of the query's words, not all of them.
+
+        With an embedding model, keyword and meaning matches are combined (by reciprocal rank fusion).
+        """
+        filters = ""
+        parameters = []
+        if kind:
+            filters += " AND cells.kind = ?"
+            parameters.append(kind)
+        if working_only:
+            filters += " AND NOT cells.failed"
+        if exclude:
+            filters += " AND c.filename != ?"
+            parameters.append(exclude)
+
+        rankings = [self.keyword_search(query, filters, parameters, any_word, limit * 2)]
+        if self.embedding_model:
+            rankings.append(self.vector_search(query, filters, parameters, limit * 2))
+
+        # Reciprocal rank fusion. (With one ranking, this keeps its order)
+        scores = defaultdict(float)
+        for ranking in rankings:
+            for rank, cell_id in enumerate(ranking):
+                scores[cell_id] += 1 / (60 + rank)
+        ids = sorted(scores, key=scores.get, reverse=True)[:limit]
+        if not ids:
+            return []
+
+        columns = ", ".join(["cells.id", "c.filename", "c.title"] + ["cells." + column for column in CELL_COLUMNS[2:]])
+        rows = self.connection.execute(f"""
+            SELECT {columns} FROM cells JOIN conversations c ON c.id = cells.conversation_id
+            WHERE cells.id IN ({", ".join("?" * len(ids))})
+            """, ids)
+        cells = {row[0]: dict(zip(CELL_COLUMNS, row[1:])) for row in rows}
+        return [cells[cell_id] for cell_id in ids if cell_id in cells]
+
+    def keyword_search(self, query, filters, parameters, any_word, limit):
+        # Returns matching cell ids, best first
+        words = tokenize(query)
+        if any_word:
+            # (Or they'd match everything)
+            words = [word for word in words if word not in STOPWORDS]
+        words = list(dict.fromkeys(words))[:32]
+        if not words:
+            return []
+
+        if self.full_text:
+            match = (" OR " if any_word else " ").join(f'"{word}"' for word in words)
+            rows = self.connection.execute(f"""
+                SELECT cells.id FROM cell_text JOIN cells ON cells.id = cell_text.rowid JOIN conversations c ON c.id = cells.conversation_id
+                WHERE cell_text MATCH ? {filters} ORDER BY bm25(cell_text) LIMIT ?
+                """, [match, *parameters, limit])
+        else:
+            condition = (" OR " if any_word else " AND ").join(["cells.content LIKE ?"] * len(words))
+            rows = self.connection.execute(f"""
+                SELECT cells.id FROM cells JOIN conversations c ON c.id = cells.conversation_id
+                WHERE ({condition}) {filters} ORDER BY cells.id DESC LIMIT ?
+                """, [*(f"%{word}%" for word in words), *parameters, limit])
+        return [row[0] for row in rows]
+
+    def vector_search(self, query, filters, parameters, limit):
+        # Returns the ids of the cells closest in meaning to `query`, best first
+        import numpy
+
+        query_vector = self.embed([query])[0]
+        ids, matrix = self.load_vectors(len(query_vector))
+        if matrix is None:
+            return []
+
+        # The closest few (more than we need, since filters may drop some), then filtered in SQL
+        scores = matrix @ query_vector
+        count = min(len(ids), limit * 5)
+        closest = numpy.argpartition(-scores, count - 1)[:count]
+        closest = closest[numpy.argsort(-scores[closest])]
+        candidates = [ids[i] for i in closest]
+
+        rows = self.connection.execute(f"""
+            SELECT cells.id FROM cells JOIN conversations c ON c.id = cells.conversation_id
+            WHERE cells.id IN ({", ".join("?" * len(candidates))}) {filters}
+            """, [*candidates, *parameters])
+        matching = {row[0] for row in rows}
+        return [cell_id for cell_id in candidates if cell_id in matching][:limit]
+
+    def load_vectors(self, dimensions):
+        if self.vectors is None:
+            import numpy
+            # (Vectors from another model, with a different size, are skipped. Those cells are still found by keywords)
+            rows = self.connection.execute("SELECT id, vector FROM cells WHERE length(vector) = ?", (dimensions * 4,)).fetchall()
+            if rows:
+                matrix = numpy.frombuffer(b"".join(row[1] for row in rows), dtype=numpy.float32).reshape(len(rows), dimensions)
+            else:
+                matrix = None
+            self.vectors = ([row[0] for row in rows], matrix)
+        return self.vectors
+
+    def count(self):
+        return self.connection.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+
+def describe(messages, calls=()):
+    """
+    The catalog's info about a conversation: its title (the start of its first message), the text to search,
+    and the models and tokens its LLM `calls` used (see usage_ledger).
+    """
+    user_messages = [message["message"] for message in messages if message.get("role") == "user" and message.get("message")]
+    title = " ".join(user_messages[0].split())[:80] if user_messages else "(no messages)"
+
+    models = []
+    prompt_tokens = completion_tokens = 0
+    cost = 0
+    for call in calls:
+        if call["model"] not in models:
+            models.append(call["model"])
+        prompt_tokens += call["prompt_tokens"]
+        completion_tokens += call["completion_tokens"]
+        cost += call["cost"] or 0
+
+    return {
+        "title": title,
+        "text": "\n".join(user_messages),
+        "models": ", ".join(models),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cost": cost,
+    }
+
+
+def get_cells(messages, start=0):
+    """
+    Yields (position, kind, role, language, failed, content) for the cells of `messages[start:]`.
+    """
+    for position, message in enumerate(messages[start:], start):
+        role = message.get("role")
+        language = message.get("language")
+        if message.get("message"):
+            yield position, "message", role, None, 0, message["message"]
+        if message.get("code"):
+            failed = bool(message.get("output") and ERROR_PATTERN.search(message["output"]))
+            yield position, "code", role, language, int(failed), message["code"]
+        if message.get("output"):
+            yield position, "output", role, language, 0, message["output"]
+
+
+def conversation_size(json_path):
+    return sum(os.path.getsize(path) for path in (json_path, get_log_path(json_path)) if os.path.exists(path))
@@ -0,0 +1,186 @@
+"""
+Conversations are saved as `<name>.json` (a list of messages), plus an append-only log, `<name>.jsonl`.
+
+Saving only appends what changed since the last save to the log, so a turn costs about the size of its new messages,
+however long the conversation is. Each line of the log is one of
+    {"base": <sha1 of <name>.json when the log was started, or None if there wasn't one>}   (the first line)
+    {"append": message}
+    {"truncate": n}   (keep only the first n messages, like after %undo)
+
+Once the log outgrows the JSON file, it's compacted: the full conversation is written to a temporary file,
+which atomically replaces <name>.json, and then the log is removed.
+
+If we crash, the JSON file is either the old one or the new one, never half of one.
+`load_conversation` replays the log on top of it (skipping a torn last line, and a log that's older than
+the JSON file, if we crashed mid-compaction).
+"""
+
+import copy
+import hashlib
+import json
+import os
+import time
+
+# How often to fsync the log (see Interpreter.conversation_fsync)
+FSYNC_POLICIES = ["always", "periodic", "never"]
+FSYNC_INTERVAL = 1
+
+
+class ConversationLog:
+    def __init__(self, directory, filename, fsync="always"):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"conversation_fsync should be one of {FSYNC_POLICIES}, not {fsync!r}.")
+        self.directory = directory
+        self.json_path = os.path.join(directory, filename)
+        self.log_path = get_log_path(self.json_path)
+        self.fsync = fsync
+        self.last_fsync = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+        # What's on disk. It's our own copy, since messages are edited in place (like output added to the last one)
+        self.saved = load_conversation(self.json_path)
+        self.file = None
+
+        # Sizes, to know when to compact
+        self.json_size = os.path.getsize(self.json_path) if os.path.exists(self.json_path) else 0
+        self.log_size = 0
+
+        # A log left over from last time (maybe from a crash, maybe ending in half a line) is folded into the JSON file,
+        # so we never append after a torn line
+        if os.path.exists(self.log_path):
+            self.compact()
+
+    def save(self, messages):
+        """
+        Appends whatever changed in `messages` since the last save.
+        Returns how many messages (from the start) didn't change.
+        """
+        # How many messages are the same as what's saved
+        kept = 0
+        for message, saved_message in zip(messages, self.saved):
+            if message != saved_message:
+                break
+            kept += 1
+
+        lines = []
+        if kept < len(self.saved):
+            lines.append({"truncate": kept})
+        lines.extend({"append": message} for message in messages[kept:])
+        self.saved = self.saved[:kept] + copy.deepcopy(messages[kept:])
+
+        if not lines:
+            return kept
+
+        if not os.path.exists(self.json_path) or self.log_size > max(self.json_size, 64 * 1024):
+            # A new conversation starts with its JSON file. After that, we only compact once the log's bigger
+            # than the conversation, so rewriting it costs about as much as the appends did
+            self.compact()
+            return kept
+
+        self.write(lines)
+        return kept
+
+    def write(self, lines):
+        if self.file is None:
+            starting = not os.path.exists(self.log_path)
+            self.file = open(self.log_path, "a", encoding="utf-8")
+            if starting:
+                lines = [{"base": file_hash(self.json_path)}] + lines
+
+        text = "".join(json.dumps(line) + "\n" for line in lines)
+        self.file.write(text)
+        self.file.flush()
+        self.log_size += len(text)
+
+        if self.fsync == "always" or (self.fsync == "periodic" and time.monotonic() - self.last_fsync >= FSYNC_INTERVAL):
+            os.fsync(self.file.fileno())
+            self.last_fsync = time.monotonic()
+
+    def compact(self):
+        """
+        Rewrites <name>.json with the whole conversation (atomically), and removes the log.
+        """
+        temporary_path = self.json_path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump(self.saved, file)
+            file.flush()
+            if self.fsync != "never":
+                os.fsync(file.fileno())
+        os.replace(temporary_path, self.json_path)
+        if self.fsync != "never":
+            fsync_directory(self.directory)
+
+        # (If we crash before this, the log's base won't match the new JSON file, so it's ignored)
+        self.close()
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+        self.json_size = os.path.getsize(self.json_path)
+        self.log_size = 0
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+def load_conversation(json_path):
+    """
+    Returns a saved conversation's messages: <name>.json, with its log replayed on top.
+    """
+    messages = []
+    if os.path.exists(json_path):
+        with open(json_path, "r", encoding="utf-8") as file:
+            messages = json.load(file)
+
+    log_path = get_log_path(json_path)
+    if not os.path.exists(log_path):
+        return messages
+
+    with open(log_path, "r", encoding="utf-8") as file:
+        lines = file.read().split("\n")
+
+    for number, line in enumerate(lines):
+        if not line.strip():
+            continue
+        try:
+            line = json.loads(line)
+        except ValueError:
+            # A write we crashed in the middle of. Nothing after it was written
+            break
+
+        if number == 0:
+            if "base" not in line or line["base"] != file_hash(json_path):
+                # We crashed after compacting, but before removing the log. The JSON file already has all of it
+                return messages
+        elif "append" in line:
+            messages.append(line["append"])
+        elif "truncate" in line:
+            del messages[line["truncate"]:]
+
+    return messages
+
+
+def get_log_path(json_path):
+    return os.path.splitext(json_path)[0] + ".jsonl"
+
+
+def file_hash(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+
+def fsync_directory(directory):
+    # (So the rename itself survives a crash. Windows can't open directories, and doesn't need this)
+    try:
+        descriptor = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(descriptor)
+    except OSError:
+        pass
+    finally:
+        os.close(descriptor)
@@ -0,0 +1,78 @@
+from functools import lru_cache
+from .convert_to_openai_messages import convert_to_openai_messages
+
+# Token counts of texts we've counted recently (message contents, code, outputs), so counting a conversation again
+# only tokenizes what's new. Keyed by (model, text): Python caches a string's hash, so looking up a message we've
+# already counted is cheap, however long it is
+CACHE_SIZE = 4096
+_token_counts = {}
+
+def count_tokens(text, model=""):
+    """
+    Counts the tokens in `text` with tiktoken, using `model`'s encoding (or cl100k_base, for models tiktoken doesn't know).
+    If tiktoken can't load an encoding (it downloads them the first time), estimates 4 characters per token.
+    """
+    key = (model, text)
+    tokens = _token_counts.get(key)
+    if tokens is None:
+        encoding = get_encoding(model)
+        if encoding is None:
+            tokens = (len(text) + 3) // 4
+        else:
+            tokens = len(encoding.encode(text, disallowed_special=()))
+
+        # (Clearing it all is crude, but it's rare, and never wrong)
+        if len(_token_counts) >= CACHE_SIZE:
+            _token_counts.clear()
+        _token_counts[key] = tokens
+    return tokens
+
+
+def count_message_tokens(messages, model=""):
+    """
+    Roughly how many tokens OI `messages` take up once they're sent to the LLM.
+    """
+    return count_openai_message_tokens(convert_to_openai_messages(messages), model)
+
+
+def count_openai_message_tokens(messages, model=""):
+    """
+    Roughly how many tokens OpenAI-style `messages` (like the ones we send to LiteLLM) take up.
+    """
+    return sum(count_openai_message(message, model) for message in messages)
+
+
+def count_openai_message(message, model=""):
+    # (Every message costs a few tokens for its role and separators)
+    tokens = 4 + count_tokens(message["content"] or "", model)
+
+    function_call = message.get("function_call")
+    if function_call:
+        arguments = function_call.get("parsed_arguments")
+        if arguments:
+            # Counted from the code itself, which we've usually counted before, rather than from the JSON
+            # convert_to_openai_messages just made for it. (Plus about what the JSON around it costs)
+            tokens += 10 + count_tokens(arguments["language"] or "", model) + count_tokens(arguments["code"], model)
+        else:
+            tokens += count_tokens(function_call["arguments"], model)
+    return tokens
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        pass
+    except Exception:
+        return None
+
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
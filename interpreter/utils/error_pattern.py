@@ -0,0 +1,4 @@
+import re
+
+# Output that means the code didn't work (used to mark failed cells in the catalog, and to summarize code when trimming)
+ERROR_PATTERN = re.compile(r"Traceback \(most recent call last\)|\b\w*(Error|Exception):|command not found|No such file or directory")
@@ -1,3 +1,4 @@
+import copy
 import os
 import yaml
 import appdirs
@@ -10,6 +11,10 @@ config_filename = "config.yaml"
 config_dir = appdirs.user_config_dir("Open Interpreter")
 user_config_path = os.path.join(config_dir, config_filename)
 
+# The last config we read, and when its file was modified. (Every Interpreter loads the config,
+# and `--serve` makes one per session, so it's only parsed again if the file changed)
+_cache = {"modified": None, "config": None}
+
 def get_config():
     if not os.path.exists(user_config_path):
         # If user's config doesn't exist, copy the default config from the package
@@ -21,5 +26,11 @@ def get_config():
         # Copying the file using shutil.copy
         shutil.copy(default_config_path, user_config_path)
 
-    with open(user_config_path, 'r') as file:
-        return yaml.safe_load(file)
\ No newline at end of file
+    modified = os.path.getmtime(user_config_path)
+    if _cache["modified"] != modified:
+        with open(user_config_path, 'r') as file:
+            _cache["config"] = yaml.safe_load(file)
+        _cache["modified"] = modified
+
+    # (A copy, so one Interpreter changing a setting can't change another's)
+    return copy.deepcopy(_cache["config"])
\ No newline at end of file
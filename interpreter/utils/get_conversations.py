@@ -1,10 +1,19 @@
 import os
 import appdirs
+from .conversation_catalog import ConversationCatalog
 
-# Using appdirs to determine user-specific config path
-config_dir = appdirs.user_config_dir("Open Interpreter")
+# Conversations are saved in the user's data dir (see Interpreter.conversation_history_path)
+conversations_dir = os.path.join(appdirs.user_data_dir("Open Interpreter"), "conversations")
 
-def get_conversations():
-    conversations_dir = os.path.join(config_dir, "conversations")
-    json_files = [f for f in os.listdir(conversations_dir) if f.endswith('.json')]
-    return json_files
\ No newline at end of file
+def get_conversations(directory=conversations_dir):
+    """
+    Returns the filenames of the saved conversations, most recently saved first.
+    """
+    if not os.path.exists(directory):
+        return []
+    catalog = ConversationCatalog(directory)
+    try:
+        catalog.sync()
+        return [conversation["filename"] for conversation in catalog.list(limit=-1)]
+    finally:
+        catalog.close()
@@ -0,0 +1,15 @@
+import asyncio
+
+async def iterate_in_thread(iterator):
+    """
+    Turns a blocking iterator (like a local LLM's token stream) into an async generator.
+    Each `next()` runs in a worker thread so the event loop stays free.
+    """
+    iterator = iter(iterator)
+    exhausted = object()
+
+    while True:
+        item = await asyncio.to_thread(next, iterator, exhausted)
+        if item is exhausted:
+            break
+        yield item
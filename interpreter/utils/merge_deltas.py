@@ -18,4 +18,71 @@ def merge_deltas(original, delta):
                 original[key] += value
             else:
                 original[key] = value
-    return original
\ No newline at end of file
+    return original
+
+
+class DeltaAccumulator:
+    """
+    Does what merge_deltas does, but without rebuilding the whole string for every token.
+
+    String values are collected as lists of fragments and only joined when you call `.materialize()`
+    (or `.get()` for a single value). Until then, `original` has every key it will end up with,
+    but string values may be out of date.
+    """
+
+    def __init__(self, original=None):
+        self.original = {} if original is None else original
+
+        # (key, nested key, ...) -> [fragment, fragment, ...]
+        self.fragments = {}
+
+    def add(self, delta):
+        self._add(self.original, delta, ())
+        return self
+
+    def _add(self, original, delta, path):
+        for key, value in delta.items():
+            key_path = path + (key,)
+
+            if isinstance(value, dict):
+                if key not in original:
+                    original[key] = {}
+                self._add(original[key], value, key_path)
+
+            elif isinstance(value, str):
+                if key_path not in self.fragments:
+                    if isinstance(original.get(key), str):
+                        self.fragments[key_path] = [original[key]]
+                    else:
+                        self.fragments[key_path] = []
+                        original[key] = ""
+                self.fragments[key_path].append(value)
+
+            elif key not in original or value is not None:
+                original[key] = value
+
+    def get(self, *key_path):
+        """
+        Returns the up-to-date value at `key_path`, e.g. `.get("function_call", "arguments")`.
+        """
+        fragments = self.fragments.get(key_path)
+        if fragments is not None:
+            if len(fragments) > 1:
+                fragments[:] = ["".join(fragments)]
+            return fragments[0] if fragments else ""
+
+        value = self.original
+        for key in key_path:
+            value = value[key]
+        return value
+
+    def materialize(self):
+        """
+        Joins every string, writes them into `original` and returns it.
+        """
+        for key_path in self.fragments:
+            container = self.original
+            for key in key_path[:-1]:
+                container = container[key]
+            container[key_path[-1]] = self.get(*key_path)
+        return self.original
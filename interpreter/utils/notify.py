@@ -0,0 +1,16 @@
+def notify(interpreter, kind, message):
+    """
+    Tells the user something that isn't part of the conversation, like "a new version is available".
+
+    Normally it's printed as markdown. In headless mode (`interpreter.headless`) nothing is printed:
+    it's queued instead, and yielded from the chat stream as a chunk like
+    {"notice": {"type": kind, "message": message}}
+    """
+    if interpreter.headless:
+        # (Lines are stripped, like display_markdown_message does)
+        message = "\n".join(line.strip() for line in message.split("\n")).strip()
+        interpreter._events.append({"notice": {"type": kind, "message": message}})
+    else:
+        # (Imported here so headless mode never loads rich)
+        from .display_markdown_message import display_markdown_message
+        display_markdown_message(message)
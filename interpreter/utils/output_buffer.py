@@ -0,0 +1,103 @@
+from collections import deque
+
+class OutputBuffer:
+    """
+    Collects code output, keeping only its first `head_chars` and last `max_chars - head_chars` characters.
+
+    Adding a line costs about the length of the line, however much output came before it.
+    The kept text is only joined when you ask for it with `.text()` (or `str()`).
+
+    If you pass `spool` (a function that opens a file for writing), the full output is written
+    to that file once it outgrows `max_chars`, so nothing is lost. Call `.close()` when you're done.
+    """
+
+    def __init__(self, max_chars=2000, head_chars=None, spool=None):
+        self.max_chars = max_chars
+        self.head_chars = max_chars // 5 if head_chars is None else min(head_chars, max_chars)
+        self.tail_chars = max_chars - self.head_chars
+
+        self.head = []
+        self.head_length = 0
+        self.tail = deque()
+        self.tail_length = 0
+
+        # Characters we've seen, and the ones we threw away between the head and the tail
+        self.total_chars = 0
+        self.dropped_chars = 0
+
+        self.spool = spool
+        self.spool_file = None
+
+        # The unfinished last line (like a progress bar), which the next finished line replaces
+        self.partial = ""
+
+        self._text = None
+
+    def add(self, line):
+        """
+        Adds a line (or a few lines) of output.
+        """
+        if not line.endswith("\n"):
+            line += "\n"
+
+        if self.spool and self.spool_file is None and self.total_chars + len(line) > self.max_chars:
+            # We're about to drop something. Until now we've kept everything, so start the file with that
+            self.spool_file = self.spool()
+            self.spool_file.write("".join(self.head) + "".join(self.tail))
+        if self.spool_file:
+            self.spool_file.write(line)
+
+        self.total_chars += len(line)
+        self.partial = ""
+        self._text = None
+
+        # The head fills up first, then stays as it is
+        if self.head_length < self.head_chars:
+            kept = line[:self.head_chars - self.head_length]
+            self.head.append(kept)
+            self.head_length += len(kept)
+            line = line[len(kept):]
+            if not line:
+                return
+
+        self.tail.append(line)
+        self.tail_length += len(line)
+
+        # Drop the oldest part of the tail until it fits
+        while self.tail_length > self.tail_chars:
+            excess = self.tail_length - self.tail_chars
+            oldest = self.tail[0]
+            if len(oldest) <= excess:
+                self.tail.popleft()
+                self.tail_length -= len(oldest)
+                self.dropped_chars += len(oldest)
+            else:
+                self.tail[0] = oldest[excess:]
+                self.tail_length -= excess
+                self.dropped_chars += excess
+
+    def set_partial(self, text):
+        """
+        Sets what the unfinished last line reads now.
+        """
+        self.partial = text[-self.max_chars:] if self.max_chars else ""
+        self._text = None
+
+    def text(self):
+        if self._text is None:
+            text = "".join(self.head)
+            if self.dropped_chars:
+                text += f"\n[Output truncated. {self.dropped_chars} characters were removed here, showing the first {self.head_length} and last {self.tail_length} characters."
+                if self.spool_file:
+                    text += f" The full output ({self.total_chars} characters) is saved at {self.spool_file.name}. If you need more of it, read it a page at a time with code."
+                text += "]\n\n"
+            text += "".join(self.tail) + self.partial
+            self._text = text.strip()
+        return self._text
+
+    def close(self):
+        if self.spool_file:
+            self.spool_file.close()
+
+    def __str__(self):
+        return self.text()
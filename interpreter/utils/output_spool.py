@@ -0,0 +1,99 @@
+import os
+import re
+import shutil
+import time
+import uuid
+
+# What a session's folder is called. Nothing else in the spool's directory is ever deleted
+FOLDER_NAME = re.compile(r"[0-9a-f]{12}")
+
+class OutputSpool:
+    """
+    A folder of files holding code outputs that were too long to keep in messages (one folder per session).
+    Messages keep a handle to their file (see `handle`) and a preview of the start and end.
+
+    The first time a session spools an output, other sessions' folders are pruned (see `prune_spool`),
+    so the spool can't grow forever.
+    """
+
+    def __init__(self, directory, max_age_days=None, max_bytes=None):
+        self.parent_directory = directory
+        self.directory = os.path.join(directory, uuid.uuid4().hex[:12])
+        self.max_age_days = max_age_days
+        self.max_bytes = max_bytes
+        self.count = 0
+
+    def open(self):
+        """
+        Opens a new output file for writing. Its name (minus ".txt") is the output's id.
+        """
+        if self.count == 0:
+            prune_spool(self.parent_directory, self.max_age_days, self.max_bytes, keep=self.directory)
+        os.makedirs(self.directory, exist_ok=True)
+        self.count += 1
+        path = os.path.join(self.directory, f"output_{self.count}.txt")
+        return open(path, "w", encoding="utf-8", errors="replace")
+
+    def delete(self):
+        """
+        Deletes this session's spooled outputs.
+        """
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def prune_spool(directory, max_age_days=None, max_bytes=None, keep=None):
+    """
+    Deletes the session folders in `directory` that were last written more than `max_age_days` ago,
+    then the oldest of the rest until they fit in `max_bytes` (never `keep`).
+    """
+    folders = []
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        return
+    for entry in entries:
+        if not FOLDER_NAME.fullmatch(entry.name) or entry.path == keep or not entry.is_dir():
+            continue
+        try:
+            modified = entry.stat().st_mtime
+            size = 0
+            for file in os.scandir(entry.path):
+                stat = file.stat()
+                size += stat.st_size
+                modified = max(modified, stat.st_mtime)
+        except OSError:
+            continue
+        folders.append((modified, size, entry.path))
+
+    total = sum(size for _, size, _ in folders)
+    cutoff = time.time() - max_age_days * 24 * 60 * 60 if max_age_days is not None else None
+    for modified, size, path in sorted(folders):
+        if (cutoff is not None and modified < cutoff) or (max_bytes is not None and total > max_bytes):
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+def handle(spool_file):
+    """
+    What a message keeps about a spooled output, under "output_file".
+    """
+    return {
+        "id": os.path.basename(spool_file.name)[:-len(".txt")],
+        "path": spool_file.name,
+        "bytes": os.path.getsize(spool_file.name),
+    }
+
+
+def read_output_page(path, page=1, page_lines=200):
+    """
+    Returns lines `(page - 1) * page_lines` up to `page * page_lines` of a spooled output, without reading the rest.
+    """
+    start = (page - 1) * page_lines
+    lines = []
+    with open(path, "r", encoding="utf-8", errors="replace") as file:
+        for i, line in enumerate(file):
+            if i >= start + page_lines:
+                break
+            if i >= start:
+                lines.append(line)
+    return "".join(lines)
@@ -0,0 +1,200 @@
+import re
+
+# Inside a string, these are the only characters that need attention
+STRING_SPECIAL_CHARACTERS = re.compile(r'[\\"]')
+
+ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+class StreamingJsonParser:
+    """
+    Parses a JSON object as it streams in, like the `arguments` of a streamed function call.
+
+    `.feed(text)` only looks at the new text, and returns a list of `(key, fragment, complete)`
+    for the top-level string values it made progress on: `fragment` is the newly decoded part of
+    the value, `complete` is True once the value's closing quote arrives.
+
+    Non-string values are skipped. Like parse_partial_json, raw newlines inside strings are tolerated.
+    """
+
+    def __init__(self):
+        self.state = "start"
+        self.key_fragments = []
+        self.key = None
+
+        # Escape sequence split across feeds, e.g. "\\" or "\\u00"
+        self.escape = ""
+        self.high_surrogate = None
+
+        # For skipping non-string values
+        self.depth = 0
+        self.in_skipped_string = False
+        self.skipped_escape = False
+
+    def feed(self, text):
+        events = []
+        i = 0
+
+        while i < len(text) and self.state != "done":
+            if self.state == "key" or self.state == "value":
+                i = self.read_string(text, i, events)
+            elif self.state == "skip":
+                i = self.skip_value(text, i)
+            else:
+                self.read_structure(text[i])
+                i += 1
+
+        return events
+
+    def read_structure(self, char):
+        if char.isspace():
+            return
+
+        if self.state == "start":
+            if char == "{":
+                self.state = "before_key"
+
+        elif self.state == "before_key":
+            if char == '"':
+                self.state = "key"
+                self.key_fragments = []
+            elif char == "}":
+                self.state = "done"
+
+        elif self.state == "after_key":
+            if char == ":":
+                self.state = "before_value"
+
+        elif self.state == "before_value":
+            if char == '"':
+                self.state = "value"
+            else:
+                # A number, true/false/null, or a nested object/array
+                self.state = "skip"
+                self.depth = 1 if char in "{[" else 0
+
+        elif self.state == "after_value":
+            if char == ",":
+                self.state = "before_key"
+            elif char == "}":
+                self.state = "done"
+
+    def read_string(self, text, i, events):
+        """
+        Reads the key or value string we're in, up to its closing quote or the end of the text.
+        Returns where it stopped.
+        """
+        fragments = []
+        closed = False
+
+        while i < len(text):
+            if self.escape:
+                i = self.read_escape(text, i, fragments)
+                continue
+
+            match = STRING_SPECIAL_CHARACTERS.search(text, i)
+            end = match.start() if match else len(text)
+            if end > i:
+                self.flush_surrogate(fragments)
+                fragments.append(text[i:end])
+            i = end
+
+            if match is None:
+                break
+
+            i += 1
+            if match.group() == '"':
+                self.flush_surrogate(fragments)
+                closed = True
+                break
+            self.escape = "\\"
+
+        fragment = "".join(fragments)
+
+        if self.state == "key":
+            self.key_fragments.append(fragment)
+            if closed:
+                self.key = "".join(self.key_fragments)
+                self.state = "after_key"
+        else:
+            if fragment or closed:
+                events.append((self.key, fragment, closed))
+            if closed:
+                self.state = "after_value"
+
+        return i
+
+    def read_escape(self, text, i, fragments):
+        if self.escape == "\\":
+            char = text[i]
+            i += 1
+            if char == "u":
+                self.escape = "\\u"
+                return i
+            self.escape = ""
+            self.flush_surrogate(fragments)
+            fragments.append(ESCAPES.get(char, char))
+            return i
+
+        # \uXXXX, possibly split across feeds
+        needed = 6 - len(self.escape)
+        self.escape += text[i:i + needed]
+        i += min(needed, len(text) - i)
+        if len(self.escape) < 6:
+            return i
+
+        try:
+            code_point = int(self.escape[2:], 16)
+        except ValueError:
+            code_point = 0xFFFD
+        self.escape = ""
+
+        if 0xD800 <= code_point <= 0xDBFF:
+            # First half of a surrogate pair (like an emoji). Wait for the second half
+            self.flush_surrogate(fragments)
+            self.high_surrogate = code_point
+        elif 0xDC00 <= code_point <= 0xDFFF and self.high_surrogate is not None:
+            fragments.append(chr(0x10000 + ((self.high_surrogate - 0xD800) << 10) + (code_point - 0xDC00)))
+            self.high_surrogate = None
+        else:
+            self.flush_surrogate(fragments)
+            fragments.append(chr(code_point) if not 0xD800 <= code_point <= 0xDFFF else "\ufffd")
+
+        return i
+
+    def flush_surrogate(self, fragments):
+        # A lone half of a surrogate pair can't be encoded, so it becomes a replacement character
+        if self.high_surrogate is not None:
+            fragments.append("\ufffd")
+            self.high_surrogate = None
+
+    def skip_value(self, text, i):
+        while i < len(text):
+            char = text[i]
+            i += 1
+
+            if self.in_skipped_string:
+                if self.skipped_escape:
+                    self.skipped_escape = False
+                elif char == "\\":
+                    self.skipped_escape = True
+                elif char == '"':
+                    self.in_skipped_string = False
+            elif char == '"':
+                self.in_skipped_string = True
+            elif char in "{[":
+                self.depth += 1
+            elif char in "}]":
+                if self.depth == 0:
+                    # This closes the object itself
+                    self.state = "done"
+                    return i
+                self.depth -= 1
+                if self.depth == 0:
+                    self.state = "after_value"
+                    return i
+            elif char == "," and self.depth == 0:
+                self.state = "before_key"
+                return i
+
+        return i
@@ -0,0 +1,166 @@
+import contextlib
+import json
+import time
+import uuid
+from .count_tokens import count_tokens
+
+class Tracer:
+    """
+    Times the parts of each turn (a turn is one LLM response, and the code it runs).
+
+    Every finished span is a dict like
+        {"name": "llm", "session": ..., "turn": 2, "start": <unix time>, "duration": <seconds>, "attributes": {...}}
+    and goes to whichever of these are set up:
+        `events`         a list the chat stream yields from, as {"span": span} chunks
+        `path`           a JSON lines file the span is appended to
+        `opentelemetry`  the OpenTelemetry tracer provider you've configured (needs the opentelemetry-api package)
+    """
+
+    def __init__(self, events=None, path=None, opentelemetry=False):
+        self.session = uuid.uuid4().hex[:12]
+        self.turn = 0
+        self.events = events
+
+        self.file = open(path, "a", encoding="utf-8") if path else None
+
+        self.otel_tracer = None
+        if opentelemetry:
+            try:
+                from opentelemetry import trace
+            except ImportError:
+                raise ImportError("Sending spans to OpenTelemetry needs the OpenTelemetry API. Run `pip install opentelemetry-api opentelemetry-sdk`.")
+            self.otel_tracer = trace.get_tracer("open-interpreter")
+
+    def next_turn(self):
+        self.turn += 1
+
+    @contextlib.contextmanager
+    def span(self, name, **attributes):
+        """
+        Times the `with` block. It gets the span's attributes, so it can add to them.
+        """
+        start_time = time.time()
+        start = time.perf_counter()
+        try:
+            yield attributes
+        finally:
+            self.record(name, start_time, time.perf_counter() - start, **attributes)
+
+    def record(self, name, start_time, duration, **attributes):
+        """
+        Adds a span that was timed some other way.
+        """
+        span = {
+            "name": name,
+            "session": self.session,
+            "turn": self.turn,
+            "start": start_time,
+            "duration": duration,
+            "attributes": attributes,
+        }
+
+        if self.events is not None:
+            self.events.append({"span": span})
+
+        if self.file:
+            self.file.write(json.dumps(span, default=str) + "\n")
+            self.file.flush()
+
+        if self.otel_tracer:
+            # (OpenTelemetry attributes can't be None)
+            otel_attributes = {key: value for key, value in attributes.items() if value is not None}
+            otel_attributes.update({"session": self.session, "turn": self.turn})
+            otel_span = self.otel_tracer.start_span(f"open_interpreter.{name}", start_time=int(start_time * 1e9), attributes=otel_attributes)
+            otel_span.end(end_time=int((start_time + duration) * 1e9))
+
+    def time_llm(self, chunks, model):
+        """
+        Passes through an LLM's chunks, then records an "llm" span with its time to first token and tokens per second.
+        """
+        start_time = time.time()
+        start = time.perf_counter()
+        time_to_first_token = None
+        count = 0
+        text = []
+        try:
+            for chunk in chunks:
+                if time_to_first_token is None:
+                    time_to_first_token = time.perf_counter() - start
+                count += 1
+                text.extend(value for value in chunk.values() if isinstance(value, str))
+                yield chunk
+        finally:
+            self.record_llm(start_time, time.perf_counter() - start, time_to_first_token, count, text, model)
+
+    async def atime_llm(self, chunks, model):
+        """
+        The async version of `time_llm`.
+        """
+        start_time = time.time()
+        start = time.perf_counter()
+        time_to_first_token = None
+        count = 0
+        text = []
+        try:
+            async for chunk in chunks:
+                if time_to_first_token is None:
+                    time_to_first_token = time.perf_counter() - start
+                count += 1
+                text.extend(value for value in chunk.values() if isinstance(value, str))
+                yield chunk
+        finally:
+            self.record_llm(start_time, time.perf_counter() - start, time_to_first_token, count, text, model)
+
+    def record_llm(self, start_time, duration, time_to_first_token, count, text, model):
+        # (Estimated with tiktoken, since streamed responses don't report usage)
+        tokens = count_tokens("".join(text), model)
+        generating = duration - (time_to_first_token or 0)
+        self.record(
+            "llm", start_time, duration,
+            model=model,
+            time_to_first_token=time_to_first_token,
+            chunks=count,
+            tokens=tokens,
+            tokens_per_second=tokens / generating if generating > 0 else None,
+        )
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+def next_turn(interpreter):
+    """
+    Starts a new turn, if the interpreter is tracing.
+    """
+    tracer = interpreter._get_tracer()
+    if tracer is not None:
+        tracer.next_turn()
+
+
+def span(interpreter, name, **attributes):
+    """
+    `with span(interpreter, "trim"):` times the block, if the interpreter is tracing. Otherwise it does nothing.
+    """
+    tracer = interpreter._get_tracer()
+    if tracer is None:
+        return contextlib.nullcontext(attributes)
+    return tracer.span(name, **attributes)
+
+
+def time_llm(interpreter, chunks):
+    """
+    Wraps an LLM's chunks to record an "llm" span, if the interpreter is tracing.
+    """
+    tracer = interpreter._get_tracer()
+    if tracer is None:
+        return chunks
+    return tracer.time_llm(chunks, interpreter.model)
+
+
+def atime_llm(interpreter, chunks):
+    tracer = interpreter._get_tracer()
+    if tracer is None:
+        return chunks
+    return tracer.atime_llm(chunks, interpreter.model)
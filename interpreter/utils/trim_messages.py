@@ -0,0 +1,240 @@
+"""
+Trims OpenAI-style messages to fit the context window. It does what tokentrim.trim did, without its cost,
+and compacts old messages before dropping any.
+
+tokentrim tokenized the whole conversation on every call, and counted the messages it kept again for each one it
+added, so each call got slower as the conversation grew. Here, token counts are cached by text (see count_tokens),
+so only new messages are tokenized. Trimming walks back from the newest message with a running total, and stops
+as soon as the budget's full, so dropped messages aren't looked at.
+
+When the conversation doesn't fit, old code outputs are usually what's taking up the space, so they go first:
+    1. Outputs older than the last few messages are cut down to their start and end
+    2. Then, older code and its output are collapsed into a one-line summary
+    3. Only then are the oldest messages dropped
+The user's first message is kept either way (shortened, if it's long), so the conversation doesn't lose its goal.
+"""
+
+import json
+from functools import lru_cache
+from .count_tokens import count_tokens, count_openai_message, get_encoding
+from .error_pattern import ERROR_PATTERN
+
+# Like tokentrim, we fill this much of a model's context window, leaving the rest for the response
+TRIM_RATIO = 0.75
+
+# The last few messages (the step the LLM is working on) are never compacted
+RECENT_MESSAGES = 4
+
+# How much of an old output is kept (half from its start, half from its end)
+EXCERPT_CHARACTERS = 400
+
+
+def get_max_prompt_tokens(model):
+    """
+    How many tokens of messages to send `model`. Raises ValueError for models we don't know the context window of.
+    """
+    # (tokentrim's table of context windows, so the budgets don't change)
+    from tokentrim.model_map import MODEL_MAX_TOKENS
+
+    if model not in MODEL_MAX_TOKENS:
+        raise ValueError(f"Unknown context window for {model}. Set context_window instead.")
+    return int(MODEL_MAX_TOKENS[model] * TRIM_RATIO)
+
+
+def trim_messages(messages, system_message, max_tokens, model=""):
+    """
+    Returns the system message, then as many of the newest `messages` as fit in `max_tokens`
+    (compacting older ones first, see above).
+    """
+    system_message = {"role": "system", "content": system_message}
+    system_tokens = count_openai_message(system_message, model)
+    if system_tokens > max_tokens:
+        overhead = system_tokens - count_tokens(system_message["content"], model)
+        system_message["content"] = shorten(system_message["content"], max_tokens - overhead, model)
+        system_tokens = count_openai_message(system_message, model)
+
+    budget = max_tokens - system_tokens
+    kept, dropped = fit(messages, budget, model)
+
+    # If the user's first message was dropped, it goes back in front of what's left (using up to a quarter of the budget)
+    goal = next((i for i, message in enumerate(messages) if message["role"] == "user"), None)
+    if goal is not None and goal < dropped and messages[goal]["content"]:
+        goal = messages[goal]
+        overhead = count_openai_message(goal, model) - count_tokens(goal["content"], model)
+        if budget // 4 > overhead:
+            goal = dict(goal, content=shorten(goal["content"], budget // 4 - overhead, model))
+            kept, _ = fit(messages, budget - count_openai_message(goal, model), model)
+            kept = [goal] + kept
+
+    return [system_message] + kept
+
+
+def fit(messages, budget, model=""):
+    """
+    Returns the newest messages that fit in `budget` tokens, compacted as little as they can be,
+    and how many of `messages` were dropped (or shortened) from the start.
+    """
+    recent = max(len(messages) - RECENT_MESSAGES, 0)
+    if 0 < recent < len(messages) and is_pair(messages, recent - 1):
+        # (Code and its output are either both recent or both older)
+        recent -= 1
+    units = get_units(messages)
+
+    # Walking back from the newest message: how far could we get if every older message was compacted as far as it goes?
+    # Anything older than that is dropped, however much we compact, so it isn't compacted (or even looked at)
+    total = 0
+    first_unit = len(units)
+    while first_unit > 0:
+        tokens = smallest_tokens(messages, units[first_unit - 1], recent, model)
+        if total + tokens > budget:
+            break
+        total += tokens
+        first_unit -= 1
+    units = units[first_unit:]
+    start = units[0][0] if units else len(messages)
+
+    # Then compact the oldest of those as little as we need to, one step at a time
+    kept = {unit: [messages[i] for i in unit] for unit in units}
+    total = sum(count_tokens_of(unit_messages, model) for unit_messages in kept.values())
+    for compact in (excerpt_unit, summarize_unit):
+        for unit in units:
+            if total <= budget:
+                break
+            compacted = compact(messages, unit, recent)
+            if compacted is not None:
+                saved = count_tokens_of(kept[unit], model) - count_tokens_of(compacted, model)
+                if saved > 0:
+                    total -= saved
+                    kept[unit] = compacted
+    kept = [message for unit in units for message in kept[unit]]
+
+    # Like tokentrim, the newest message that doesn't fit is shortened to fit, unless it's code (which would break if cut)
+    # or code's output (which would be kept without its code)
+    if start > 0:
+        message = messages[start - 1]
+        if "function_call" not in message and message["role"] != "function" and message["content"]:
+            overhead = count_openai_message(message, model) - count_tokens(message["content"], model)
+            if budget - total > overhead:
+                message = dict(message, content=shorten(message["content"], budget - total - overhead, model))
+                if total + count_openai_message(message, model) <= budget:
+                    kept.insert(0, message)
+                    start -= 1
+
+    return kept, start
+
+
+def get_units(messages):
+    """
+    Groups the indexes of `messages` into what's compacted (or dropped) together: code and its output are one unit,
+    so neither is ever kept without the other.
+    """
+    units = []
+    i = 0
+    while i < len(messages):
+        if is_pair(messages, i):
+            units.append((i, i + 1))
+            i += 2
+        else:
+            units.append((i,))
+            i += 1
+    return units
+
+
+def is_pair(messages, i):
+    # Code, followed by its output
+    return i + 1 < len(messages) and "function_call" in messages[i] and messages[i + 1]["role"] == "function"
+
+
+def smallest_tokens(messages, unit, recent, model):
+    tokens = count_tokens_of([messages[i] for i in unit], model)
+    # (A summary's smaller than an excerpt, so we only need the excerpt when there's nothing to summarize)
+    compacted = summarize_unit(messages, unit, recent) or excerpt_unit(messages, unit, recent)
+    if compacted is not None:
+        tokens = min(tokens, count_tokens_of(compacted, model))
+    return tokens
+
+
+def count_tokens_of(messages, model):
+    return sum(count_openai_message(message, model) for message in messages)
+
+
+def excerpt_unit(messages, unit, recent):
+    # Older outputs, cut down to their start and end
+    if unit[0] >= recent:
+        return None
+    unit_messages = [messages[i] for i in unit]
+    if not any(message["role"] == "function" and message["content"] != excerpt(message["content"]) for message in unit_messages):
+        return None
+    return [dict(message, content=excerpt(message["content"])) if message["role"] == "function" else message for message in unit_messages]
+
+
+def summarize_unit(messages, unit, recent):
+    # Older code (and its output), as one line
+    if unit[0] >= recent or "function_call" not in messages[unit[0]]:
+        return None
+    code_message = messages[unit[0]]
+    output = messages[unit[1]]["content"] if len(unit) > 1 else None
+    arguments = code_message["function_call"].get("parsed_arguments") or json.loads(code_message["function_call"]["arguments"])
+    return [{"role": "assistant", "content": summarize(code_message["content"], arguments["language"], arguments["code"], output)}]
+
+
+@lru_cache(maxsize=4096)
+def excerpt(output):
+    """
+    The start and end of `output` (about EXCERPT_CHARACTERS), on line boundaries where it has them.
+    """
+    if not output or len(output) <= EXCERPT_CHARACTERS:
+        return output
+    half = EXCERPT_CHARACTERS // 2
+    head = output[:half]
+    tail = output[-half:]
+    if "\n" in head:
+        head = head[:head.rfind("\n")]
+    if "\n" in tail:
+        tail = tail[tail.find("\n") + 1:]
+    omitted = output.count("\n") - head.count("\n") - tail.count("\n")
+    return f"{head}\n[... {omitted} lines left out ...]\n{tail}"
+
+
+@lru_cache(maxsize=4096)
+def summarize(message, language, code, output):
+    """
+    A line about some code that ran, like "[Ran 12 lines of python, starting `import pandas as pd`. It printed 40 lines, starting `...`]",
+    after the message that came with it.
+    """
+    lines = code.strip().splitlines() or [""]
+    summary = f"[Ran {len(lines)} line{'s' if len(lines) != 1 else ''} of {language}, starting `{lines[0][:80]}`"
+
+    if output is None:
+        summary += "]"
+    elif not output.strip() or output == "No output":
+        summary += ". It had no output]"
+    else:
+        output_lines = output.strip().splitlines()
+        errors = [line for line in output_lines if ERROR_PATTERN.search(line)]
+        if errors:
+            summary += f". It failed: `{errors[-1].strip()[:160]}`]"
+        else:
+            summary += f". It printed {len(output_lines)} line{'s' if len(output_lines) != 1 else ''}, starting `{output_lines[0].strip()[:120]}`]"
+
+    return f"{message}\n\n{summary}" if message else summary
+
+
+def shorten(text, max_tokens, model=""):
+    """
+    Cuts the middle out of `text`, so it's about `max_tokens` tokens.
+    """
+    max_tokens = max(max_tokens, 0)
+    encoding = get_encoding(model)
+    if encoding is None:
+        # (Estimating 4 characters per token, like count_tokens)
+        if len(text) <= max_tokens * 4:
+            return text
+        half = max(max_tokens - 1, 0) * 4 // 2
+        return text[:half] + "..." + (text[-half:] if half else "")
+
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    half = max(max_tokens - 1, 0) // 2
+    return encoding.decode(tokens[:half]) + "..." + (encoding.decode(tokens[-half:]) if half else "")
@@ -0,0 +1,116 @@
+"""
+Every LLM call in a session gets a record in `interpreter._usage`, like
+
+    {"id": ..., "model": "gpt-4", "time": <unix time>,
+     "context_tokens": 5210,     # the whole conversation, before it was trimmed to fit the context window
+     "prompt_tokens": 3994,      # what was actually sent
+     "completion_tokens": 180,
+     "cost": 0.1306}             # in USD (None if LiteLLM doesn't know the model's prices)
+
+Records aren't added to the messages (their format is public). Saved conversations keep theirs next to them,
+in `<name>.usage.jsonl`, a record per line (see `save_usage`).
+Token counts are estimated with tiktoken, since streamed responses don't report usage.
+"""
+
+import json
+import os
+import time
+import uuid
+from .count_tokens import count_message_tokens, count_openai_message_tokens
+
+
+def start_call(interpreter, messages_for_llm):
+    """
+    Adds a record for the LLM call that's about to get `messages_for_llm`.
+    """
+    context_tokens = count_message_tokens(messages_for_llm, interpreter.model)
+    interpreter._usage.append({
+        "id": uuid.uuid4().hex[:12],
+        "model": interpreter.model,
+        "time": time.time(),
+        "context_tokens": context_tokens,
+        # (Until the LLM reports what it trimmed the messages to, assume it sent everything)
+        "prompt_tokens": context_tokens,
+        "completion_tokens": 0,
+        "cost": None,
+    })
+
+
+def record_prompt(interpreter, messages):
+    """
+    Called by the LLMs with the (trimmed, OpenAI-style) messages they're actually sending.
+    """
+    if interpreter._usage:
+        interpreter._usage[-1]["prompt_tokens"] = count_openai_message_tokens(messages, interpreter.model)
+
+
+def finish_call(interpreter):
+    """
+    Counts the LLM's response (the last message), and prices the call.
+    """
+    call = interpreter._usage[-1]
+    response = {key: value for key, value in interpreter.messages[-1].items() if key in ("role", "message", "language", "code")}
+    call["completion_tokens"] = count_message_tokens([response], call["model"])
+    call["cost"] = get_cost(call["model"], call["prompt_tokens"], call["completion_tokens"])
+
+
+def get_cost(model, prompt_tokens, completion_tokens):
+    import litellm
+
+    # (Pricing is just bookkeeping. It should never stop a chat)
+    try:
+        if model not in litellm.model_cost:
+            return None
+        prompt_cost, completion_cost = litellm.cost_per_token(model=model, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+    except Exception:
+        return None
+    return prompt_cost + completion_cost
+
+
+def get_usage(interpreter):
+    """
+    The session's LLM calls, and their totals.
+    """
+    calls = list(interpreter._usage)
+    return {
+        "llm_calls": len(calls),
+        "context_tokens": sum(call["context_tokens"] for call in calls),
+        "prompt_tokens": sum(call["prompt_tokens"] for call in calls),
+        "completion_tokens": sum(call["completion_tokens"] for call in calls),
+        "cost": sum(call["cost"] or 0 for call in calls),
+        "calls": calls,
+    }
+
+
+def save_usage(interpreter, json_path):
+    """
+    Appends the session's calls that aren't saved yet to the conversation's usage file.
+    """
+    calls = interpreter._usage[interpreter._usage_saved:]
+    if not calls:
+        return
+    with open(get_usage_path(json_path), "a", encoding="utf-8") as file:
+        file.write("".join(json.dumps(call) + "\n" for call in calls))
+    interpreter._usage_saved = len(interpreter._usage)
+
+
+def load_usage(json_path):
+    """
+    Returns the calls saved for a conversation (by every session that worked on it).
+    """
+    path = get_usage_path(json_path)
+    if not os.path.exists(path):
+        return []
+    calls = []
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            try:
+                calls.append(json.loads(line))
+            except ValueError:
+                # (A write we crashed in the middle of)
+                break
+    return calls
+
+
+def get_usage_path(json_path):
+    return os.path.splitext(json_path)[0] + ".usage.jsonl"
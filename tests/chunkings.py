@@ -0,0 +1,22 @@
+import random
+
+
+def chunkings(text, max_size=8, tries=50, seed=0):
+    """
+    Ways `text` might stream in: split in two at every offset, one character at a time,
+    and `tries` runs of random chunks of up to `max_size` characters.
+    """
+    for i in range(len(text) + 1):
+        yield [text[:i], text[i:]]
+
+    yield list(text)
+
+    rng = random.Random(seed)
+    for _ in range(tries):
+        chunks = []
+        i = 0
+        while i < len(text):
+            size = rng.randint(1, max_size)
+            chunks.append(text[i:i + size])
+            i += size
+        yield chunks
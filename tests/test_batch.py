@@ -0,0 +1,41 @@
+import threading
+import time
+import pytest
+from interpreter.batch.batch import measure_llm
+
+
+def make_result():
+    return {"timings": {"llm": 0, "llm_wait": 0}}
+
+
+def llm(messages):
+    for word in ["Hello", " there"]:
+        time.sleep(0.01)
+        yield {"message": word}
+
+
+def test_turn_is_over_before_chunks_are_used():
+    llm_calls = threading.Semaphore(1)
+    result = make_result()
+    for chunk in measure_llm(llm, llm_calls, result)([]):
+        # Another call could go now
+        assert llm_calls.acquire(blocking=False)
+        llm_calls.release()
+        time.sleep(0.1)
+
+    # (The time we spent with the chunks isn't the LLM's)
+    assert 0.02 <= result["timings"]["llm"] < 0.1
+
+
+def test_error_after_chunks():
+    def failing_llm(messages):
+        yield {"message": "Hel"}
+        raise ValueError("disconnected")
+
+    llm_calls = threading.Semaphore(1)
+    chunks = []
+    with pytest.raises(ValueError):
+        for chunk in measure_llm(failing_llm, llm_calls, make_result())([]):
+            chunks.append(chunk)
+    assert chunks == [{"message": "Hel"}]
+    assert llm_calls.acquire(blocking=False)
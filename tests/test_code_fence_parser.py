@@ -0,0 +1,95 @@
+from chunkings import chunkings
+from interpreter.utils.code_fence_parser import CodeFenceParser, merge_events
+from interpreter.llm.convert_to_coding_llm import convert_to_coding_llm, create_chunk_processor
+
+TEXTS = [
+    "Let's do it.\n\n```python\nprint('hi')\n```\n\nDone.",
+    "```\nno language\n```",
+    "~~~shell\necho ```not a fence```\n~~~\n",
+    "````markdown\n```python\ninner\n```\n````\nAfter.",
+    "Text with `inline` code and `` ` `` too.\n```js\nconsole.log(1)\n\n\nconsole.log(2)\n```",
+    "```python\nunclosed = True\n",
+    "  ```python\nindented\n  ```\n",
+    "```python\nends on the fence\n```",
+]
+
+
+def parse(chunks):
+    parser = CodeFenceParser()
+    events = []
+    for chunk in chunks:
+        events += parser.feed(chunk)
+    return merge_events(events + parser.flush())
+
+
+def test_code_block():
+    assert parse([TEXTS[0]]) == [
+        ("message", "Let's do it.\n\n"),
+        ("language", "python"),
+        ("code", "print('hi')"),
+        ("end_code", None),
+        ("message", "\nDone."),
+    ]
+
+
+def test_longer_fence_contains_shorter_one():
+    assert parse([TEXTS[3]]) == [
+        ("language", "markdown"),
+        ("code", "```python\ninner\n```"),
+        ("end_code", None),
+        ("message", "After."),
+    ]
+
+
+def test_chunking_doesnt_matter():
+    for text in TEXTS:
+        expected = parse([text])
+        for chunks in chunkings(text, max_size=6):
+            assert parse(chunks) == expected
+
+
+SECOND_BLOCK = "First:\n```python\nprint(1)\n```\nThen:\n```shell\necho 2\n```\nDone."
+
+
+def text_chunk(text):
+    return {"choices": [{"delta": {"content": text}}]}
+
+
+def coding_llm_deltas(chunks):
+    process_chunk = create_chunk_processor()
+    deltas = []
+    for chunk in chunks:
+        new_deltas, finished = process_chunk(text_chunk(chunk))
+        deltas += new_deltas
+        if finished:
+            return deltas, True
+    return deltas + process_chunk(None)[0], False
+
+
+def joined(deltas):
+    message = {}
+    for delta in deltas:
+        for key, value in delta.items():
+            message[key] = message.get(key, "") + value
+    return message
+
+
+def test_second_code_block_ends_the_response():
+    # An OI message holds one block of code, so the response stops where the next block opens
+    for chunks in chunkings(SECOND_BLOCK):
+        deltas, finished = coding_llm_deltas(chunks)
+        assert finished
+        assert joined(deltas) == {"message": "First:\nThen:\n", "language": "python", "code": "print(1)"}
+
+
+def test_second_code_block_stops_reading_the_stream():
+    streamed = []
+
+    def text_llm(messages):
+        for character in SECOND_BLOCK:
+            streamed.append(character)
+            yield text_chunk(character)
+
+    deltas = list(convert_to_coding_llm(text_llm)([{"role": "user", "message": "Go"}]))
+    assert joined(deltas)["code"] == "print(1)"
+    assert "".join(streamed).endswith("```shell\n")
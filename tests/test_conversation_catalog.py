@@ -0,0 +1,112 @@
+import json
+import os
+from interpreter.utils.conversation_catalog import ConversationCatalog
+from interpreter.utils.conversation_log import ConversationLog
+from interpreter.utils.usage_ledger import get_usage_path
+from interpreter.terminal_interface.conversation_navigator import describe_conversation
+
+
+def conversation(topic, code="print(1)", output="1"):
+    return [
+        {"role": "user", "message": f"Help me with {topic}"},
+        {"role": "assistant", "message": "Sure.", "language": "python", "code": code, "output": output},
+    ]
+
+
+def save(directory, filename, messages):
+    log = ConversationLog(str(directory), filename, fsync="never")
+    log.save(messages)
+    log.close()
+
+
+def test_update_list_and_search(tmp_path):
+    catalog = ConversationCatalog(str(tmp_path))
+    catalog.update("first.json", conversation("pandas dataframes"), updated=1)
+    catalog.update("second.json", conversation("matplotlib plots") + conversation("more plots"), updated=2)
+
+    assert [row["filename"] for row in catalog.list()] == ["second.json", "first.json"]
+    assert [row["filename"] for row in catalog.list(sort="messages")] == ["second.json", "first.json"]
+    assert catalog.list()[1]["title"] == "Help me with pandas dataframes"
+    assert [row["filename"] for row in catalog.search("pandas")] == ["first.json"]
+    assert catalog.search("nothing like this") == []
+    # (Punctuation isn't read as query syntax)
+    assert catalog.search('"pandas" OR (') == []
+    catalog.close()
+
+
+def test_usage_comes_from_the_usage_file(tmp_path):
+    with open(get_usage_path(str(tmp_path / "chat.json")), "w", encoding="utf-8") as file:
+        for model in ["gpt-4", "gpt-3.5-turbo", "gpt-4"]:
+            file.write(json.dumps({"model": model, "prompt_tokens": 100, "completion_tokens": 10, "cost": 0.5}) + "\n")
+
+    catalog = ConversationCatalog(str(tmp_path))
+    catalog.update("chat.json", conversation("tokens"))
+    row = catalog.list()[0]
+    assert row["models"] == "gpt-4, gpt-3.5-turbo"
+    assert (row["prompt_tokens"], row["completion_tokens"], row["cost"]) == (300, 30, 1.5)
+
+    # `--conversations` shows what it cost
+    assert describe_conversation(row).endswith("2 messages, 330 tokens, $1.50)")
+    catalog.update("no_usage.json", conversation("nothing"))
+    assert describe_conversation(catalog.search("nothing")[0]).endswith("2 messages)")
+    catalog.close()
+
+
+def test_sync(tmp_path):
+    save(tmp_path, "old.json", conversation("old things"))
+    save(tmp_path, "gone.json", conversation("deleted things"))
+    with open(get_usage_path(str(tmp_path / "old.json")), "w", encoding="utf-8") as file:
+        file.write(json.dumps({"model": "gpt-4", "prompt_tokens": 1, "completion_tokens": 1, "cost": None}) + "\n")
+
+    catalog = ConversationCatalog(str(tmp_path))
+    catalog.sync()
+    assert sorted(row["filename"] for row in catalog.list()) == ["gone.json", "old.json"]
+
+    # Changed and deleted without the catalog
+    save(tmp_path, "old.json", conversation("old things") + conversation("new things"))
+    os.remove(tmp_path / "gone.json")
+    catalog.sync()
+    assert [(row["filename"], row["messages"]) for row in catalog.list()] == [("old.json", 4)]
+    assert catalog.search_cells("deleted") == []
+    catalog.close()
+
+
+def test_search_cells(tmp_path):
+    catalog = ConversationCatalog(str(tmp_path))
+    catalog.update("working.json", conversation("csv files", code="import pandas\npandas.read_csv('data.csv')", output="   a  b"))
+    catalog.update("failing.json", conversation("csv files", code="import pandas\npandas.read_csv('missing.csv')",
+                                                output="Traceback (most recent call last):\nFileNotFoundError: missing.csv"))
+
+    found = catalog.search_cells("read_csv", kind="code")
+    assert sorted(cell["filename"] for cell in found) == ["failing.json", "working.json"]
+    assert [cell["filename"] for cell in catalog.search_cells("read_csv", kind="code", working_only=True)] == ["working.json"]
+    assert [cell["filename"] for cell in catalog.search_cells("read_csv", kind="code", exclude="working.json")] == ["failing.json"]
+
+    cell = catalog.search_cells("FileNotFoundError", kind="output")[0]
+    assert (cell["filename"], cell["position"], cell["kind"], cell["language"]) == ("failing.json", 1, "output", "python")
+
+    # Every word has to match, unless any_word
+    assert catalog.search_cells("read_csv unicorns") == []
+    assert catalog.search_cells("read_csv unicorns", any_word=True)
+    catalog.close()
+
+
+def test_update_reindexes_changed_cells(tmp_path):
+    catalog = ConversationCatalog(str(tmp_path))
+    messages = conversation("first try", code="print('apples')")
+    catalog.update("chat.json", messages)
+
+    # Like %undo, then different code
+    messages = messages[:1] + [{"role": "assistant", "message": "", "language": "python", "code": "print('oranges')", "output": ""}]
+    catalog.update("chat.json", messages, changed_from=1)
+    assert catalog.search_cells("apples") == []
+    assert [cell["position"] for cell in catalog.search_cells("oranges")] == [1]
+    assert [cell["position"] for cell in catalog.search_cells("first try")] == [0]
+    catalog.close()
+
+
+def test_changed_from_is_ignored_for_new_conversations(tmp_path):
+    catalog = ConversationCatalog(str(tmp_path))
+    catalog.update("chat.json", conversation("bananas"), changed_from=1)
+    assert [cell["position"] for cell in catalog.search_cells("bananas")] == [0]
+    catalog.close()
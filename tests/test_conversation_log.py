@@ -0,0 +1,123 @@
+import json
+import os
+import pytest
+from interpreter.utils.conversation_log import ConversationLog, load_conversation, get_log_path
+
+FILENAME = "conversation.json"
+
+
+def message(number):
+    return {"role": "user" if number % 2 == 0 else "assistant", "message": f"message {number}"}
+
+
+def test_saves_append_to_the_log(tmp_path):
+    log = ConversationLog(str(tmp_path), FILENAME)
+    messages = [message(0)]
+    log.save(messages)
+    for number in range(1, 10):
+        messages.append(message(number))
+        assert log.save(messages) == number
+    log.close()
+
+    json_path = str(tmp_path / FILENAME)
+    assert os.path.exists(get_log_path(json_path))
+    assert load_conversation(json_path) == messages
+
+
+def test_unchanged_messages_write_nothing(tmp_path):
+    log = ConversationLog(str(tmp_path), FILENAME)
+    messages = [message(0), message(1)]
+    log.save(messages)
+    log.save(messages)
+    assert not os.path.exists(get_log_path(str(tmp_path / FILENAME)))
+
+
+def test_truncate(tmp_path):
+    # Like %undo, then a new message
+    log = ConversationLog(str(tmp_path), FILENAME)
+    messages = [message(number) for number in range(3)]
+    log.save(messages[:1])
+    log.save(messages)
+    messages = messages[:1] + [{"role": "user", "message": "instead"}]
+    assert log.save(messages) == 1
+    log.close()
+    assert load_conversation(str(tmp_path / FILENAME)) == messages
+
+
+def test_message_edited_in_place(tmp_path):
+    # Like output streaming into the last message, between saves
+    log = ConversationLog(str(tmp_path), FILENAME)
+    messages = [message(0), {"role": "assistant", "message": "", "language": "python", "code": "print(1)"}]
+    log.save(messages)
+    log.save(messages + [message(2)])
+    messages[1]["output"] = "1"
+    messages[1]["code"] += "\nprint(2)"
+    assert log.save(messages) == 1
+    log.close()
+    assert load_conversation(str(tmp_path / FILENAME)) == messages
+
+    # And after compacting, the JSON file agrees with the log
+    ConversationLog(str(tmp_path), FILENAME).close()
+    assert load_conversation(str(tmp_path / FILENAME)) == messages
+
+
+def test_torn_last_line(tmp_path):
+    log = ConversationLog(str(tmp_path), FILENAME)
+    messages = [message(number) for number in range(3)]
+    log.save(messages[:1])
+    log.save(messages)
+    log.close()
+
+    json_path = str(tmp_path / FILENAME)
+    with open(get_log_path(json_path), "a", encoding="utf-8") as file:
+        file.write('{"append": {"role": "user", "mess')
+    assert load_conversation(json_path) == messages
+
+    # Opening it again folds the log into the JSON file, so the next save doesn't append after the torn line
+    log = ConversationLog(str(tmp_path), FILENAME)
+    assert not os.path.exists(get_log_path(json_path))
+    messages.append(message(3))
+    log.save(messages)
+    log.close()
+    assert load_conversation(json_path) == messages
+
+
+def test_stale_log_after_compaction(tmp_path):
+    # We crashed after compacting, but before removing the log. Its messages are already in the JSON file
+    log = ConversationLog(str(tmp_path), FILENAME)
+    messages = [message(number) for number in range(3)]
+    log.save(messages[:1])
+    log.save(messages)
+    log.close()
+
+    json_path = str(tmp_path / FILENAME)
+    with open(get_log_path(json_path), encoding="utf-8") as file:
+        stale_log = file.read()
+
+    ConversationLog(str(tmp_path), FILENAME).close()
+    with open(json_path, encoding="utf-8") as file:
+        assert json.load(file) == messages
+
+    with open(get_log_path(json_path), "w", encoding="utf-8") as file:
+        file.write(stale_log)
+    assert load_conversation(json_path) == messages
+
+
+def test_compacts_once_the_log_is_bigger(tmp_path):
+    log = ConversationLog(str(tmp_path), FILENAME, fsync="never")
+    messages = [message(0)]
+    log.save(messages)
+    for number in range(1, 2000):
+        messages.append({"role": "assistant", "message": "x" * 100 + str(number)})
+        log.save(messages)
+    log.close()
+
+    json_path = str(tmp_path / FILENAME)
+    log_path = get_log_path(json_path)
+    assert not os.path.exists(log_path) or os.path.getsize(log_path) < os.path.getsize(json_path) * 2
+    assert load_conversation(json_path) == messages
+
+
+def test_unknown_fsync_policy(tmp_path):
+    with pytest.raises(ValueError):
+        ConversationLog(str(tmp_path), FILENAME, fsync="sometimes")
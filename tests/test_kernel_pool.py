@@ -0,0 +1,45 @@
+import time
+from interpreter.core.core import Interpreter
+from interpreter.code_interpreters.kernel_pool import KernelPool
+
+
+def wait_for(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+
+def test_reset_stops_a_pool_it_started():
+    interpreter = Interpreter()
+    interpreter.kernel_pool_size = 1
+    interpreter.kernel_pool_languages = ["shell"]
+    pool = interpreter._setup_kernel_pool()
+    pool.fill()
+    wait_for(lambda: pool.ready["shell"])
+    warm = pool.ready["shell"][0]
+
+    interpreter.reset()
+    assert interpreter._kernel_pool is None
+    assert warm.process.wait(timeout=5) is not None
+
+
+def test_reset_leaves_a_shared_pool():
+    pool = KernelPool(size=1, languages=["shell"])
+    interpreter = Interpreter()
+    interpreter._kernel_pool = pool
+    interpreter.reset()
+    assert interpreter._kernel_pool is pool
+    assert not pool.closed
+
+
+def test_terminated_while_starting():
+    pool = KernelPool(size=2, languages=["shell"])
+    pool.fill()
+    pool.terminate()
+    wait_for(lambda: pool.starting["shell"] == 0)
+    assert pool.ready["shell"] == []
+
+    # And nothing's started after that
+    pool.acquire("shell")
+    assert pool.starting["shell"] == 0
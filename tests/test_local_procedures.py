@@ -0,0 +1,73 @@
+import json
+import threading
+from interpreter.rag.bm25_index import BM25Index
+from interpreter.rag.local_procedures import LocalProcedures
+
+
+def user_message(text):
+    return [{"role": "user", "message": text}]
+
+
+def test_bundled_procedures_are_found_on_the_first_search(tmp_path):
+    procedures = LocalProcedures(directory=str(tmp_path))
+    results = procedures.search(user_message("How do I append a row to my dataframe?"), sync=False)
+    assert results and "pd.concat" in results[0]
+
+
+def test_unrelated_messages_get_nothing(tmp_path):
+    procedures = LocalProcedures(directory=str(tmp_path))
+    for text in ["hi", "What is the weather in Tokyo?", "Write a poem about the sea"]:
+        assert procedures.search(user_message(text), sync=False) == []
+
+
+def test_min_score():
+    index = BM25Index(["pandas dataframe concat rows", "zip a folder", "resize an image"])
+    assert index.search("concat my pandas dataframe rows") == ["pandas dataframe concat rows"]
+    # (Stopwords alone match nothing)
+    assert index.search("the a of") == []
+    assert index.search("a folder", min_score=100) == []
+
+
+def test_user_procedures_are_searched(tmp_path):
+    (tmp_path / "deploy.md").write_text("# Deploying to our staging server\n\nRun `make deploy-staging` from the repository root.")
+    procedures = LocalProcedures(directory=str(tmp_path))
+    results = procedures.search(user_message("deploy this to the staging server"), sync=False)
+    assert results[0].startswith("# Deploying")
+
+
+def test_remote_search_only_when_nothing_matched(tmp_path, monkeypatch):
+    procedures = LocalProcedures(directory=str(tmp_path), sync_interval=3600)
+    synced = []
+    done = threading.Event()
+
+    def sync(messages):
+        synced.append(messages)
+        procedures.syncing = False
+        done.set()
+    monkeypatch.setattr(procedures, "sync", sync)
+
+    procedures.search(user_message("Zip up my documents folder"))
+    assert synced == []
+
+    procedures.search(user_message("Book me a table for two tonight"))
+    assert done.wait(5)
+    procedures.search(user_message("Order a pizza"))
+    # (Once, then not again until sync_interval has passed)
+    assert synced == [user_message("Book me a table for two tonight")]
+
+
+def test_added_procedures_are_saved(tmp_path):
+    procedures = LocalProcedures(directory=str(tmp_path))
+    procedures.add(["# Booking restaurants\n\nUse the OpenTable reservation website to book a restaurant table."])
+
+    procedures = LocalProcedures(directory=str(tmp_path))
+    results = procedures.search(user_message("book a restaurant table on opentable"), sync=False)
+    assert results[0].startswith("# Booking restaurants")
+
+
+def test_duplicates_are_found_once(tmp_path):
+    procedure = "# Booking restaurants\n\nUse the OpenTable reservation website to book a restaurant table."
+    (tmp_path / "procedures.json").write_text(json.dumps({"procedures": [procedure, procedure]}))
+    (tmp_path / "booking.md").write_text(procedure)
+    procedures = LocalProcedures(directory=str(tmp_path))
+    assert procedures.search(user_message("book a restaurant table on opentable"), sync=False) == [procedure]
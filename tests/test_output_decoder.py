@@ -0,0 +1,117 @@
+from interpreter.code_interpreters.output_decoder import OutputDecoder
+from interpreter.code_interpreters.subprocess_code_interpreter import MARKER
+from interpreter.code_interpreters.languages.python import Python
+from interpreter.code_interpreters.async_code_interpreter import AsyncCodeInterpreter
+import asyncio
+import time
+
+
+def feed_all(decoder, chunks):
+    events = []
+    for chunk in chunks:
+        events += decoder.feed(chunk)
+    return events + decoder.close()
+
+
+def lines(events):
+    return [text for kind, text in events if kind == "line"]
+
+
+def test_utf8_split_across_reads():
+    data = "héllo wörld ✓\n".encode("utf-8")
+    # Every possible split, including ones in the middle of a character
+    for i in range(1, len(data)):
+        assert lines(feed_all(OutputDecoder(), [data[:i], data[i:]])) == ["héllo wörld ✓\n"]
+
+
+def test_invalid_utf8_is_replaced():
+    assert lines(feed_all(OutputDecoder(), [b"bad \xff byte\n"])) == ["bad � byte\n"]
+
+
+def test_carriage_return_redraws():
+    events = feed_all(OutputDecoder(), [b"10%\r", b"20%\r", b"done\n"])
+    assert events == [("partial", "10%"), ("partial", "20%"), ("line", "done\n")]
+
+
+def test_carriage_return_split_from_line_feed():
+    # A "\r\n" split across reads is still one line break
+    events = feed_all(OutputDecoder(), [b"one\r", b"\ntwo\n"])
+    assert lines(events) == ["one\n", "two\n"]
+
+
+def test_marker_in_the_middle_of_a_line():
+    decoder = OutputDecoder(marker=MARKER)
+    events = feed_all(decoder, [b"no newline", b"## active_line 2 ##\n", b" and more\n"])
+    assert lines(events) == ["## active_line 2 ##\n", "no newline and more\n"]
+
+
+def test_marker_split_across_reads():
+    data = b"abc## end_of_execution ##\n"
+    for i in range(1, len(data)):
+        assert lines(feed_all(OutputDecoder(marker=MARKER), [data[:i], data[i:]])) == ["## end_of_execution ##\n", "abc"]
+
+
+def test_marker_after_redraw_keeps_the_redraw():
+    decoder = OutputDecoder(marker=MARKER)
+    events = feed_all(decoder, [b"0\r## active_line 1 ##\n1\r## active_line 1 ##\n2\r## end_of_execution ##\n"])
+    assert events == [
+        ("partial", "0"),
+        ("line", "## active_line 1 ##\n"),
+        ("partial", "1"),
+        ("line", "## active_line 1 ##\n"),
+        ("partial", "2"),
+        ("line", "## end_of_execution ##\n"),
+        ("line", "2"),
+    ]
+
+
+def run_python(code, batch_interval):
+    code_interpreter = Python()
+    code_interpreter.batch_interval = batch_interval
+    try:
+        return list(code_interpreter.run(code))
+    finally:
+        code_interpreter.terminate()
+
+
+def test_progress_loop_output():
+    # Each frame shows up as a partial line, and the last one is kept as output
+    items = run_python('for i in range(3): print(i, end="\\r")', batch_interval=0)
+    partials = [item["partial_output"] for item in items if "partial_output" in item]
+    output = "".join(item["output"] for item in items if "output" in item)
+    assert [partial for partial in partials if partial] == ["0", "1", "2"]
+    assert output == "2"
+
+
+def test_progress_loop_output_batched():
+    items = run_python('for i in range(3): print(i, end="\\r")', batch_interval=0.5)
+    assert "".join(item.get("output", "") for item in items) == "2"
+    # (A batch is never just the partial line being cleared)
+    assert all(item.get("partial_output") != "" or "output" in item for item in items)
+
+
+def test_async_output_batched():
+    async def run(code):
+        code_interpreter = AsyncCodeInterpreter(Python())
+        code_interpreter.batch_interval = 0.5
+        try:
+            return [item async for item in code_interpreter.run(code)]
+        finally:
+            code_interpreter.terminate()
+            await code_interpreter.process.wait()
+
+    items = asyncio.run(run('for i in range(3): print(i, end="\\r")'))
+    assert "".join(item.get("output", "") for item in items) == "2"
+
+    # Lines that arrive together are one batch, and a batch ends as soon as the code does
+    start = time.monotonic()
+    items = asyncio.run(run('for i in range(200): print(i)'))
+    assert "".join(item.get("output", "") for item in items) == "".join(f"{i}\n" for i in range(200))
+    assert len([item for item in items if "output" in item]) < 10
+    assert time.monotonic() - start < 5
+
+
+def test_progress_on_stderr_after_prompt():
+    # Python's prompts come before the first frame on stderr, and mustn't hide it
+    items = run_python('import sys\nsys.stderr.write("50%\\r")\nsys.stderr.flush()\nimport time\ntime.sleep(0.3)', batch_interval=0)
+    assert "50%" in [item.get("partial_output") for item in items]
@@ -0,0 +1,55 @@
+import os
+import time
+from interpreter.utils.output_spool import OutputSpool, prune_spool
+
+
+def make_session(directory, name, size=10, days_old=0):
+    folder = os.path.join(directory, name)
+    os.makedirs(folder)
+    path = os.path.join(folder, "output_1.txt")
+    with open(path, "w") as f:
+        f.write("x" * size)
+    modified = time.time() - days_old * 24 * 60 * 60
+    os.utime(path, (modified, modified))
+    os.utime(folder, (modified, modified))
+    return folder
+
+
+def test_old_sessions_are_deleted(tmp_path):
+    old = make_session(tmp_path, "a" * 12, days_old=10)
+    new = make_session(tmp_path, "b" * 12, days_old=1)
+    prune_spool(str(tmp_path), max_age_days=7)
+    assert not os.path.exists(old)
+    assert os.path.exists(new)
+
+
+def test_oldest_sessions_are_deleted_to_fit(tmp_path):
+    oldest = make_session(tmp_path, "a" * 12, size=100, days_old=3)
+    older = make_session(tmp_path, "b" * 12, size=100, days_old=2)
+    newest = make_session(tmp_path, "c" * 12, size=100, days_old=1)
+    prune_spool(str(tmp_path), max_bytes=250)
+    assert not os.path.exists(oldest)
+    assert os.path.exists(older)
+    assert os.path.exists(newest)
+
+
+def test_only_session_folders_are_deleted(tmp_path):
+    other = make_session(tmp_path, "not-a-session", days_old=100)
+    (tmp_path / "notes.txt").write_text("keep me")
+    prune_spool(str(tmp_path), max_age_days=0, max_bytes=0)
+    assert os.path.exists(other)
+    assert (tmp_path / "notes.txt").exists()
+
+
+def test_spool_prunes_others_but_not_itself(tmp_path):
+    old = make_session(tmp_path, "a" * 12, days_old=10)
+    spool = OutputSpool(str(tmp_path), max_age_days=7, max_bytes=0)
+    with spool.open() as f:
+        f.write("x" * 100)
+    with spool.open() as f:
+        f.write("y")
+    assert not os.path.exists(old)
+    assert sorted(os.listdir(spool.directory)) == ["output_1.txt", "output_2.txt"]
+
+    spool.delete()
+    assert not os.path.exists(spool.directory)
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import time
+from interpreter.server.server import route
+from interpreter.server.session_manager import SessionManager
+
+
+class FakeCodeInterpreter:
+    def __init__(self):
+        self.terminated = False
+
+    def terminate(self):
+        self.terminated = True
+
+
+class FakeInterpreter:
+    """
+    Answers every message with one chunk, after `proceed` is set.
+    """
+    def __init__(self):
+        self.messages = []
+        self._async_code_interpreters = {}
+        self.proceed = asyncio.Event()
+        self.proceed.set()
+
+    async def achat(self, message):
+        self.messages.append({"role": "user", "message": message})
+        await self.proceed.wait()
+        self.messages.append({"role": "assistant", "message": "Hi!"})
+        yield {"message": "Hi!"}
+
+    def usage(self):
+        return {}
+
+    def reset(self):
+        for code_interpreter in self._async_code_interpreters.values():
+            code_interpreter.terminate()
+        self._async_code_interpreters = {}
+        self.messages = []
+
+
+class FakeWriter:
+    def __init__(self):
+        self.data = b""
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def status(self):
+        return int(self.data.split(b" ", 2)[1])
+
+    def json(self):
+        return json.loads(self.data.split(b"\r\n\r\n", 1)[1])
+
+
+async def request(sessions, method, path, body=None):
+    writer = FakeWriter()
+    await route(sessions, method, path, json.dumps(body).encode() if body else b"", writer)
+    return writer
+
+
+def with_processes(session, count):
+    for number in range(count):
+        session.interpreter._async_code_interpreters[f"language_{number}"] = FakeCodeInterpreter()
+    return session
+
+
+def test_create_chat_delete():
+    async def main():
+        sessions = SessionManager(FakeInterpreter)
+
+        response = await request(sessions, "POST", "/sessions")
+        assert response.status() == 201
+        session_id = response.json()["session_id"]
+
+        response = await request(sessions, "POST", f"/sessions/{session_id}/chat", {"message": "Hello"})
+        assert response.status() == 200
+        assert b'data: {"message": "Hi!"}' in response.data
+        assert b"event: end" in response.data
+
+        response = await request(sessions, "GET", f"/sessions/{session_id}")
+        assert [message["message"] for message in response.json()["messages"]] == ["Hello", "Hi!"]
+
+        assert (await request(sessions, "DELETE", f"/sessions/{session_id}")).status() == 200
+        assert (await request(sessions, "GET", f"/sessions/{session_id}")).status() == 404
+
+    asyncio.run(main())
+
+
+def test_delete_while_responding_is_refused():
+    async def main():
+        sessions = SessionManager(FakeInterpreter)
+        session = sessions.create()
+        code_interpreter = with_processes(session, 1).interpreter._async_code_interpreters["language_0"]
+        session.interpreter.proceed.clear()
+
+        chat = asyncio.create_task(request(sessions, "POST", f"/sessions/{session.id}/chat", {"message": "Hello"}))
+        await asyncio.sleep(0.05)
+
+        assert (await request(sessions, "DELETE", f"/sessions/{session.id}")).status() == 409
+        assert not code_interpreter.terminated
+        assert (await request(sessions, "POST", f"/sessions/{session.id}/chat", {"message": "Again"})).status() == 409
+
+        session.interpreter.proceed.set()
+        assert b"event: end" in (await chat).data
+        assert (await request(sessions, "DELETE", f"/sessions/{session.id}")).status() == 200
+        assert code_interpreter.terminated
+
+    asyncio.run(main())
+
+
+def test_process_limit_stops_least_recently_used_idle_sessions():
+    async def main():
+        sessions = SessionManager(FakeInterpreter, max_processes=2)
+        oldest = with_processes(sessions.create(), 1)
+        newer = with_processes(sessions.create(), 1)
+        oldest.last_active -= 10
+        session = sessions.create()
+
+        assert await sessions.make_room(session)
+        assert oldest.count_processes() == 0
+        assert newer.count_processes() == 1
+
+    asyncio.run(main())
+
+
+def test_process_limit_waits_for_busy_sessions():
+    async def main():
+        sessions = SessionManager(FakeInterpreter, max_processes=1, process_wait_timeout=0.1)
+        busy = with_processes(sessions.create(), 1)
+        session = sessions.create()
+
+        async with busy.lock:
+            # Nobody finishes in time
+            start = time.monotonic()
+            assert not await sessions.make_room(session)
+            assert time.monotonic() - start >= 0.1
+            assert busy.count_processes() == 1
+
+            # Room opens up once the busy session finishes
+            sessions.process_wait_timeout = 5
+            waiting = asyncio.create_task(sessions.make_room(session))
+            await asyncio.sleep(0.05)
+            assert not waiting.done()
+
+        await sessions.release()
+        assert await waiting
+        assert busy.count_processes() == 0
+
+    asyncio.run(main())
+
+
+def test_idle_sessions_are_evicted():
+    async def main():
+        sessions = SessionManager(FakeInterpreter, idle_timeout=60)
+        idle = with_processes(sessions.create(), 1)
+        code_interpreter = idle.interpreter._async_code_interpreters["language_0"]
+        busy = sessions.create()
+        active = sessions.create()
+        idle.last_active -= 120
+        busy.last_active -= 120
+
+        async with busy.lock:
+            sessions.evict_idle()
+
+        assert sessions.get(idle.id) is None
+        assert code_interpreter.terminated
+        assert sessions.get(busy.id) is busy
+        assert sessions.get(active.id) is active
+
+    asyncio.run(main())
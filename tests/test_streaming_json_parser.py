@@ -0,0 +1,59 @@
+import json
+from chunkings import chunkings
+from interpreter.utils.streaming_json_parser import StreamingJsonParser
+
+OBJECTS = [
+    {"language": "python", "code": "print('hello')\nprint(\"world\")"},
+    {"language": "shell", "code": "echo \\\\ back\\slash\ttab / slash"},
+    {"code": "emoji 🎉 and accents é ü 中文", "language": "python"},
+    {"count": 3, "nested": {"code": "not this one", "list": [1, "]", {"}": "{"}]}, "flag": True, "code": "this one"},
+    {"empty": "", "none": None, "code": "x = 1"},
+]
+
+
+def parse(chunks):
+    """
+    Feeds `chunks` to a parser, and returns the values it decoded and which of them it saw complete.
+    """
+    parser = StreamingJsonParser()
+    values = {}
+    complete = set()
+    for chunk in chunks:
+        for key, fragment, closed in parser.feed(chunk):
+            assert key not in complete
+            values[key] = values.get(key, "") + fragment
+            if closed:
+                complete.add(key)
+    return values, complete
+
+
+def string_values(obj):
+    return {key: value for key, value in obj.items() if isinstance(value, str)}
+
+
+def test_whole_object():
+    for obj in OBJECTS:
+        for text in [json.dumps(obj), json.dumps(obj, ensure_ascii=False), json.dumps(obj, indent=2)]:
+            values, complete = parse([text])
+            assert values == string_values(obj)
+            assert complete == set(string_values(obj))
+
+
+def test_chunking_doesnt_matter():
+    # Including splits in the middle of escapes like "\\n" and "\\ud83c\\udf89"
+    for obj in OBJECTS:
+        text = json.dumps(obj)
+        expected = parse([text])
+        for chunks in chunkings(text):
+            assert parse(chunks) == expected
+
+
+def test_unfinished_value():
+    values, complete = parse(['{"language": "python", "code": "print(1)\\nprint('])
+    assert values == {"language": "python", "code": "print(1)\nprint("}
+    assert complete == {"language"}
+
+
+def test_lone_surrogate():
+    values, _ = parse(['{"code": "a\\ud83cb"}'])
+    assert values == {"code": "a�b"}
@@ -0,0 +1,93 @@
+import random
+import pytest
+from interpreter.utils.convert_to_openai_messages import convert_to_openai_messages
+from interpreter.utils.count_tokens import count_openai_message_tokens
+from interpreter.utils.trim_messages import trim_messages, fit, get_max_prompt_tokens
+
+SYSTEM_MESSAGE = "You are Open Interpreter."
+
+
+def make_conversation(length, seed=0):
+    rng = random.Random(seed)
+    messages = []
+    while len(messages) < length:
+        messages.append({"role": "user", "message": "Please do step " + "x" * rng.randint(10, 400)})
+        for _ in range(rng.randint(0, 2)):
+            messages.append({
+                "role": "assistant",
+                "message": "Running it." if rng.random() < 0.5 else "",
+                "language": "python",
+                "code": "print(1)\n" * rng.randint(1, 30),
+                "output": "line of output\n" * rng.randint(0, 100),
+            })
+    return convert_to_openai_messages(messages[:length])
+
+
+def assert_pairs_kept(messages):
+    # Code's output is never kept without its code, and code that had output never without its output
+    for i, message in enumerate(messages):
+        if message["role"] == "function":
+            assert i > 0 and "function_call" in messages[i - 1], messages
+        if "function_call" in message:
+            assert i + 1 < len(messages) and messages[i + 1]["role"] == "function", messages
+
+
+def test_pair_across_recent_messages_is_kept_together():
+    messages = convert_to_openai_messages([
+        {"role": "user", "message": "Make a plot. " + "x" * 2000},
+        {"role": "assistant", "message": "", "language": "python", "code": "import pandas\n" * 50, "output": "y" * 2000},
+        {"role": "assistant", "message": "Done."},
+        {"role": "user", "message": "Thanks"},
+        {"role": "assistant", "message": "You're welcome."},
+    ])
+    # (The code is 5 messages from the end, and its output 4)
+    assert messages[-4]["role"] == "function"
+    for budget in range(0, 1500, 10):
+        kept, _ = fit(messages, budget)
+        assert_pairs_kept(kept)
+
+
+def test_goal_is_not_followed_by_orphaned_output():
+    messages = convert_to_openai_messages([
+        {"role": "user", "message": "The goal. " + "x" * 2000},
+        {"role": "assistant", "message": "", "language": "python", "code": "print(1)\n" * 100, "output": "z" * 3000},
+        {"role": "assistant", "message": "", "language": "python", "code": "print(2)\n" * 100, "output": "z" * 3000},
+        {"role": "user", "message": "And then?"},
+        {"role": "assistant", "message": "That's it."},
+    ])
+    for max_tokens in range(50, 3000, 25):
+        trimmed = trim_messages(messages, SYSTEM_MESSAGE, max_tokens)
+        assert_pairs_kept(trimmed[1:])
+        if len(trimmed) > 2 and trimmed[1]["role"] == "user":
+            assert trimmed[2]["role"] != "function"
+
+
+def test_pairs_are_never_orphaned():
+    for seed in range(20):
+        messages = make_conversation(40, seed)
+        for max_tokens in range(100, 8000, 250):
+            assert_pairs_kept(trim_messages(messages, SYSTEM_MESSAGE, max_tokens)[1:])
+
+
+def test_budget_is_never_exceeded():
+    for seed in range(20):
+        messages = make_conversation(60, seed)
+        for max_tokens in range(50, 10000, 150):
+            trimmed = trim_messages(messages, SYSTEM_MESSAGE, max_tokens)
+            assert count_openai_message_tokens(trimmed) <= max_tokens
+            assert trimmed[0] == {"role": "system", "content": SYSTEM_MESSAGE}
+
+
+def test_long_system_message_is_shortened_to_fit():
+    trimmed = trim_messages(make_conversation(10), "You are Open Interpreter. " * 500, 200)
+    assert count_openai_message_tokens(trimmed) <= 200
+
+
+def test_everything_is_kept_when_it_fits():
+    messages = make_conversation(30)
+    assert trim_messages(messages, SYSTEM_MESSAGE, 10 ** 6)[1:] == messages
+
+
+def test_unknown_model():
+    with pytest.raises(ValueError):
+        get_max_prompt_tokens("not-a-real-model")